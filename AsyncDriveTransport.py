@@ -0,0 +1,398 @@
+import asyncio
+import json
+import os
+import random
+import time
+import uuid
+import httplib2
+from googleapiclient.errors import HttpError
+
+import ConfigurationManager
+from Logger import Logger
+from Metrics import Metrics
+from RequestScheduler import RequestScheduler
+
+try:
+    import aiohttp
+except ImportError:  # Only needed when the asyncio engine is selected
+    aiohttp = None
+
+class AsyncDriveTransport:
+    """
+    Talks to the Drive v3 REST API over one pooled keep-alive aiohttp session, so thousands of requests can
+    be in flight from a single thread. Requests follow the same rules as RequestScheduler: a token bucket on
+    queries per second, an adaptive limit on requests in flight, and jittered exponential backoff for
+    retryable failures. Errors are raised as googleapiclient HttpError, like the threaded engine.
+
+    Usage:
+    transport = AsyncDriveTransport(credentials)
+    items = await transport.list_files("trashed = false", "nextPageToken, files(id, name)")
+    await transport.close()
+    """
+
+    logger = Logger()
+    metrics = Metrics()
+
+    DOWNLOAD_BLOCK_SIZE = 1024 * 1024
+
+    def __init__(self, credentials, base_url=None, max_concurrency=None, queries_per_second=None, max_retries=None,
+                 chunk_size=None):
+        """
+        Initialize AsyncDriveTransport.
+
+        Parameters:
+        - credentials: google.auth credentials; the token is refreshed when it expires.
+        - base_url: Root URL of the API, e.g. a local stand-in server when testing.
+        - max_concurrency: Highest number of requests in flight at once.
+        - queries_per_second: Sustained rate of requests.
+        - max_retries: Number of retries of a retryable failure before it is raised.
+        - chunk_size: Size of each resumable upload request; smaller files are uploaded in a single request.
+        """
+        if aiohttp is None:
+            raise RuntimeError("The asyncio engine needs aiohttp, install it with 'pip install aiohttp'")
+
+        self.credentials = credentials
+        self.base_url = (base_url or ConfigurationManager.API_BASE_URL).rstrip('/')
+        self.max_concurrency = max_concurrency or ConfigurationManager.ASYNC_CONCURRENCY
+        self.queries_per_second = queries_per_second or ConfigurationManager.QUERIES_PER_SECOND
+        self.max_retries = ConfigurationManager.MAX_RETRIES if max_retries is None else max_retries
+        self.chunk_size = chunk_size or ConfigurationManager.CHUNK_SIZE_MB * 1024 * 1024
+        self.session = None
+
+        # Created on first use, inside the event loop that runs the requests
+        self.refresh_lock = None
+        self.concurrency = None
+        self.concurrency_limit = self.max_concurrency
+        self.active_requests = 0
+        self.successes = 0
+        self.tokens = float(self.queries_per_second)
+        self.last_refill = time.monotonic()
+
+    async def get_session(self):
+        """
+        Get the shared aiohttp session, creating it and its connection pool on first use.
+        """
+        if self.session is None:
+            self.refresh_lock = asyncio.Lock()
+            self.concurrency = asyncio.Condition()
+            connector = aiohttp.TCPConnector(limit=self.max_concurrency, keepalive_timeout=60)
+            self.session = aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=None, sock_read=300))
+        return self.session
+
+    async def close(self):
+        """
+        Close the session and its pooled connections.
+        """
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    async def authorization(self, refresh=False):
+        """
+        Get the Authorization header, refreshing the access token first when it expired.
+
+        Parameters:
+        - refresh: Refresh the token even if it has not expired yet.
+        """
+        async with self.refresh_lock:
+            if refresh or getattr(self.credentials, 'expired', False) or not getattr(self.credentials, 'token', None):
+                from google.auth.transport.requests import Request
+                # Refreshing is a blocking HTTP call, so it runs off the event loop
+                await asyncio.get_running_loop().run_in_executor(None, self.credentials.refresh, Request())
+        return {'Authorization': f"Bearer {self.credentials.token}"}
+
+    async def acquire_slot(self):
+        """
+        Wait for a free request slot and a token from the bucket.
+        """
+        async with self.concurrency:
+            await self.concurrency.wait_for(lambda: self.active_requests < self.concurrency_limit)
+            self.active_requests += 1
+
+        while True:
+            now = time.monotonic()
+            self.tokens = min(float(self.queries_per_second), self.tokens + (now - self.last_refill) * self.queries_per_second)
+            self.last_refill = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.queries_per_second)
+
+    async def release_slot(self, succeeded, throttled=False):
+        """
+        Release a request slot, adapting the limit on requests in flight like RequestScheduler.
+        """
+        async with self.concurrency:
+            self.active_requests -= 1
+            if throttled:
+                self.successes = 0
+                self.concurrency_limit = max(1, self.concurrency_limit // 2)
+                self.metrics.set_gauge("concurrency_limit", self.concurrency_limit, lowest=True)
+            elif succeeded and self.concurrency_limit < self.max_concurrency:
+                self.successes += 1
+                if self.successes >= RequestScheduler.SUCCESSES_PER_CONCURRENCY_STEP:
+                    self.successes = 0
+                    self.concurrency_limit += 1
+            self.concurrency.notify_all()
+
+    async def request(self, method, url, params=None, json_body=None, data=None, headers=None, ok_statuses=(), retry=True,
+                      endpoint="Drive API call"):
+        """
+        Send one request, retrying retryable failures with jittered exponential backoff.
+
+        Parameters:
+        - method: HTTP method.
+        - url: Full URL, or a path below the base URL.
+        - params: Query parameters.
+        - json_body: JSON request body.
+        - data: Raw request body, or a function returning it, called once a request slot is taken so bodies
+          are only held in memory for the requests in flight.
+        - headers: Extra request headers.
+        - ok_statuses: Non-2xx statuses returned to the caller instead of raised, e.g. 308 for uploads.
+        - retry: Whether to retry; resumable chunks are retried by the caller after asking for the offset.
+        - endpoint: API method recorded in the metrics, e.g. "drive.files.list".
+
+        Returns:
+        A tuple (status, response headers, response body bytes).
+        """
+        session = await self.get_session()
+        if not url.startswith("http"):
+            url = self.base_url + url
+        params = {key: (str(value).lower() if isinstance(value, bool) else str(value))
+                  for key, value in (params or {}).items() if value is not None}
+
+        attempt = 0
+        while True:
+            request_headers = dict(headers or {}, **(await self.authorization()))
+            waiting = time.perf_counter()
+            await self.acquire_slot()
+            start = time.perf_counter()
+            self.metrics.observe("api_wait_seconds", start - waiting)
+            try:
+                # 308 means "resume incomplete" to the upload protocol, not a redirect
+                async with session.request(method, url, params=params, json=json_body, data=data() if callable(data) else data,
+                                           headers=request_headers, allow_redirects=False) as response:
+                    body = await response.read()
+                    status, response_headers = response.status, response.headers
+                if status >= 300 and status not in ok_statuses:
+                    raise HttpError(httplib2.Response({'status': str(status)}), body, uri=url)
+            except (HttpError, aiohttp.ClientError, asyncio.TimeoutError) as e:
+                self.metrics.record_call(endpoint, time.perf_counter() - start, RequestScheduler.outcome(e))
+                throttled = RequestScheduler.is_throttled(e)
+                if throttled:
+                    self.metrics.increment("api_throttled_total", endpoint=endpoint)
+                await self.release_slot(succeeded=False, throttled=throttled)
+                retryable = RequestScheduler.is_retryable(e) or not isinstance(e, HttpError)
+                if isinstance(e, HttpError) and e.resp.status == 401 and attempt == 0:
+                    # The token expired earlier than announced; refresh it and try once more
+                    await self.authorization(refresh=True)
+                    retryable = True
+                if not retry or not retryable or attempt >= self.max_retries:
+                    raise
+                self.metrics.increment("api_retries_total", endpoint=endpoint)
+                self.logger.info(f"Retrying {method} {url} after {type(e).__name__}: {e} (retry {attempt + 1} of {self.max_retries})")
+                await asyncio.sleep(random.uniform(0, min(64, 2 ** attempt)))
+                attempt += 1
+                continue
+
+            self.metrics.record_call(endpoint, time.perf_counter() - start, "ok")
+            await self.release_slot(succeeded=True)
+            return status, response_headers, body
+
+    async def request_json(self, method, path, **kwargs):
+        """
+        Send a request and decode its JSON response.
+        """
+        status, headers, body = await self.request(method, path, **kwargs)
+        return json.loads(body) if body else {}
+
+    async def list_files(self, query, fields, page_size=1000):
+        """
+        List every file matching a Drive query, following nextPageToken.
+
+        Returns:
+        The list of file resources.
+        """
+        files, page_token = [], None
+        while True:
+            results = await self.request_json('GET', '/drive/v3/files', params={
+                'q': query, 'spaces': 'drive', 'pageSize': page_size, 'pageToken': page_token, 'fields': fields},
+                endpoint="drive.files.list")
+            files.extend(results.get('files', []))
+            page_token = results.get('nextPageToken')
+            if not page_token:
+                return files
+
+    async def call(self, method, arguments):
+        """
+        Run a metadata-only files() method with the same keyword arguments googleapiclient takes.
+
+        Parameters:
+        - method: One of "create", "update", "delete", "copy" or "get".
+        - arguments: Keyword arguments, e.g. {'fileId': ..., 'body': {...}, 'fields': 'id'}.
+
+        Returns:
+        The decoded response.
+        """
+        arguments = dict(arguments)
+        file_id, body = arguments.pop('fileId', None), arguments.pop('body', None)
+        routes = {
+            'create': ('POST', '/drive/v3/files'),
+            'update': ('PATCH', f'/drive/v3/files/{file_id}'),
+            'delete': ('DELETE', f'/drive/v3/files/{file_id}'),
+            'copy': ('POST', f'/drive/v3/files/{file_id}/copy'),
+            'get': ('GET', f'/drive/v3/files/{file_id}'),
+        }
+        http_method, path = routes[method]
+        return await self.request_json(http_method, path, params=arguments, json_body=body, endpoint=f"drive.files.{method}")
+
+    async def upload(self, local_path, metadata, fields, file_id=None, session_uri=None, on_session=None, on_progress=None):
+        """
+        Upload a file's contents, creating a new file or replacing the contents of file_id. Files up to
+        chunk_size go in one multipart request; larger ones use a resumable session.
+
+        Parameters:
+        - local_path: Path of the local file.
+        - metadata: File metadata, e.g. {'name': ..., 'parents': [...]}; ignored for updates.
+        - fields: Fields of the returned file resource.
+        - file_id: Drive id of the file whose contents are replaced, if any.
+        - session_uri: Resumable session URI of an interrupted upload of the same file.
+        - on_session: Called with the session URI once a new resumable session is started.
+        - on_progress: Called with the number of bytes Drive holds after every chunk.
+
+        Returns:
+        The file resource.
+        """
+        total_size = os.path.getsize(local_path)
+        path = f'/upload/drive/v3/files/{file_id}' if file_id else '/upload/drive/v3/files'
+        http_method = 'PATCH' if file_id else 'POST'
+        body = {} if file_id else metadata
+        endpoint = "drive.files.update" if file_id else "drive.files.create"
+
+        if session_uri is None and total_size <= self.chunk_size:
+            boundary = uuid.uuid4().hex
+
+            def data():
+                with open(local_path, 'rb') as local_file:
+                    contents = local_file.read()
+                return (f"--{boundary}\r\nContent-Type: application/json; charset=UTF-8\r\n\r\n{json.dumps(body)}\r\n"
+                        f"--{boundary}\r\nContent-Type: application/octet-stream\r\n\r\n").encode() + contents + f"\r\n--{boundary}--".encode()
+            return await self.request_json(http_method, path, params={'uploadType': 'multipart', 'fields': fields}, data=data,
+                                           headers={'Content-Type': f'multipart/related; boundary={boundary}'}, endpoint=endpoint)
+
+        offset = 0
+        if session_uri is None:
+            status, headers, _ = await self.request(http_method, path, params={'uploadType': 'resumable', 'fields': fields},
+                                                    json_body=body, headers={'X-Upload-Content-Length': str(total_size)},
+                                                    endpoint=endpoint)
+            session_uri = headers['Location']
+            if on_session:
+                on_session(session_uri)
+        else:
+            offset, result = await self.upload_offset(session_uri, total_size, endpoint)
+            if result is not None:
+                return result
+
+        attempt = 0
+        with open(local_path, 'rb') as local_file:
+            while True:
+                local_file.seek(offset)
+                chunk = local_file.read(self.chunk_size)
+                end = offset + len(chunk) - 1
+                content_range = f"bytes {offset}-{end}/{total_size}" if chunk else f"bytes */{total_size}"
+                try:
+                    status, headers, response_body = await self.request('PUT', session_uri, data=chunk, ok_statuses=(308,),
+                                                                        headers={'Content-Range': content_range}, retry=False,
+                                                                        endpoint=endpoint)
+                except (HttpError, aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    # Ask Drive how much it received, and continue from there
+                    if attempt >= self.max_retries or (isinstance(e, HttpError) and not RequestScheduler.is_retryable(e)):
+                        raise
+                    await asyncio.sleep(random.uniform(0, min(64, 2 ** attempt)))
+                    attempt += 1
+                    self.metrics.increment("api_retries_total", endpoint=endpoint)
+                    offset, result = await self.upload_offset(session_uri, total_size, endpoint)
+                    if result is not None:
+                        return result
+                    continue
+
+                if status != 308:
+                    return json.loads(response_body) if response_body else {}
+                offset = self.range_end(headers) + 1
+                if on_progress:
+                    on_progress(offset)
+
+    async def upload_offset(self, session_uri, total_size, endpoint="drive.files.create"):
+        """
+        Ask a resumable session how many bytes Drive already holds.
+
+        Returns:
+        A tuple (offset to continue from, file resource if the upload already completed or None).
+        """
+        status, headers, body = await self.request('PUT', session_uri, ok_statuses=(308,),
+                                                   headers={'Content-Range': f"bytes */{total_size}"}, endpoint=endpoint)
+        if status != 308:
+            return total_size, json.loads(body) if body else {}
+        return self.range_end(headers) + 1, None
+
+    @staticmethod
+    def range_end(headers):
+        """
+        Get the last byte Drive holds from the Range header of a 308 response, or -1 if it holds none.
+        """
+        received = headers.get('Range')
+        return int(received.rsplit('-', 1)[1]) if received else -1
+
+    async def download(self, file_id, output_file, offset=0, on_progress=None):
+        """
+        Download a file's contents into an open file, starting at an offset and resuming after dropped
+        connections from the bytes already written.
+
+        Parameters:
+        - file_id: Drive id of the file.
+        - output_file: Binary file object positioned at offset.
+        - offset: Byte offset to start from.
+        - on_progress: Called with the number of bytes of the file done after every block written.
+
+        Returns:
+        The number of bytes written.
+        """
+        session = await self.get_session()
+        url = f"{self.base_url}/drive/v3/files/{file_id}"
+        written, attempt = 0, 0
+        while True:
+            headers = dict(await self.authorization())
+            if offset + written:
+                headers['Range'] = f"bytes={offset + written}-"
+            waiting = time.perf_counter()
+            await self.acquire_slot()
+            start = time.perf_counter()
+            self.metrics.observe("api_wait_seconds", start - waiting)
+            try:
+                async with session.get(url, params={'alt': 'media'}, headers=headers) as response:
+                    if response.status == 416:
+                        # Nothing left past the offset
+                        self.metrics.record_call("drive.files.get_media", time.perf_counter() - start, "ok")
+                        await self.release_slot(succeeded=True)
+                        return written
+                    if response.status >= 300:
+                        raise HttpError(httplib2.Response({'status': str(response.status)}), await response.read(), uri=url)
+                    async for block in response.content.iter_chunked(self.DOWNLOAD_BLOCK_SIZE):
+                        output_file.write(block)
+                        written += len(block)
+                        if on_progress:
+                            on_progress(offset + written)
+            except (HttpError, aiohttp.ClientError, asyncio.TimeoutError) as e:
+                self.metrics.record_call("drive.files.get_media", time.perf_counter() - start, RequestScheduler.outcome(e))
+                await self.release_slot(succeeded=False, throttled=RequestScheduler.is_throttled(e))
+                retryable = RequestScheduler.is_retryable(e) or not isinstance(e, HttpError)
+                if not retryable or attempt >= self.max_retries:
+                    raise
+                self.metrics.increment("api_retries_total", endpoint="drive.files.get_media")
+                await asyncio.sleep(random.uniform(0, min(64, 2 ** attempt)))
+                attempt += 1
+                continue
+
+            self.metrics.record_call("drive.files.get_media", time.perf_counter() - start, "ok")
+            await self.release_slot(succeeded=True)
+            return written
@@ -0,0 +1,257 @@
+import asyncio
+import io
+import os
+import time
+import traceback
+
+from AsyncDriveTransport import AsyncDriveTransport
+from GoogleDriveHelper import GoogleDriveHelper
+from ProgressReporter import ProgressReporter
+from TransferState import TransferState
+import ConfigurationManager
+
+class AsyncGoogleDriveHelper(GoogleDriveHelper):
+    """
+    GoogleDriveHelper running listings, metadata calls and media transfers on AsyncDriveTransport instead
+    of googleapiclient, so every upload, download and metadata call of a run shares one pooled keep-alive
+    HTTP client and thousands of them can be in flight from one thread. The changes feed and single
+    metadata calls still go through the threaded googleapiclient service.
+
+    Selected with engine = asyncio in the [Transfers] section of settings.conf.
+
+    Usage:
+    gdrive = AsyncGoogleDriveHelper()
+    gdrive.initialize_service()
+    gdrive.download_many(gdrive_tree, changes)
+    gdrive.close()
+    """
+
+    def __init__(self, transport=None):
+        """
+        Initialize AsyncGoogleDriveHelper.
+
+        Parameters:
+        - transport: An AsyncDriveTransport to use, e.g. one pointed at a local stand-in server; by default
+          one is created on first use.
+        """
+        super().__init__()
+        self.loop = asyncio.new_event_loop()
+        self.async_transport = transport
+
+    @property
+    def transport(self):
+        """
+        The AsyncDriveTransport shared by every call, created on first use, so like the service it only
+        waits for initialize_service to finish loading the credentials once an API call is made.
+        """
+        if self.async_transport is None:
+            self.async_transport = AsyncDriveTransport(self.wait_for_service(), chunk_size=self.CHUNK_SIZE)
+        return self.async_transport
+
+    def run(self, coroutine):
+        """
+        Run a coroutine to completion on the helper's event loop, which keeps the transport's connections
+        alive between calls.
+        """
+        return self.loop.run_until_complete(coroutine)
+
+    def close(self):
+        """
+        Close the transport's connections and the event loop.
+        """
+        if self.async_transport is not None:
+            self.run(self.async_transport.close())
+        self.loop.close()
+        super().close()
+
+    async def run_in_tasks(self, function, tasks):
+        """
+        Await a coroutine function over a list of argument tuples on async_concurrency workers, like
+        run_in_pool. A task only starts, and so only opens its file, once a worker is free for it.
+
+        Parameters:
+        - function: The coroutine function to call for every task.
+        - tasks: List of argument tuples.
+
+        Returns:
+        The list of results, in the same order as tasks. If any task failed, the first error is raised once
+        every task has finished.
+        """
+        results = [None] * len(tasks)
+        pending = iter(enumerate(tasks))
+
+        async def worker():
+            for position, task in pending:
+                try:
+                    results[position] = await function(*task)
+                except Exception as e:
+                    results[position] = e
+
+        await asyncio.gather(*(worker() for _ in range(max(1, min(self.transport.max_concurrency, len(tasks))))))
+        errors = [result for result in results if isinstance(result, Exception)]
+        if errors:
+            raise errors[0]
+        return results
+
+    def list_files(self, query):
+        """
+        Yield every file matching a Drive query, following nextPageToken until the listing is exhausted.
+
+        Parameters:
+        - query: The Drive search query, e.g. "trashed = false".
+        """
+        try:
+            yield from self.run(self.transport.list_files(query, self.LIST_FIELDS, self.LIST_PAGE_SIZE))
+        except Exception as e:
+            # Log the error using the logger
+            self.logger.error(f"Error occurred in list_files: {e}")
+            # Optionally, log the full traceback for detailed error information
+            self.logger.error(traceback.format_exc())
+            # Raise the exception again to notify the caller about the error
+            raise e
+
+    def execute_batch(self, method, calls):
+        """
+        Execute independent files() calls concurrently. Instead of batch requests, every call is its own
+        request on the pooled connections, with retries handled by the transport.
+
+        Parameters:
+        - method: Name of the files() method to call, e.g. "update".
+        - calls: List of (key, keyword arguments) pairs; keys identify the item each call was made for.
+
+        Returns:
+        A dictionary mapping every key to a tuple (response, exception), one of which is None.
+        """
+        async def execute(arguments):
+            try:
+                return await self.transport.call(method, arguments), None
+            except Exception as e:
+                return None, e
+
+        results = self.run(self.run_in_tasks(execute, [(arguments,) for _, arguments in calls]))
+        return {key: result for (key, _), result in zip(calls, results)}
+
+    def upload_file(self, file_path, folder_id, file_id=None):
+        return self.run(self.upload_file_async(file_path, folder_id, file_id))
+
+    def upload_files(self, file_tasks):
+        if not file_tasks:
+            return []
+
+        with self.upload_progress(file_tasks):
+            return self.run(self.run_in_tasks(self.upload_file_async, file_tasks))
+
+    async def upload_file_async(self, file_path, folder_id, file_id=None):
+        """
+        Upload a file like GoogleDriveHelper.upload_file, continuing an interrupted resumable session.
+
+        Parameters:
+        - file_path: Path of the file relative to the local folder.
+        - folder_id: Drive id of the folder the file is created in.
+        - file_id: Drive id of the file whose contents are replaced, if any.
+
+        Returns:
+        The uploaded file resource.
+        """
+        try:
+            file_name = os.path.basename(file_path)
+            local_path = ConfigurationManager.LOCAL_FILESYSTEM_FOLDER_PATH + file_path
+            local_stat = os.stat(local_path)
+            # A changed local file must never continue a session that was started for other contents
+            transfer_key = (file_path, file_id or folder_id, local_stat.st_size, local_stat.st_mtime_ns)
+            started = time.perf_counter()
+            # A file transferred on its own reports on a status line of its own
+            progress = self.progress or ProgressReporter("Uploading", 1, local_stat.st_size)
+
+            session_uri = self.transfers.get_upload(transfer_key)
+            if session_uri:
+                self.logger.info("Resuming upload", path=file_path)
+
+            metadata = {'name': file_name, 'parents': [folder_id]}
+            on_session = lambda uri: self.transfers.set_upload(transfer_key, uri)
+            on_progress = lambda done_bytes: progress.update(file_path, done_bytes)
+            try:
+                response = await self.transport.upload(local_path, metadata, self.UPLOAD_FIELDS, file_id=file_id,
+                                                       session_uri=session_uri, on_session=on_session,
+                                                       on_progress=on_progress)
+            except Exception as e:
+                # The saved session expired; start a fresh one
+                if not session_uri or getattr(getattr(e, 'resp', None), 'status', None) not in (404, 410):
+                    raise
+                self.transfers.clear_upload(transfer_key)
+                response = await self.transport.upload(local_path, metadata, self.UPLOAD_FIELDS, file_id=file_id,
+                                                       on_session=on_session, on_progress=on_progress)
+
+            self.transfers.clear_upload(transfer_key)
+            self.metrics.record_transfer("upload", time.perf_counter() - started, local_stat.st_size)
+            progress.finish_file(file_path, local_stat.st_size)
+            if progress is not self.progress:
+                progress.close()
+            return response
+        except Exception as e:
+            # Log the error using the logger
+            self.logger.error(f"Error occurred in upload_file_async: {e}")
+            # Optionally, log the full traceback for detailed error information
+            self.logger.error(traceback.format_exc())
+            # Raise the exception again to notify the caller about the error
+            raise e
+
+    def download_file(self, output_path, drive_file_id, file_size=None, checksum=None):
+        return self.run(self.download_file_async(output_path, drive_file_id, file_size, checksum))
+
+    def download_files(self, file_tasks):
+        if not file_tasks:
+            return []
+
+        with self.download_progress(file_tasks):
+            return self.run(self.run_in_tasks(self.download_file_async, file_tasks))
+
+    async def download_file_async(self, output_path, drive_file_id, file_size=None, checksum=None):
+        """
+        Download a file like GoogleDriveHelper.download_file, through a partial file that later runs resume.
+
+        Parameters:
+        - output_path: Path of the file relative to the local folder.
+        - drive_file_id: Drive id of the file.
+        - file_size: Size of the remote file, if known.
+        - checksum: MD5 checksum of the remote file, if known.
+
+        Returns:
+        The number of bytes downloaded.
+        """
+        try:
+            local_path = ConfigurationManager.LOCAL_FILESYSTEM_FOLDER_PATH + output_path
+            os.makedirs(os.path.dirname(local_path), exist_ok=True)
+
+            partial_path = local_path + TransferState.PARTIAL_DOWNLOAD_SUFFIX
+            version = (drive_file_id, file_size, checksum)
+            resume_offset = 0
+            if os.path.exists(partial_path) and self.transfers.get_download(partial_path) == version:
+                resume_offset = os.path.getsize(partial_path)
+            elif self.records_transfer(file_size):
+                self.transfers.set_download(partial_path, version)
+
+            started, downloaded_bytes = time.perf_counter(), 0
+            progress = self.progress or ProgressReporter("Downloading", 1, int(file_size or 0))
+            with io.FileIO(partial_path, 'ab' if resume_offset else 'wb') as output_file:
+                if file_size is None or resume_offset < int(file_size) or int(file_size) == 0:
+                    if resume_offset:
+                        self.logger.info("Resuming download", path=output_path, offset=resume_offset)
+                    downloaded_bytes = await self.transport.download(
+                        drive_file_id, output_file, resume_offset,
+                        on_progress=lambda done_bytes: progress.update(output_path, done_bytes))
+
+            os.replace(partial_path, local_path)
+            self.transfers.clear_download(partial_path)
+            self.metrics.record_transfer("download", time.perf_counter() - started, downloaded_bytes)
+            progress.finish_file(output_path, resume_offset + downloaded_bytes)
+            if progress is not self.progress:
+                progress.close()
+            return downloaded_bytes
+        except Exception as e:
+            # Log the error using the logger
+            self.logger.error(f"Error occurred in download_file_async: {e}")
+            # Optionally, log the full traceback for detailed error information
+            self.logger.error(traceback.format_exc())
+            # Raise the exception again to notify the caller about the error
+            raise e
@@ -16,10 +16,38 @@ CLIENT_SECRET_PATH = config.get('GoogleDriveAPI', 'client_secret_path')
 OUTPUT_TOKEN_FILE = config.get('GoogleDriveAPI', 'output_token_file')
 ROOT_FOLDER_ID = config.get('GoogleDriveAPI', 'root_folder_id')
 ROOT_FOLDER_NAME = config.get('GoogleDriveAPI', 'root_folder_name')
+API_BASE_URL = config.get('GoogleDriveAPI', 'api_base_url', fallback='https://www.googleapis.com')
 
 # Local Filesystem Settings
 LOCAL_FILESYSTEM_FOLDER_PATH = config.get('LocalFilesystem', 'folder_path')
 BACKUP_FOLDER_PATH = config.get('LocalFilesystem', 'backup_folder_path')
+TRUST_DIRECTORY_MTIME = config.getboolean('LocalFilesystem', 'trust_directory_mtime', fallback=False)
+SCAN_WORKERS = config.getint('LocalFilesystem', 'scan_workers', fallback=8)
+HASH_WORKERS = config.getint('LocalFilesystem', 'hash_workers', fallback=0)
+
+# Filter Settings
+EXCLUDE_PATTERNS = [line.strip() for line in config.get('Filters', 'exclude', fallback='').splitlines() if line.strip()]
+INCLUDE_PATTERNS = [line.strip() for line in config.get('Filters', 'include', fallback='').splitlines() if line.strip()]
+IGNORE_FILE_NAME = config.get('Filters', 'ignore_file', fallback='.gspaceignore')
 
 # Logs Settings
 LOGS_FOLDER_PATH = config.get('Logs', 'logs_path')
+
+# Metrics Settings
+METRICS_REPORT_PATH = config.get('Metrics', 'report_path', fallback='')
+METRICS_TEXTFILE_PATH = config.get('Metrics', 'prometheus_textfile_path', fallback='')
+
+# State Settings
+STATE_FOLDER_PATH = config.get('State', 'state_folder_path', fallback='./.gspace')
+
+# Transfer Settings
+UPLOAD_WORKERS = config.getint('Transfers', 'upload_workers', fallback=8)
+DOWNLOAD_WORKERS = config.getint('Transfers', 'download_workers', fallback=8)
+CHUNK_SIZE_MB = config.getint('Transfers', 'chunk_size_mb', fallback=16)
+DEDUPLICATE_UPLOADS = config.getboolean('Transfers', 'deduplicate_uploads', fallback=True)
+QUERIES_PER_SECOND = config.getint('Transfers', 'queries_per_second', fallback=20)
+MAX_CONCURRENT_REQUESTS = config.getint('Transfers', 'max_concurrent_requests', fallback=16)
+MAX_RETRIES = config.getint('Transfers', 'max_retries', fallback=8)
+TRANSFER_ENGINE = config.get('Transfers', 'engine', fallback='threads')
+ASYNC_CONCURRENCY = config.getint('Transfers', 'async_concurrency', fallback=64)
+PROGRESS_INTERVAL = config.getfloat('Transfers', 'progress_interval', fallback=0.25)
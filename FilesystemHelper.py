@@ -1,9 +1,17 @@
+import bisect
 import os
 import shutil
+import threading
 import traceback
 import ConfigurationManager
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from LocalHasher import LocalHasher
+from LocalIndex import LocalIndex
 from Logger import Logger
+from Metrics import Metrics
+from PathFilter import PathFilter
+from TransferState import TransferState
 
 class FilesystemHelper:
     """
@@ -23,35 +31,81 @@ class FilesystemHelper:
         """
         self.FOLDER_PATH = ConfigurationManager.LOCAL_FILESYSTEM_FOLDER_PATH
         self.BACKUP_FOLDER_PATH = ConfigurationManager.BACKUP_FOLDER_PATH
+        self.TRUST_DIRECTORY_MTIME = ConfigurationManager.TRUST_DIRECTORY_MTIME
+        self.SCAN_WORKERS = ConfigurationManager.SCAN_WORKERS
+        self.HASH_WORKERS = ConfigurationManager.HASH_WORKERS
+        self.index = LocalIndex()
+        self.filter = PathFilter()
+        self.previous_index = {}
+        self.current_index = {}
+        # Entries at the last successful push, pull or sync, where local moves are detected from
+        self.synced_index = {}
 
+    @Metrics.timed("local_scan")
     def generate_tree_from_filesystem(self, tree):
         """
-        Generate a tree structure based on the current filesystem.
+        Generate a tree structure based on the current filesystem. Entries excluded by the [Filters] rules
+        are left out, and excluded directories are never opened.
 
         Parameters:
         - tree: An instance of the Tree class to store the filesystem structure.
         """
         try:
-            # Function to add files and subdirectories to the tree
             root_value = os.path.basename(self.FOLDER_PATH)
             tree.add([root_value])
 
-            def add_recursive(current_node, current_path):
-                for item in os.listdir(current_path):
-                    item_path = os.path.join(current_path, item)
-                    if os.path.isdir(item_path):
-                        # If it's a directory, add it as a child and recurse
-                        child_value = os.path.basename(item_path)
-                        tree.add(current_node + [child_value])
-                        add_recursive(current_node + [child_value], item_path)
-                    else:
-                        # If it's a file, add it directly
-                        # Get Given File Size
-                        fileSize = os.path.getsize(item_path)
-                        tree.add(current_node + [item], fileSize=fileSize)
+            # Directory records from the previous run, and the ones seen in this run
+            self.previous_index = self.index.load()
+            # Before the first sync that recorded a baseline, the previous scan is the best there is
+            self.synced_index = self.index.load_synced() or self.previous_index
+            scanned = {}
+
+            # Directories are scanned on a thread pool so filesystems with high latency (network, FUSE)
+            # overlap their I/O. Each task attaches the children of its own directory node only, and
+            # schedules its subdirectories itself, so no two threads ever write the same node.
+            lock = threading.Lock()
+            path_filter = self.filter
+            finished = threading.Event()
+            outstanding = 0
+            errors = []
+
+            with ThreadPoolExecutor(max_workers=self.SCAN_WORKERS) as executor:
+                def submit(node, relative_path):
+                    nonlocal outstanding
+                    with lock:
+                        outstanding += 1
+                    executor.submit(scan, node, relative_path)
+
+                def scan(current_node, relative_path):
+                    nonlocal outstanding
+                    try:
+                        if not errors:
+                            record = self.scan_directory(relative_path, self.previous_index.get(relative_path))
+                            if record is not None:
+                                scanned[relative_path] = record
+                                for name, is_dir, size, mtime_ns, inode in record[1]:
+                                    child_path = f"{relative_path}/{name}" if relative_path else name
+                                    if path_filter and path_filter.excludes(child_path, is_dir):
+                                        continue
+                                    child_node = tree.add_child(current_node, name, isDir=is_dir, fileSize=size)
+                                    if is_dir:
+                                        submit(child_node, child_path)
+                    except Exception as e:
+                        errors.append(e)
+                    finally:
+                        with lock:
+                            outstanding -= 1
+                            if not outstanding:
+                                finished.set()
+
+                submit(tree.root, "")
+                finished.wait()
+
+            if errors:
+                raise errors[0]
 
-            # Start the traversal from the root of the tree
-            add_recursive([root_value], self.FOLDER_PATH)
+            self.index.save(scanned, self.previous_index)
+            self.current_index = scanned
 
         except Exception as e:
             # Log the error using the logger
@@ -61,6 +115,295 @@ class FilesystemHelper:
             # Raise the exception again to notify the caller about the error
             raise e
 
+    def scan_directory(self, relative_path, cached_record=None):
+        """
+        Read the entries of a single directory, reusing the indexed record when the directory is unchanged.
+
+        Parameters:
+        - relative_path: Path of the directory relative to the local folder.
+        - cached_record: The (mtime_ns, entries) record of this directory from the previous run, if any.
+
+        Returns:
+        A tuple (mtime_ns, entries), or None if the directory disappeared during the scan.
+        """
+        directory_path = os.path.join(self.FOLDER_PATH, relative_path) if relative_path else self.FOLDER_PATH
+        try:
+            mtime_ns = os.stat(directory_path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+        if self.TRUST_DIRECTORY_MTIME and cached_record and cached_record[0] == mtime_ns:
+            return cached_record
+
+        entries = []
+        with os.scandir(directory_path) as directory_entries:
+            for entry in directory_entries:
+                if entry.name.endswith(TransferState.PARTIAL_DOWNLOAD_SUFFIX):
+                    continue
+                try:
+                    # The entry type comes from the directory listing itself; only files need a stat
+                    if entry.is_dir():
+                        entries.append((entry.name, True, 0, 0, entry.inode()))
+                    else:
+                        stat_result = entry.stat()
+                        entries.append((entry.name, False, stat_result.st_size, stat_result.st_mtime_ns, entry.inode()))
+                except FileNotFoundError:
+                    # Removed between listing and stat, or a dangling symlink
+                    continue
+
+        # Same order as the index returns them, so an unchanged directory compares equal to its record
+        entries.sort()
+        return mtime_ns, entries
+
+    def get_index_entry(self, relative_path, previous=False):
+        """
+        Get the record of a file from the latest scan.
+
+        Parameters:
+        - relative_path: Path of the file relative to the local folder, without a leading slash.
+        - previous: Look the file up in the entries of the last successful push, pull or sync instead.
+
+        Returns:
+        The entry tuple (name, is_dir, size, mtime_ns, inode), or None if the file was not scanned.
+        """
+        directory, _, name = relative_path.rpartition("/")
+        record = (self.synced_index if previous else self.current_index).get(directory)
+        if record is None:
+            return None
+        entries = record[1]
+        # Entries are kept sorted by name
+        position = bisect.bisect_left(entries, (name,))
+        if position < len(entries) and entries[position][0] == name:
+            return entries[position]
+        return None
+
+    @Metrics.timed("checksums")
+    def compute_checksums(self, local_tree, gdrive_tree, base_tree=None):
+        """
+        Fill in the MD5 checksum of every local file whose remote counterpart has the same size and a known
+        checksum, so that same-size edits can be told apart. Checksums are taken from the cache when the
+        file's (inode, size, mtime_ns) is unchanged, and the remaining files are hashed in parallel.
+
+        Parameters:
+        - local_tree: The Tree generated from the local filesystem.
+        - gdrive_tree: The Tree generated from Google Drive.
+        - base_tree: Optional Tree saved by the last sync; files are also compared against it the same way.
+        """
+        try:
+            candidates = {}
+            for reference_tree in (gdrive_tree, base_tree):
+                if not local_tree.root or not reference_tree or not reference_tree.root:
+                    continue
+
+                pending = [(local_tree.root, reference_tree.root, "")]
+                while pending:
+                    local_node, remote_node, relative_path = pending.pop()
+                    for name, local_child in local_node.children.items():
+                        remote_child = remote_node.children.get(name)
+                        if remote_child is None:
+                            continue
+                        child_path = f"{relative_path}/{name}" if relative_path else name
+                        if local_child.isDir:
+                            if remote_child.isDir:
+                                pending.append((local_child, remote_child, child_path))
+                        elif remote_child.checksum and int(remote_child.fileSize) == int(local_child.fileSize):
+                            candidates[child_path] = local_child
+
+            candidates = [(node, relative_path) for relative_path, node in candidates.items()]
+            self.fill_checksums(candidates)
+        except Exception as e:
+            # Log the error using the logger
+            self.logger.error(f"Error occurred in compute_checksums: {e}")
+            # Optionally, log the full traceback for detailed error information
+            self.logger.error(traceback.format_exc())
+            # Raise the exception again to notify the caller about the error
+            raise e
+
+    def fill_checksums(self, candidates):
+        """
+        Set the checksum of local file nodes, hashing only the files missing from the cache.
+
+        Parameters:
+        - candidates: List of (node, relative path) pairs for local files.
+        """
+        checksums = self.checksum_files([relative_path for _, relative_path in candidates])
+        for (node, _), checksum in zip(candidates, checksums):
+            if checksum is not None:
+                node.checksum = checksum
+
+    def checksum_files(self, relative_paths):
+        """
+        Get the MD5 checksums of local files, taken from the cache when the file's (inode, size, mtime_ns)
+        is unchanged, with the remaining files hashed in parallel.
+
+        Parameters:
+        - relative_paths: Paths of files from the latest scan, relative to the local folder.
+
+        Returns:
+        A list of checksums in the same order, with None for files missing from the scan.
+        """
+        if not relative_paths:
+            return []
+
+        cached_checksums = self.index.load_checksums()
+        checksums = [None] * len(relative_paths)
+        to_hash = []
+        for position, relative_path in enumerate(relative_paths):
+            entry = self.get_index_entry(relative_path)
+            if entry is None:
+                continue
+            _, _, size, mtime_ns, inode = entry
+            key = (inode, size, mtime_ns)
+            if key in cached_checksums:
+                checksums[position] = cached_checksums[key]
+            else:
+                to_hash.append((position, relative_path, key))
+
+        if not to_hash:
+            return checksums
+
+        hasher = LocalHasher(self.HASH_WORKERS)
+        hashed = hasher.hash_files([os.path.join(self.FOLDER_PATH, relative_path) for _, relative_path, _ in to_hash],
+                                   total_size=sum(key[1] for _, _, key in to_hash))
+        new_checksums = {}
+        for (position, _, key), checksum in zip(to_hash, hashed):
+            checksums[position] = checksum
+            new_checksums[key] = checksum
+        self.index.save_checksums(new_checksums)
+        return checksums
+
+    @Metrics.timed("move_detection")
+    def detect_moves(self, additions, deletions, local_tree, gdrive_tree):
+        """
+        Find local moves and renames among the additions and deletions of a push, so they can be applied
+        remotely as metadata changes instead of a re-upload.
+
+        An added entry is the moved copy of a deleted one when it has the same inode as the deleted path had
+        at the last successful push, pull or sync (files must also keep their size), or, for files, when size and MD5 checksum
+        match the deleted remote file. Entries inside added and deleted folders are matched too, so moving a
+        file into a new folder or out of a deleted one is found as well.
+
+        Parameters:
+        - additions: List of local additions (path, drive id, isDir).
+        - deletions: List of remote entries missing locally (path, drive id, isDir).
+        - local_tree: The Tree generated from the local filesystem.
+        - gdrive_tree: The Tree generated from Google Drive.
+
+        Returns:
+        A tuple of the list of moves (old path, new path, drive id, isDir), the additions that are not
+        move destinations, and the deletions that are not move sources.
+        """
+        try:
+            def walk(tree, changes):
+                for path, _, isDir in changes:
+                    pending = [(path, tree.find_node(path.split("/")[1:]))]
+                    while pending:
+                        current_path, node = pending.pop()
+                        if node is None:
+                            continue
+                        yield current_path, node
+                        pending.extend((f"{current_path}/{name}", child) for name, child in node.children.items())
+
+            # Everything deleted, by the inode it had when last in sync and by contents
+            sources_by_inode, sources_by_contents = {}, {}
+            for path, node in walk(gdrive_tree, deletions):
+                entry = self.get_index_entry(path[1:], previous=True)
+                if entry is not None and entry[4] and bool(entry[1]) == bool(node.isDir):
+                    sources_by_inode[(entry[4], bool(node.isDir))] = (path, node, entry[2])
+                if not node.isDir and node.checksum:
+                    sources_by_contents.setdefault((int(node.fileSize), node.checksum), []).append((path, node))
+
+            matches, unmatched_files = [], []
+            source_sizes = {size for size, _ in sources_by_contents}
+            for path, node in walk(local_tree, additions):
+                entry = self.get_index_entry(path[1:])
+                source = sources_by_inode.get((entry[4], bool(node.isDir))) if entry is not None and entry[4] else None
+                if source is not None and (node.isDir or source[2] == entry[2]):
+                    matches.append((source[0], path, source[1]))
+                elif not node.isDir and int(node.fileSize) in source_sizes:
+                    unmatched_files.append((node, path[1:]))
+
+            if unmatched_files and sources_by_contents:
+                # Only files with the size of some deleted file are hashed, mostly from the checksum cache
+                self.fill_checksums(unmatched_files)
+                for node, relative_path in unmatched_files:
+                    candidates = sources_by_contents.get((int(node.fileSize), node.checksum))
+                    if candidates:
+                        source_path, source_node = candidates.pop()
+                        matches.append((source_path, "/" + relative_path, source_node))
+
+            # Each remote entry moves once, and entries inside a moved folder travel with it
+            moves, moved_ids = [], set()
+            for source_path, destination_path, source_node in sorted(matches, key=lambda match: match[1].count("/")):
+                if source_node.id in moved_ids:
+                    continue
+                moves.append((source_path, destination_path, source_node.id, bool(source_node.isDir)))
+                moved_ids.add(source_node.id)
+
+            moved_sources = {move[0] for move in moves}
+            moves = [move for move in moves if not any(move[0].startswith(source + "/") for source in moved_sources)]
+
+            destinations = {move[1] for move in moves}
+            sources = {move[0] for move in moves}
+            return (moves, [change for change in additions if change[0] not in destinations],
+                    [change for change in deletions if change[0] not in sources])
+        except Exception as e:
+            # Log the error using the logger
+            self.logger.error(f"Error occurred in detect_moves: {e}")
+            # Optionally, log the full traceback for detailed error information
+            self.logger.error(traceback.format_exc())
+            # Raise the exception again to notify the caller about the error
+            raise e
+
+    @Metrics.timed("local_moves")
+    def move_in_filesystem(self, moves, local_tree):
+        """
+        Apply moves and renames made in Google Drive to the local filesystem, and move the nodes in the local
+        tree accordingly.
+
+        Moves are applied by depth of their destination, so a destination inside a folder moved earlier in
+        the same pull already exists; missing destination folders are created.
+
+        Parameters:
+        - moves: List of moves (old path, new path, drive id, isDir).
+        - local_tree: The Tree generated from the local filesystem, updated for every move.
+        """
+        try:
+            for old_path, new_path, _, _ in sorted(moves, key=lambda move: move[1].count("/")):
+                source = self.FOLDER_PATH + old_path
+                destination = self.FOLDER_PATH + new_path
+                node = local_tree.find_node(old_path.split("/")[1:])
+                if node is None or os.path.lexists(destination):
+                    # Left to the regular download and deletion
+                    self.logger.info(f"Not moving {old_path} to {new_path}, the destination exists")
+                    continue
+
+                os.makedirs(os.path.dirname(destination), exist_ok=True)
+                os.rename(source, destination)
+
+                local_tree.detach(node)
+                names = new_path.split("/")[1:]
+                parent = local_tree.root
+                for name in names[:-1]:
+                    parent = local_tree.add_child(parent, name, isDir=True)
+                node.value = names[-1]
+                local_tree.attach(parent, node)
+                print(f"Moved {old_path} -> {new_path}")
+        except Exception as e:
+            # Log the error using the logger
+            self.logger.error(f"Error occurred in move_in_filesystem: {e}")
+            # Optionally, log the full traceback for detailed error information
+            self.logger.error(traceback.format_exc())
+            # Raise the exception again to notify the caller about the error
+            raise e
+
+    def mark_synced(self):
+        """
+        Record the latest scan as the state both sides agree on, so the next push or sync detects moves
+        from it. Only called after a push, pull or sync succeeded, never after fetch or a cancelled command.
+        """
+        self.index.mark_synced()
+
     def soft_delete_from_filesystem(self, path):
         """
         Soft delete a file or directory from the filesystem.
@@ -4,6 +4,8 @@ import traceback
 from FilesystemHelper import FilesystemHelper
 from GoogleDriveHelper import GoogleDriveHelper
 from Logger import Logger
+from Metrics import Metrics
+from SyncEngine import SyncEngine
 from Tree import Tree
 
 class GSpace:
@@ -19,15 +21,28 @@ class GSpace:
 
     logger = Logger()
 
-    def __init__(self):
+    def __init__(self, gdrive=None):
         """
         Initialize GSpace by creating instances of GoogleDriveHelper, FilesystemHelper, and initializing Google Drive service.
+
+        Parameters:
+        - gdrive: A GoogleDriveHelper whose service is already set up, e.g. one backed by a stand-in service in
+          benchmarks; by default one is created and connected with the saved credentials.
         """
         try:
             self.logger.info("Program Started")
-            self.gdrive = GoogleDriveHelper()
+            if gdrive is not None:
+                self.gdrive = gdrive
+            elif ConfigurationManager.TRANSFER_ENGINE == "asyncio":
+                # Imported here so aiohttp is only needed when the asyncio engine is selected
+                from AsyncGoogleDriveHelper import AsyncGoogleDriveHelper
+                self.gdrive = AsyncGoogleDriveHelper()
+            else:
+                self.gdrive = GoogleDriveHelper()
             self.filesystem = FilesystemHelper()
-            self.gdrive.initialize_service()
+            self.sync_engine = SyncEngine()
+            if gdrive is None:
+                self.gdrive.initialize_service()
         except Exception as e:
             # Log the error using the logger
             self.logger.error(f"Error occurred in GSpace initialization: {e}")
@@ -36,6 +51,50 @@ class GSpace:
             # Raise the exception again to notify the caller about the error
             raise e
 
+    def scan(self, base_tree=None):
+        """
+        Scan Google Drive and the local filesystem once each.
+
+        Parameters:
+        - base_tree: Optional Tree saved by the last sync; local checksums are also computed against it.
+
+        Returns:
+        A tuple of the Tree generated from Google Drive and the Tree generated from the local filesystem.
+        """
+        try:
+            # The local scan goes first, while the credentials are still loading in the background
+            local_fs_tree = Tree()
+            self.filesystem.generate_tree_from_filesystem(local_fs_tree)
+            gdrive_tree = self.gdrive.get_remote_tree()
+            self.filesystem.compute_checksums(local_fs_tree, gdrive_tree, base_tree)
+
+            # The listing is consistent with its changes token, so the next run can replay from here
+            self.gdrive.save_remote_snapshot(gdrive_tree)
+
+            return gdrive_tree, local_fs_tree
+        except Exception as e:
+            # Log the error using the logger
+            self.logger.error(f"Error occurred in scan: {e}")
+            # Optionally, log the full traceback for detailed error information
+            self.logger.error(traceback.format_exc())
+            # Raise the exception again to notify the caller about the error
+            raise e
+
+    def mark_synced(self, gdrive_tree, base_tree=None, conflicts=()):
+        """
+        Record that both sides are in line after a push, pull or sync, so the next run detects local and
+        remote moves from this point and the next sync compares with what both sides hold now. Commands that
+        change nothing, like fetch, must not call it.
+
+        Parameters:
+        - gdrive_tree: The remote Tree, with the changes of the command applied.
+        - base_tree: The base Tree the command started from; conflicting paths keep their entry in it.
+        - conflicts: Conflicts left untouched by a sync.
+        """
+        self.sync_engine.save_base(self.sync_engine.build_base(gdrive_tree, base_tree, conflicts))
+        self.filesystem.mark_synced()
+        self.gdrive.mark_synced(gdrive_tree)
+
     def fetch(self, updateType="Local Filesystem"):
         """
         Fetch changes from Google Drive and local filesystem, and print the differences.
@@ -44,18 +103,20 @@ class GSpace:
         - updateType: Type of update, either "Local Filesystem" or "Google Drive".
         """
         try:
-            gdrive_tree, local_fs_tree = Tree(), Tree()
-            gdrive_tree.add([ConfigurationManager.ROOT_FOLDER_NAME], ConfigurationManager.ROOT_FOLDER_ID)
-            self.gdrive.generate_tree_from_google_drive(gdrive_tree)
-            self.filesystem.generate_tree_from_filesystem(local_fs_tree)
+            gdrive_tree, local_fs_tree = self.scan()
 
-            changes_in_local = local_fs_tree.find_difference_path(gdrive_tree)
-            changes_in_server = gdrive_tree.find_difference_path(local_fs_tree)
+            # One walk over both trees gives the changes in both directions
+            changes_in_local, changes_in_server = local_fs_tree.find_differences(gdrive_tree)
             print("============================================")
 
             print("Following changes will take place in " + updateType)
 
             if updateType == "Local Filesystem":
+                # Entries moved or renamed in Google Drive are renamed locally instead of a backup plus re-download
+                changes_in_server["Moves"], changes_in_server["Additions"], changes_in_server["Deletions"] = self.gdrive.detect_remote_moves(
+                    changes_in_server["Additions"], changes_in_server["Deletions"], gdrive_tree, local_fs_tree)
+                print(f"Moves ({len(changes_in_server['Moves'])}):")
+                for change in changes_in_server["Moves"]: print(">", change[0], "->", change[1])
                 print(f"Additions ({len(changes_in_server['Additions'])}):")
                 for change in changes_in_server["Additions"]: print("+", change[0])
                 print(f"Modifications ({len(changes_in_server['Modifications'])}):")
@@ -63,6 +124,11 @@ class GSpace:
                 print(f"Deletions ({len(changes_in_server['Deletions'])}):")
                 for change in changes_in_server["Deletions"]: print("-", change[0])
             else:
+                # Moved and renamed entries are pushed as metadata changes instead of a trash plus re-upload
+                changes_in_local["Moves"], changes_in_local["Additions"], changes_in_local["Deletions"] = self.filesystem.detect_moves(
+                    changes_in_local["Additions"], changes_in_local["Deletions"], local_fs_tree, gdrive_tree)
+                print(f"Moves ({len(changes_in_local['Moves'])}):")
+                for change in changes_in_local["Moves"]: print(">", change[0], "->", change[1])
                 print(f"Additions ({len(changes_in_local['Additions'])}):")
                 for change in changes_in_local["Additions"]: print("+", change[0])
                 print(f"Modifications ({len(changes_in_local['Modifications'])}):")
@@ -90,8 +156,9 @@ class GSpace:
         try:
             changes_in_local, changes_in_server, gdrive_tree, local_fs_tree = self.fetch()
 
-            if not changes_in_server["Additions"] and not changes_in_server["Deletions"] and not changes_in_server["Modifications"]:
+            if not changes_in_server["Moves"] and not changes_in_server["Additions"] and not changes_in_server["Deletions"] and not changes_in_server["Modifications"]:
                 print("============================================")
+                self.mark_synced(gdrive_tree)
                 print("No changes to pull!\nExiting ...")
                 return print("============================================")
 
@@ -106,20 +173,27 @@ class GSpace:
                 print("Canceled by user!\nExiting ...")
                 return print("============================================")
 
+            if len(changes_in_server["Moves"]):
+                print("============================================")
+                print("Starting moving files in local Filesystem:")
+                self.filesystem.move_in_filesystem(changes_in_server["Moves"], local_fs_tree)
+
+                # Moved folders may hold changes of their own, so compare again with the files in their new place
+                self.filesystem.compute_checksums(local_fs_tree, gdrive_tree)
+                changes_in_local, changes_in_server = local_fs_tree.find_differences(gdrive_tree)
+
             if len(changes_in_server["Additions"]):
                 print("============================================")
                 print("Starting pulling changes from Google Drive:")
-                for to_download in changes_in_server["Additions"]:
-                    self.gdrive.download_helper(to_download[0], to_download[1], to_download[2])
+                self.gdrive.download_many(gdrive_tree, changes_in_server["Additions"])
 
             if len(changes_in_server["Modifications"]):
                 print("============================================")
                 print("Starting modifications in local Filesystem:")
                 print("============================================")
 
-                for to_modify in changes_in_server["Modifications"]:
-                    self.filesystem.hard_delete_from_filesystem(to_modify[0])
-                    self.gdrive.download_helper(to_modify[0], to_modify[1], to_modify[2])
+                # Downloads rewrite the target file, so modified files are simply downloaded again
+                self.gdrive.download_many(gdrive_tree, changes_in_server["Modifications"])
 
                 print("Finished modification changes from Google Drive!")
                 print("============================================")
@@ -133,6 +207,7 @@ class GSpace:
                 print("Finished removing files from local Filesystem!")
                 print("============================================")
 
+            self.mark_synced(gdrive_tree)
             print("SUCCESS: Pulled Google Drive!")
             self.logger.info("Pulled from google drive")
 
@@ -151,8 +226,9 @@ class GSpace:
         try:
             changes_in_local, changes_in_server, gdrive_tree, local_fs_tree = self.fetch(updateType="Google Drive")
 
-            if not changes_in_local["Additions"] and not changes_in_local["Deletions"] and not changes_in_local["Modifications"]:
+            if not changes_in_local["Moves"] and not changes_in_local["Additions"] and not changes_in_local["Deletions"] and not changes_in_server["Modifications"]:
                 print("============================================")
+                self.mark_synced(gdrive_tree)
                 print("No changes to push!\nExiting ...")
                 return print("============================================")
 
@@ -167,11 +243,19 @@ class GSpace:
                 print("Canceled by user!\nExiting ...")
                 return print("============================================")
 
+            if len(changes_in_local["Moves"]):
+                print("============================================")
+                print("Starting moving files in Google Drive:")
+                self.gdrive.move_files(gdrive_tree, changes_in_local["Moves"])
+
+                # Moved folders may hold changes of their own, so compare again with the files in their new place
+                self.filesystem.compute_checksums(local_fs_tree, gdrive_tree)
+                changes_in_local, changes_in_server = local_fs_tree.find_differences(gdrive_tree)
+
             if len(changes_in_local["Additions"]):
                 print("============================================")
                 print("Starting pushing changes to Google Drive:")
-                for to_upload in changes_in_local["Additions"]:
-                    self.gdrive.upload_helper(gdrive_tree, to_upload)
+                self.gdrive.upload_many(gdrive_tree, changes_in_local["Additions"], checksum_files=self.filesystem.checksum_files)
 
                 print("Finished pushing changes to Google Drive!")
                 print("============================================")
@@ -181,9 +265,7 @@ class GSpace:
                 print("Starting modifications in Google Drive:")
                 print("============================================")
 
-                for to_modify in changes_in_server["Modifications"]:
-                    self.gdrive.delete_file(to_modify[1], gdrive_tree=gdrive_tree)
-                    self.gdrive.upload_helper(gdrive_tree, to_modify)
+                self.gdrive.update_many(gdrive_tree, changes_in_server["Modifications"])
 
                 print("Finished modifications in Google Drive!")
                 print("============================================")
@@ -191,12 +273,12 @@ class GSpace:
             if len(changes_in_local["Deletions"]):
                 print("============================================")
                 print("Starting removing files from Google Drive:")
-                for to_delete in changes_in_local["Deletions"]:
-                    self.gdrive.delete_file(to_delete[1], gdrive_tree=gdrive_tree)
+                self.gdrive.delete_files([to_delete[1] for to_delete in changes_in_local["Deletions"]], gdrive_tree=gdrive_tree)
 
                 print("Finished removing files from Google Drive!")
                 print("============================================")
 
+            self.mark_synced(gdrive_tree)
             print("SUCCESS: Pushing to Google Drive!")
             self.logger.info("Pushed to Google Drive")
 
@@ -212,11 +294,98 @@ class GSpace:
     def sync(self):
         """
         Synchronize changes between the local filesystem and Google Drive.
+
+        Each side is scanned once and compared with the base saved by the last push, pull or sync, so
+        deletions on either side are carried over instead of being undone, and entries changed on both sides
+        are reported as conflicts and left untouched.
         """
         try:
-            self.pull()
-            self.push()
+            base_tree = self.sync_engine.load_base()
+            gdrive_tree, local_fs_tree = self.scan(base_tree)
+            plan = self.sync_engine.plan(local_fs_tree, gdrive_tree, base_tree)
+
+            # Local moves and renames are applied as metadata changes instead of a trash plus re-upload
+            plan["Moves"], new_uploads, plan["Remote Deletions"] = self.filesystem.detect_moves(
+                [change for change in plan["Uploads"] if not change[1]], plan["Remote Deletions"], local_fs_tree, gdrive_tree)
+            plan["Uploads"] = [change for change in plan["Uploads"] if change[1]] + new_uploads
+            plan["Local Moves"], plan["Downloads"], plan["Local Deletions"] = self.gdrive.detect_remote_moves(
+                plan["Downloads"], plan["Local Deletions"], gdrive_tree, local_fs_tree)
+
+            print("============================================")
+            print("Following changes will take place in Google Drive and Local Filesystem")
+            print(f"Moves in Google Drive ({len(plan['Moves'])}):")
+            for change in plan["Moves"]: print(">", change[0], "->", change[1])
+            print(f"Moves in Local Filesystem ({len(plan['Local Moves'])}):")
+            for change in plan["Local Moves"]: print(">", change[0], "->", change[1])
+            print(f"Uploads ({len(plan['Uploads'])}):")
+            for change in plan["Uploads"]: print("+" if change[1] is None else "*", change[0])
+            print(f"Downloads ({len(plan['Downloads'])}):")
+            for change in plan["Downloads"]: print("+", change[0])
+            print(f"Deletions in Google Drive ({len(plan['Remote Deletions'])}):")
+            for change in plan["Remote Deletions"]: print("-", change[0])
+            print(f"Deletions in Local Filesystem ({len(plan['Local Deletions'])}):")
+            for change in plan["Local Deletions"]: print("-", change[0])
+            print(f"Conflicts, left untouched ({len(plan['Conflicts'])}):")
+            for change in plan["Conflicts"]: print("!", change[0], f"({change[3]})")
+            print("============================================")
+
+            if not any(plan[action] for action in ("Moves", "Local Moves", "Uploads", "Downloads", "Remote Deletions", "Local Deletions")):
+                # Still record the base, so the first sync of trees already in step enables deletion tracking
+                self.mark_synced(gdrive_tree, base_tree, plan["Conflicts"])
+                print("No changes to sync!\nExiting ...")
+                return print("============================================")
+
+            confirmation = ""
+
+            while confirmation not in ["yes", "no"]:
+                confirmation = input("Are you sure you want to continue? [yes, no]\n >>> ")
+                if confirmation not in ["yes", "no"]: print("Usage: 'yes' or 'no'")
+
+            if confirmation == "no":
+                print("============================================")
+                print("Canceled by user!\nExiting ...")
+                return print("============================================")
+
+            if len(plan["Moves"]) or len(plan["Local Moves"]):
+                print("============================================")
+                print("Starting moving files:")
+                self.gdrive.move_files(gdrive_tree, plan["Moves"])
+                self.filesystem.move_in_filesystem(plan["Local Moves"], local_fs_tree)
 
+                # Moved entries keep their base, so changes inside moved folders are planned in their new place
+                self.sync_engine.move_in_base(base_tree, plan["Moves"] + plan["Local Moves"])
+                self.filesystem.compute_checksums(local_fs_tree, gdrive_tree, base_tree)
+                plan = self.sync_engine.plan(local_fs_tree, gdrive_tree, base_tree)
+
+            if len(plan["Downloads"]):
+                print("============================================")
+                print("Starting pulling changes from Google Drive:")
+                self.gdrive.download_many(gdrive_tree, plan["Downloads"])
+
+            if len(plan["Uploads"]):
+                print("============================================")
+                print("Starting pushing changes to Google Drive:")
+                # Changed files are updated in place; new ones are created
+                self.gdrive.update_many(gdrive_tree, [change for change in plan["Uploads"] if change[1]])
+                self.gdrive.upload_many(gdrive_tree, [change for change in plan["Uploads"] if not change[1]],
+                                        checksum_files=self.filesystem.checksum_files)
+
+            if len(plan["Remote Deletions"]):
+                print("============================================")
+                print("Starting removing files from Google Drive:")
+                self.gdrive.delete_files([change[1] for change in plan["Remote Deletions"]], gdrive_tree=gdrive_tree)
+
+            if len(plan["Local Deletions"]):
+                print("============================================")
+                print("Starting removing files in local Filesystem:")
+                for to_delete in plan["Local Deletions"]:
+                    self.filesystem.soft_delete_from_filesystem(to_delete[0])
+
+            # Every settled path now matches Google Drive, which becomes the base of the next sync
+            self.mark_synced(gdrive_tree, base_tree, plan["Conflicts"])
+
+            print("============================================")
+            print("SUCCESS: Synced Google Drive and Local Filesystem!")
             self.logger.info("Sync from Google Drive and Local System Completed")
 
         except Exception as e:
@@ -228,6 +397,7 @@ class GSpace:
             raise e
 
 def main():
+    command, succeeded = None, False
     try:
         options = {
             "fetch": "",
@@ -242,6 +412,7 @@ def main():
         if sys.argv[1] not in options.keys():
             return print("Usage: python3 GSpace.py <command>\nCommands: fetch, pull, push, sync")
 
+        command = sys.argv[1]
         gspace_instance = GSpace()
 
         options = {
@@ -251,9 +422,13 @@ def main():
             "sync": gspace_instance.sync
         }
 
-        options[sys.argv[1]]()
+        try:
+            options[sys.argv[1]]()
+        finally:
+            gspace_instance.gdrive.close()
 
         gspace_instance.logger.info(f"SUCCESS: '{sys.argv[1]}'")
+        succeeded = True
 
     except Exception as e:
         # Log the error using the logger
@@ -262,6 +437,10 @@ def main():
         Logger().error(traceback.format_exc())
         # Raise the exception again to notify the caller about the error
         raise e
+    finally:
+        # Failed runs are reported too, they are the ones worth looking at
+        if command:
+            Metrics().write_reports(command, succeeded)
 
 if __name__ == "__main__":
     main()
@@ -1,25 +1,90 @@
 import io
 import os
 import pickle
+import threading
+import time
 import traceback  # Import traceback module for detailed error information
-from google.auth.transport.requests import Request
-from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
-from googleapiclient.http import MediaFileUpload, MediaIoBaseDownload
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from importlib.metadata import PackageNotFoundError, version
+# The rest of googleapiclient and the OAuth stack take longer to import than a run with nothing to do,
+# so they are imported where they are first needed
+from googleapiclient.errors import HttpError
 
+from LocalHasher import LocalHasher
 from Logger import Logger
+from Metrics import Metrics
+from PathFilter import PathFilter
+from ProgressReporter import ProgressReporter
+from RequestScheduler import RequestScheduler
+from StateManager import StateManager
+from TransferState import TransferState
+from Tree import Tree
 import ConfigurationManager
 
 class GoogleDriveHelper:
     logger = Logger()
+    metrics = Metrics()
+
+    FOLDER_MIME_TYPE = 'application/vnd.google-apps.folder'
+    # Docs, Sheets, Slides, shortcuts and other Google formats have no contents to download or compare
+    NATIVE_MIME_TYPE_PREFIX = 'application/vnd.google-apps.'
+    LIST_PAGE_SIZE = 1000
+    # Maximum number of calls Drive accepts in one batch request
+    BATCH_SIZE = 100
+    BATCH_WORKERS = 4
+    UPLOAD_FIELDS = "id, name, size, md5Checksum"
+    LIST_FIELDS = "nextPageToken, files(id, name, mimeType, size, md5Checksum, parents)"
+    CHANGE_FIELDS = "nextPageToken, newStartPageToken, changes(fileId, removed, file(id, name, mimeType, size, md5Checksum, parents, trashed))"
+    # Folders listed one by one when replaying the changes feed, above which the whole drive is listed instead
+    SUBTREE_LISTING_LIMIT = 20
+    REMOTE_SNAPSHOT_NAME = "remote_snapshot"
+    # Paths remote entries had when both sides were last in line, for the entries moved since
+    SYNCED_PATHS_NAME = "remote_synced_paths"
+    # Bumped whenever the saved tree gains information, so older snapshots are rebuilt by a full listing
+    REMOTE_SNAPSHOT_VERSION = 4
+    # Description of the Drive API bundled with googleapiclient, read once and shared by every thread's service
+    discovery_document = None
+    # googleapiclient has no public way to continue a transfer; resuming sets the private fields its own
+    # retries use (HttpRequest._in_error_state, MediaIoBaseDownload._progress), which every 2.x release has.
+    # Under any other major version transfers start over instead
+    RESUMABLE_CLIENT_MAJOR_VERSION = 2
+    try:
+        CLIENT_MAJOR_VERSION = int(version('google-api-python-client').split('.')[0])
+    except (PackageNotFoundError, ValueError):
+        CLIENT_MAJOR_VERSION = None
 
     def __init__(self):
         # If modifying these SCOPES, delete the output pickle file.
         self.SCOPES = ['https://www.googleapis.com/auth/drive']
         self.CLIENT_CREDENTIALS_JSON = ConfigurationManager.CLIENT_SECRET_PATH
+        self.UPLOAD_WORKERS = ConfigurationManager.UPLOAD_WORKERS
+        self.DOWNLOAD_WORKERS = ConfigurationManager.DOWNLOAD_WORKERS
+        self.CHUNK_SIZE = ConfigurationManager.CHUNK_SIZE_MB * 1024 * 1024
+        self.DEDUPLICATE_UPLOADS = ConfigurationManager.DEDUPLICATE_UPLOADS
+        self.transfers = TransferState()
+        # Every API call goes through one scheduler, shared by all worker threads
+        self.scheduler = RequestScheduler()
+        # Status line of the transfers in flight, shared by the workers of upload_files and download_files
+        self.progress = None
+        # googleapiclient services are not thread-safe, so every thread gets its own from the factory
+        self.thread_local = threading.local()
+        # Worker threads shared by every run_in_pool call, so their services and connections are reused
+        self.executor = None
+        self.executor_lock = threading.Lock()
+        self.credentials = None
+        self.service_factory = None
+        self.service_loader = None
         self.service = None
         self.ROOT_FOLDER_ID = ConfigurationManager.ROOT_FOLDER_ID
         self.ROOT_FOLDER_NAME = ConfigurationManager.ROOT_FOLDER_NAME
+        self.state = StateManager()
+        # Include/exclude rules; excluded folders are pruned from the remote tree before being descended
+        self.filter = PathFilter()
+        self.start_page_token = None
+        # Path each remote id had when both sides were last in line, for the ids whose place may have changed
+        # since; kept across commands that change nothing, like fetch, until a push, pull or sync succeeds
+        self.previous_paths = {}
 
     def get_credentials(self):
         try:
@@ -31,11 +96,14 @@ class GoogleDriveHelper:
                 with open(ConfigurationManager.OUTPUT_TOKEN_FILE, 'rb') as token:
                     credentials = pickle.load(token)
 
-            # If there are no (valid) credentials available, let the user log in.
+            # A token that is not close to expiring is used as it is, without a round trip to the token endpoint
             if not credentials or not credentials.valid:
                 if credentials and credentials.expired and credentials.refresh_token:
+                    from google.auth.transport.requests import Request
                     credentials.refresh(Request())
                 else:
+                    # If there are no (valid) credentials available, let the user log in.
+                    from google_auth_oauthlib.flow import InstalledAppFlow
                     flow = InstalledAppFlow.from_client_secrets_file(self.CLIENT_CREDENTIALS_JSON, self.SCOPES)
                     credentials = flow.run_local_server(port=0)
 
@@ -52,32 +120,117 @@ class GoogleDriveHelper:
             # Raise the exception again to notify the caller about the error
             raise e
 
+    @property
+    def service(self):
+        """
+        The Google Drive API service of the calling thread, built on first use in each worker thread. The
+        first use waits for initialize_service to finish loading the credentials.
+        """
+        service = getattr(self.thread_local, 'service', None)
+        if service is None and self.service_factory is None and self.service_loader is not None:
+            self.wait_for_service()
+        if service is None and self.service_factory is not None:
+            service = self.thread_local.service = self.service_factory()
+        return service
+
+    @service.setter
+    def service(self, service):
+        self.thread_local.service = service
+
     def initialize_service(self):
+        """
+        Start loading the credentials and the API description. With a saved token this runs on a background
+        thread, so it overlaps with the local scan; the first API call waits for it. The first login, which
+        needs the user, runs in the foreground.
+        """
+        try:
+            if not os.path.exists(ConfigurationManager.OUTPUT_TOKEN_FILE):
+                self.load_service()
+                return
+
+            executor = ThreadPoolExecutor(max_workers=1)
+            self.service_loader = executor.submit(self.load_service)
+            executor.shutdown(wait=False)
+        except Exception as e:
+            # Log the error using the logger
+            self.logger.error(f"Error occurred in initialize_service: {e}")
+            # Optionally, log the full traceback for detailed error information
+            self.logger.error(traceback.format_exc())
+            # Raise the exception again to notify the caller about the error
+            raise e
+
+    def wait_for_service(self):
+        """
+        Wait until initialize_service has loaded the credentials, raising any error it hit.
+
+        Returns:
+        The credentials.
+        """
+        if self.service_loader is not None:
+            self.service_loader.result()
+        return self.credentials
+
+    def load_service(self):
+        """
+        Load the credentials and prepare the factory building each thread's Google Drive API service.
+        """
         try:
             # Create a Google Drive API service using the saved or new credentials
             print("============================================\nInitializing Google Drive service ...")
-            self.service = build('drive', 'v3', credentials=self.get_credentials())
+            credentials = self.credentials = self.get_credentials()
+            from googleapiclient.discovery import build, build_from_document
+
+            if GoogleDriveHelper.discovery_document is None:
+                from googleapiclient import discovery_cache
+                GoogleDriveHelper.discovery_document = discovery_cache.get_static_doc('drive', 'v3') or False
+            document = GoogleDriveHelper.discovery_document
+
+            # Each service owns its own HTTP connection, which is what makes per-thread services safe.
+            # Without a bundled document, build fetches the description from the discovery service instead
+            if document:
+                self.service_factory = lambda: build_from_document(document, credentials=credentials)
+            else:
+                self.service_factory = lambda: build('drive', 'v3', credentials=credentials)
             print("Initializing Complete!\n============================================")
         except Exception as e:
             # Log the error using the logger
-            self.logger.error(f"Error occurred in initialize_service: {e}")
+            self.logger.error(f"Error occurred in load_service: {e}")
             # Optionally, log the full traceback for detailed error information
             self.logger.error(traceback.format_exc())
             # Raise the exception again to notify the caller about the error
             raise e
 
-    def generate_tree_from_google_drive(self, tree_root, parent_id=ConfigurationManager.ROOT_FOLDER_ID, path=[]):
+    def list_files(self, query):
+        """
+        Yield every file matching a Drive query, following nextPageToken until the listing is exhausted.
+
+        Parameters:
+        - query: The Drive search query, e.g. "trashed = false".
+        """
         try:
-            results = self.service.files().list(q=f"parents in '{parent_id}'", pageSize=1000,
-                                                fields="nextPageToken, files(id, name, mimeType, trashed, size)").execute()
-            items = results.get('files', [])
-
-            for i, item in enumerate(items):
-                if item['mimeType'] == 'application/vnd.google-apps.folder':
-                    if not item['trashed']: tree_root.add([self.ROOT_FOLDER_NAME] + path + [item['name']], item['id'], isDir=True)
-                    if not item['trashed']: self.generate_tree_from_google_drive(tree_root, item['id'], path + [item['name']])
-                else:
-                    if not item['trashed']: tree_root.add([self.ROOT_FOLDER_NAME] + path + [item['name']], item['id'], isDir=False, fileSize=item['size'])
+            page_token = None
+            while True:
+                results = self.scheduler.execute(self.service.files().list(
+                    q=query, spaces='drive', pageSize=self.LIST_PAGE_SIZE, pageToken=page_token, fields=self.LIST_FIELDS))
+                yield from results.get('files', [])
+
+                page_token = results.get('nextPageToken')
+                if not page_token:
+                    break
+        except Exception as e:
+            # Log the error using the logger
+            self.logger.error(f"Error occurred in list_files: {e}")
+            # Optionally, log the full traceback for detailed error information
+            self.logger.error(traceback.format_exc())
+            # Raise the exception again to notify the caller about the error
+            raise e
+
+    @Metrics.timed("remote_listing")
+    def generate_tree_from_google_drive(self, tree_root):
+        try:
+            # List every non-trashed item in a few large pages and group them by parent,
+            # instead of issuing one files().list call per folder.
+            self.build_tree_from_parent_map(tree_root, self.list_children_by_parent())
         except Exception as e:
             # Log the error using the logger
             self.logger.error(f"Error occurred in generate_tree_from_google_drive: {e}")
@@ -86,22 +239,467 @@ class GoogleDriveHelper:
             # Raise the exception again to notify the caller about the error
             raise e
 
-    def upload_file(self, file_path, folder_id):
+    def is_native(self, item):
+        """
+        Decide whether an item is a Google Docs, Sheets, Slides or other Google format file. They have no
+        binary contents or size, so they are left out of the remote tree: pulls do not download them and
+        pushes do not trash them.
+
+        Parameters:
+        - item: A file resource from a listing or the changes feed.
+        """
+        mime_type = item.get('mimeType', '')
+        return mime_type.startswith(self.NATIVE_MIME_TYPE_PREFIX) and mime_type != self.FOLDER_MIME_TYPE
+
+    def list_children_by_parent(self):
+        """
+        List every non-trashed item in a few large pages and group them by parent.
+
+        Returns:
+        Dictionary mapping a Drive folder id to the list of its child items.
+        """
+        children_by_parent = {}
+        for item in self.list_files("trashed = false"):
+            for parent_id in item.get('parents', []):
+                children_by_parent.setdefault(parent_id, []).append(item)
+        return children_by_parent
+
+    def build_tree_from_parent_map(self, tree_root, children_by_parent, folder_nodes=None):
+        """
+        Attach every item reachable from the given folders, in one pass over a parent id -> children map.
+        Items excluded by the [Filters] rules are skipped, with everything below them.
+
+        Parameters:
+        - tree_root: A Tree whose root node carries the Drive id of the root folder.
+        - children_by_parent: Dictionary mapping a Drive folder id to the list of its child items.
+        - folder_nodes: Nodes of the folders whose contents are attached; by default the root.
+        """
+        try:
+            folder_nodes = [tree_root.root] if folder_nodes is None else folder_nodes
+            pending = [(node, "".join("/" + name for name in tree_root.path_of(node))) for node in folder_nodes]
+            visited = {node.id for node in folder_nodes}
+            path_filter = self.filter
+
+            while pending:
+                parent_node, parent_path = pending.pop()
+                for item in children_by_parent.get(parent_node.id, []):
+                    if self.is_native(item):
+                        continue
+                    isDir = item['mimeType'] == self.FOLDER_MIME_TYPE
+                    item_path = parent_path + "/" + item['name']
+                    if path_filter and path_filter.excludes(item_path, isDir):
+                        continue
+                    child_node = tree_root.add_child(parent_node, item['name'], item['id'], isDir=isDir,
+                                                     fileSize=int(item.get('size', 0)), checksum=item.get('md5Checksum'))
+                    if isDir and child_node.id not in visited:
+                        visited.add(child_node.id)
+                        pending.append((child_node, item_path))
+        except Exception as e:
+            # Log the error using the logger
+            self.logger.error(f"Error occurred in build_tree_from_parent_map: {e}")
+            # Optionally, log the full traceback for detailed error information
+            self.logger.error(traceback.format_exc())
+            # Raise the exception again to notify the caller about the error
+            raise e
+
+    def generate_subtree_from_google_drive(self, tree_root, folder_node):
+        """
+        List the contents of a single folder, breadth first, and attach them under its node. Folders
+        excluded by the [Filters] rules are not listed.
+
+        Parameters:
+        - tree_root: The Tree the folder belongs to.
+        - folder_node: The node of the folder whose contents are listed.
+        """
+        try:
+            pending = [(folder_node, "/" + "/".join(tree_root.path_of(folder_node)))]
+            path_filter = self.filter
+            while pending:
+                parent_node, parent_path = pending.pop()
+                for item in self.list_files(f"'{parent_node.id}' in parents and trashed = false"):
+                    if self.is_native(item):
+                        continue
+                    isDir = item['mimeType'] == self.FOLDER_MIME_TYPE
+                    item_path = parent_path.rstrip("/") + "/" + item['name']
+                    if path_filter and path_filter.excludes(item_path, isDir):
+                        continue
+                    child_node = tree_root.add_child(parent_node, item['name'], item['id'], isDir=isDir,
+                                                     fileSize=int(item.get('size', 0)), checksum=item.get('md5Checksum'))
+                    if isDir:
+                        pending.append((child_node, item_path))
+        except Exception as e:
+            # Log the error using the logger
+            self.logger.error(f"Error occurred in generate_subtree_from_google_drive: {e}")
+            # Optionally, log the full traceback for detailed error information
+            self.logger.error(traceback.format_exc())
+            # Raise the exception again to notify the caller about the error
+            raise e
+
+    def get_start_page_token(self):
+        """
+        Get the changes feed position to replay from on the next run.
+
+        Returns:
+        The current start page token of the Drive changes feed.
+        """
+        try:
+            return self.scheduler.execute(self.service.changes().getStartPageToken())['startPageToken']
+        except Exception as e:
+            # Log the error using the logger
+            self.logger.error(f"Error occurred in get_start_page_token: {e}")
+            # Optionally, log the full traceback for detailed error information
+            self.logger.error(traceback.format_exc())
+            # Raise the exception again to notify the caller about the error
+            raise e
+
+    @Metrics.timed("remote_changes")
+    def list_changes(self, page_token):
+        """
+        List every change recorded in the Drive changes feed since the given page token.
+
+        Parameters:
+        - page_token: The start page token saved by a previous run.
+
+        Returns:
+        A tuple of the list of changes and the new start page token.
+        """
+        changes = []
+        new_start_page_token = page_token
+
+        while page_token:
+            results = self.scheduler.execute(self.service.changes().list(
+                pageToken=page_token, spaces='drive', pageSize=self.LIST_PAGE_SIZE, includeRemoved=True,
+                fields=self.CHANGE_FIELDS))
+            changes.extend(results.get('changes', []))
+
+            new_start_page_token = results.get('newStartPageToken', new_start_page_token)
+            page_token = results.get('nextPageToken')
+
+        return changes, new_start_page_token
+
+    def apply_changes(self, tree_root, changes):
+        """
+        Apply entries of the Drive changes feed to a previously saved remote tree.
+
+        Parameters:
+        - tree_root: The saved remote Tree, updated in place.
+        - changes: List of changes returned by list_changes.
+        """
+        try:
+            # Only the latest state of each file matters; None marks a removed or trashed file, and Google
+            # format files, which the tree leaves out
+            latest = {}
+            for change in changes:
+                item = change.get('file')
+                removed = change.get('removed') or not item or item.get('trashed') or self.is_native(item)
+                latest[change['fileId']] = None if removed else item
+
+            # Detach every changed node; moved folders are re-attached below with their subtree intact.
+            # Nodes are looked up before any detaching, since a detached subtree leaves the id index.
+            detached = {file_id: tree_root.find_node_by_id(file_id) for file_id in latest}
+            detached = {file_id: tree_root.detach(node) for file_id, node in detached.items()
+                        if node is not None and node.parent is not None}
+
+            # Attach the surviving items once their parent is reachable from the root
+            pending = {file_id: item for file_id, item in latest.items() if item and file_id != tree_root.root.id}
+            new_folders = []
+            progress = True
+            while pending and progress:
+                progress = False
+                for file_id, item in list(pending.items()):
+                    parent_nodes = (tree_root.find_node_by_id(parent_id) for parent_id in item.get('parents', []))
+                    parent_node = next((node for node in parent_nodes if node is not None), None)
+                    if parent_node is None:
+                        continue
+
+                    isDir = item['mimeType'] == self.FOLDER_MIME_TYPE
+                    del pending[file_id]
+                    progress = True
+                    if self.filter and self.filter.excludes("/".join(tree_root.path_of(parent_node) + [item['name']]), isDir):
+                        # Moved or renamed into an excluded place; it stays detached
+                        continue
+
+                    node = detached.get(file_id)
+                    if node is not None and node.isDir and isDir:
+                        # A re-attached folder brings its whole subtree back into reach
+                        node.value = item['name']
+                        tree_root.attach(parent_node, node)
+                    else:
+                        node = tree_root.add_child(parent_node, item['name'], file_id, isDir=isDir,
+                                                   fileSize=int(item.get('size', 0)), checksum=item.get('md5Checksum'))
+                        if isDir and file_id not in detached:
+                            new_folders.append(node)
+                    node.fileSize = int(item.get('size', 0))
+                    node.checksum = item.get('md5Checksum')
+
+            # Folders we have never seen may have been moved in from outside the root with existing contents.
+            # A folder whose children arrived in the feed was filled by it, and listing a folder covers
+            # every new folder below it, so only the top-most of the rest are listed.
+            unfilled = {node.id for node in new_folders if not node.children}
+            to_list = []
+            for folder_node in new_folders:
+                if folder_node.id not in unfilled:
+                    continue
+                ancestor = folder_node.parent
+                while ancestor is not None and ancestor.id not in unfilled:
+                    ancestor = ancestor.parent
+                if ancestor is None:
+                    to_list.append(folder_node)
+
+            if len(to_list) > self.SUBTREE_LISTING_LIMIT:
+                # A few pages of the whole drive cost less than one listing per folder
+                self.build_tree_from_parent_map(tree_root, self.list_children_by_parent(), to_list)
+            else:
+                for folder_node in to_list:
+                    self.generate_subtree_from_google_drive(tree_root, folder_node)
+        except Exception as e:
+            # Log the error using the logger
+            self.logger.error(f"Error occurred in apply_changes: {e}")
+            # Optionally, log the full traceback for detailed error information
+            self.logger.error(traceback.format_exc())
+            # Raise the exception again to notify the caller about the error
+            raise e
+
+    @Metrics.timed("remote_scan")
+    def get_remote_tree(self):
+        """
+        Get the remote tree, replaying the changes feed onto the saved snapshot when one is available,
+        and falling back to a full listing otherwise.
+
+        Returns:
+        The remote Tree.
+        """
+        try:
+            snapshot = self.state.load(self.REMOTE_SNAPSHOT_NAME)
+            synced_paths = self.state.load(self.SYNCED_PATHS_NAME, default={})
+            if synced_paths.get('root_folder_id') == self.ROOT_FOLDER_ID:
+                self.previous_paths = dict(synced_paths['paths'])
+            if (snapshot and snapshot.get('version') == self.REMOTE_SNAPSHOT_VERSION
+                    and snapshot.get('root_folder_id') == self.ROOT_FOLDER_ID
+                    and snapshot.get('filters') == self.filter.fingerprint):
+                try:
+                    changes, new_start_page_token = self.list_changes(snapshot['page_token'])
+                    tree_root = snapshot['tree']
+                    for change in changes:
+                        node = tree_root.find_node_by_id(change['fileId'])
+                        # An entry moved twice since the last sync keeps the path it had back then
+                        if node is not None and node.id not in self.previous_paths:
+                            self.previous_paths[node.id] = tuple(tree_root.path_of(node))
+                    self.apply_changes(tree_root, changes)
+                    self.start_page_token = new_start_page_token
+                    return tree_root
+                except HttpError as e:
+                    # An expired or invalid token is rejected by the API; rebuild from scratch
+                    if e.resp.status not in (400, 404, 410):
+                        raise
+                    self.logger.info(f"Saved changes token rejected ({e.resp.status}), doing a full listing")
+
+            if snapshot and snapshot.get('root_folder_id') == self.ROOT_FOLDER_ID and isinstance(snapshot.get('tree'), Tree):
+                self.previous_paths = {**{node.id: path for path, node in snapshot['tree'].iter_nodes()}, **self.previous_paths}
+
+            # Take the token before listing, so nothing that changes during the listing is missed
+            self.start_page_token = self.get_start_page_token()
+            tree_root = Tree()
+            tree_root.add([self.ROOT_FOLDER_NAME], self.ROOT_FOLDER_ID, isDir=True)
+            self.generate_tree_from_google_drive(tree_root)
+            return tree_root
+        except Exception as e:
+            # Log the error using the logger
+            self.logger.error(f"Error occurred in get_remote_tree: {e}")
+            # Optionally, log the full traceback for detailed error information
+            self.logger.error(traceback.format_exc())
+            # Raise the exception again to notify the caller about the error
+            raise e
+
+    @Metrics.timed("move_detection")
+    def detect_remote_moves(self, additions, deletions, gdrive_tree, local_tree):
+        """
+        Find remote moves and renames among the changes of a pull, so they can be applied locally as renames
+        instead of a backup plus re-download. Drive ids are stable, so an added remote entry was moved when
+        its id had another path in the saved snapshot, and that path is still present locally.
+
+        Parameters:
+        - additions: List of remote additions (path, drive id, isDir).
+        - deletions: List of local entries missing remotely (path, drive id, isDir).
+        - gdrive_tree: The Tree generated from Google Drive.
+        - local_tree: The Tree generated from the local filesystem.
+
+        Returns:
+        A tuple of the list of moves (old path, new path, drive id, isDir), the additions that are not move
+        destinations, and the deletions that are not move sources.
+        """
+        try:
+            deleted_paths = {tuple(path.split("/")[1:]) for path, _, _ in deletions}
+
+            def locally_deleted(names, isDir):
+                local_node = local_tree.find_node(names)
+                return (local_node is not None and bool(local_node.isDir) == isDir
+                        and any(names[:depth] in deleted_paths for depth in range(1, len(names) + 1)))
+
+            # Entries inside added folders are matched too, so moving into a new folder is found as well
+            matches = []
+            pending = [(path, gdrive_tree.find_node(path.split("/")[1:])) for path, _, _ in additions]
+            while pending:
+                path, node = pending.pop()
+                if node is None:
+                    continue
+                previous_path = self.previous_paths.get(node.id)
+                if previous_path and locally_deleted(previous_path, bool(node.isDir)):
+                    matches.append(("/" + "/".join(previous_path), path, node.id, bool(node.isDir)))
+                    continue
+                pending.extend((f"{path}/{name}", child) for name, child in node.children.items())
+
+            # Entries inside a moved folder travel with it
+            sources = {match[0] for match in matches}
+            moves = [match for match in matches if not any(match[0].startswith(source + "/") for source in sources)]
+
+            destinations = {move[1] for move in moves}
+            sources = {move[0] for move in moves}
+            return (moves, [change for change in additions if change[0] not in destinations],
+                    [change for change in deletions if change[0] not in sources])
+        except Exception as e:
+            # Log the error using the logger
+            self.logger.error(f"Error occurred in detect_remote_moves: {e}")
+            # Optionally, log the full traceback for detailed error information
+            self.logger.error(traceback.format_exc())
+            # Raise the exception again to notify the caller about the error
+            raise e
+
+    def save_remote_snapshot(self, tree_root):
+        """
+        Save the remote tree together with the changes token it is consistent with, and the earlier paths of
+        the entries that moved since both sides were last in line.
+
+        Parameters:
+        - tree_root: The remote Tree returned by get_remote_tree.
+        """
+        try:
+            # Only entries whose path changed are worth keeping
+            moved = {}
+            for file_id, path in self.previous_paths.items():
+                node = tree_root.find_node_by_id(file_id)
+                if node is None or tuple(tree_root.path_of(node)) != tuple(path):
+                    moved[file_id] = tuple(path)
+            self.state.save(self.SYNCED_PATHS_NAME, {'root_folder_id': self.ROOT_FOLDER_ID, 'paths': moved})
+
+            self.state.save(self.REMOTE_SNAPSHOT_NAME, {
+                'version': self.REMOTE_SNAPSHOT_VERSION,
+                'root_folder_id': self.ROOT_FOLDER_ID,
+                # A snapshot pruned by other rules lacks entries that are now included
+                'filters': self.filter.fingerprint,
+                'page_token': self.start_page_token,
+                'tree': tree_root
+            })
+        except Exception as e:
+            # Log the error using the logger
+            self.logger.error(f"Error occurred in save_remote_snapshot: {e}")
+            # Optionally, log the full traceback for detailed error information
+            self.logger.error(traceback.format_exc())
+            # Raise the exception again to notify the caller about the error
+            raise e
+
+    def mark_synced(self, tree_root):
+        """
+        Forget the earlier paths of moved entries once a push, pull or sync has brought both sides in line,
+        and save the remote tree again with the moves, uploads and deletions the command made, so the next
+        pull only detects moves made after it, from the paths they start at.
+
+        Parameters:
+        - tree_root: The remote Tree, with the changes of the command applied.
+        """
+        self.previous_paths = {}
+        self.save_remote_snapshot(tree_root)
+
+    @classmethod
+    def can_resume(cls, transfer=None, field=None):
+        """
+        Decide whether interrupted transfers can be continued with the installed googleapiclient.
+
+        Parameters:
+        - transfer: The HttpRequest or MediaIoBaseDownload to continue, if already created.
+        - field: The private field of transfer that is set to continue it.
+
+        Returns:
+        True if the private fields used to resume are known to exist.
+        """
+        if cls.CLIENT_MAJOR_VERSION != cls.RESUMABLE_CLIENT_MAJOR_VERSION:
+            return False
+        return transfer is None or hasattr(transfer, field)
+
+    def records_transfer(self, file_size):
+        """
+        Decide whether a transfer is worth recording in the transfer state, which is rewritten on every
+        change: only transfers of more than one chunk can be interrupted halfway and continued.
+
+        Parameters:
+        - file_size: Size of the file in bytes, or None if unknown.
+        """
+        return file_size is None or int(file_size) > self.CHUNK_SIZE
+
+    def upload_file(self, file_path, folder_id, file_id=None):
         try:
             file_name = os.path.basename(file_path)
-            media_body = MediaFileUpload(ConfigurationManager.LOCAL_FILESYSTEM_FOLDER_PATH + file_path, resumable=True)
-            request = self.service.files().create(
-                media_body=media_body,
-                body={
-                    'name': file_name,
-                    'parents': [folder_id]
-                }
-            )
+            local_path = ConfigurationManager.LOCAL_FILESYSTEM_FOLDER_PATH + file_path
+            local_stat = os.stat(local_path)
+            # A changed local file must never continue a session that was started for other contents
+            transfer_key = (file_path, file_id or folder_id, local_stat.st_size, local_stat.st_mtime_ns)
+            started = time.perf_counter()
+            # A file transferred on its own reports on a status line of its own
+            progress = self.progress or ProgressReporter("Uploading", 1, local_stat.st_size)
+
+            from googleapiclient.http import MediaFileUpload
+
+            def new_request():
+                media_body = MediaFileUpload(local_path, chunksize=self.CHUNK_SIZE, resumable=True)
+                if file_id:
+                    # Replacing the contents keeps the file's id, share links and revision history
+                    return self.service.files().update(fileId=file_id, media_body=media_body, fields=self.UPLOAD_FIELDS)
+                return self.service.files().create(
+                    media_body=media_body,
+                    body={
+                        'name': file_name,
+                        'parents': [folder_id]
+                    },
+                    fields=self.UPLOAD_FIELDS
+                )
+
+            request = new_request()
+            session_uri = self.transfers.get_upload(transfer_key)
+            if session_uri and not self.can_resume(request, '_in_error_state'):
+                self.transfers.clear_upload(transfer_key)
+                session_uri = None
+            if session_uri:
+                # Entering the error state makes next_chunk ask Drive how many bytes it already holds,
+                # and continue from there
+                request.resumable_uri = session_uri
+                request._in_error_state = True
+                self.logger.info("Resuming upload", path=file_path)
+
             response = None
-            print(f"===============================\nStarting upload for: {file_name}")
             while response is None:
-                status, response = request.next_chunk()
-            print(f"Upload complete!\nFile path: {file_path}\n===============================")
+                try:
+                    # A failed chunk is retried by the scheduler, resuming from what Drive received
+                    status, response = self.scheduler.next_chunk(request)
+                except HttpError as e:
+                    # The saved session expired; start a fresh one
+                    if not session_uri or e.resp.status not in (404, 410):
+                        raise
+                    self.transfers.clear_upload(transfer_key)
+                    request, session_uri = new_request(), None
+                    continue
+
+                if status is not None:
+                    progress.update(file_path, status.resumable_progress)
+                if response is None and request.resumable_uri != session_uri:
+                    session_uri = request.resumable_uri
+                    self.transfers.set_upload(transfer_key, session_uri)
+
+            self.transfers.clear_upload(transfer_key)
+            self.metrics.record_transfer("upload", time.perf_counter() - started, local_stat.st_size)
+            progress.finish_file(file_path, local_stat.st_size)
+            if progress is not self.progress:
+                progress.close()
+            return response
         except Exception as e:
             # Log the error using the logger
             self.logger.error(f"Error occurred in upload_file: {e}")
@@ -110,109 +708,491 @@ class GoogleDriveHelper:
             # Raise the exception again to notify the caller about the error
             raise e
 
-    def create_folder(self, folder_name, parent_folder_id):
+    def get_executor(self):
+        """
+        Get the pool of worker threads, created on first use with enough threads for the largest of the
+        upload, download and batch worker counts, and kept until close.
+        """
+        with self.executor_lock:
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(max_workers=max(self.UPLOAD_WORKERS, self.DOWNLOAD_WORKERS, self.BATCH_WORKERS, 1),
+                                                   thread_name_prefix="gspace-worker")
+            return self.executor
+
+    def run_in_pool(self, function, tasks, workers):
+        """
+        Run a function over a list of argument tuples on the pool of worker threads.
+
+        Parameters:
+        - function: The function to call for every task.
+        - tasks: List of argument tuples.
+        - workers: Number of worker threads used at once.
+
+        Returns:
+        The list of results, in the same order as tasks. If any task failed, the first error is raised once
+        every task has finished.
+        """
+        if not tasks:
+            return []
+
+        results = [None] * len(tasks)
+        pending = iter(enumerate(tasks))
+        pending_lock = threading.Lock()
+
+        def worker():
+            while True:
+                with pending_lock:
+                    position, task = next(pending, (None, None))
+                if task is None:
+                    return
+                try:
+                    results[position] = function(*task)
+                except Exception as e:
+                    results[position] = e
+
+        executor = self.get_executor()
+        runners = [executor.submit(worker) for _ in range(max(1, min(workers, len(tasks))))]
+        for runner in runners:
+            runner.result()
+
+        errors = [result for result in results if isinstance(result, Exception)]
+        if errors:
+            raise errors[0]
+        return results
+
+    def upload_files(self, file_tasks):
+        """
+        Run upload_file for every task on the pool of upload workers.
+
+        Parameters:
+        - file_tasks: List of upload_file argument tuples (file path, folder id[, file id]).
+
+        Returns:
+        The list of upload responses, in the same order as file_tasks.
+        """
+        if not file_tasks:
+            return []
+
+        with self.upload_progress(file_tasks):
+            return self.run_in_pool(self.upload_file, file_tasks, self.UPLOAD_WORKERS)
+
+    def download_files(self, file_tasks):
+        """
+        Run download_file for every task on the pool of download workers.
+
+        Parameters:
+        - file_tasks: List of download_file argument tuples (output path, drive id[, size, checksum]).
+
+        Returns:
+        The list of bytes downloaded per file, in the same order as file_tasks.
+        """
+        if not file_tasks:
+            return []
+
+        with self.download_progress(file_tasks):
+            return self.run_in_pool(self.download_file, file_tasks, self.DOWNLOAD_WORKERS)
+
+    @contextmanager
+    def upload_progress(self, file_tasks):
+        """
+        Show one status line for the uploads of file_tasks while the block runs.
+
+        Parameters:
+        - file_tasks: List of upload_file argument tuples.
+        """
+        total_bytes = sum(os.path.getsize(ConfigurationManager.LOCAL_FILESYSTEM_FOLDER_PATH + task[0]) for task in file_tasks)
+        self.progress = ProgressReporter("Uploading", len(file_tasks), total_bytes)
         try:
-            folder_metadata = {
-                'name': folder_name,
-                'mimeType': 'application/vnd.google-apps.folder',
-                'parents': [parent_folder_id]
-            }
-            folder = self.service.files().create(body=folder_metadata, fields='id').execute()
-            return folder['id']
+            yield self.progress
+        finally:
+            self.progress.close()
+            self.progress = None
+
+    @contextmanager
+    def download_progress(self, file_tasks):
+        """
+        Show one status line for the downloads of file_tasks while the block runs.
+
+        Parameters:
+        - file_tasks: List of download_file argument tuples; sizes are counted where the tuple has one.
+        """
+        total_bytes = sum(int(task[2] or 0) for task in file_tasks if len(task) > 2)
+        self.progress = ProgressReporter("Downloading", len(file_tasks), total_bytes)
+        try:
+            yield self.progress
+        finally:
+            self.progress.close()
+            self.progress = None
+
+    def close(self):
+        """
+        Release the connections held by the helper: the worker threads and with them their googleapiclient
+        services. Subclasses holding a connection pool close it here too.
+        """
+        with self.executor_lock:
+            if self.executor is not None:
+                self.executor.shutdown()
+                self.executor = None
+
+    def plan_upload_folders(self, gdrive_tree, to_upload):
+        """
+        Create every remote folder a push needs, exactly once, before any file is uploaded.
+
+        Missing folders are collected for the whole push (the ancestors of every addition, and every folder
+        inside added directories), then created level by level with each level sent as parallel batches.
+        The new folders are added to the remote tree, so later lookups reuse them instead of creating
+        duplicates.
+
+        Parameters:
+        - gdrive_tree: The Tree generated from Google Drive, updated with the created folders.
+        - to_upload: List of changes (path, drive id, isDir) to upload.
+
+        Returns:
+        A list of (file path, parent folder id) upload tasks.
+        """
+        try:
+            needed_folders = set()
+            file_paths = []
+            for change in to_upload:
+                path = change[0]
+                path_names = tuple(path.split("/")[1:])
+                needed_folders.update(path_names[:depth] for depth in range(1, len(path_names)))
+
+                local_path = ConfigurationManager.LOCAL_FILESYSTEM_FOLDER_PATH + path
+                if not os.path.isdir(local_path):
+                    file_paths.append(path_names)
+                    continue
+
+                needed_folders.add(path_names)
+                for directory, subdirectories, files in os.walk(local_path):
+                    directory_names = path_names + tuple(name for name in directory[len(local_path):].split("/") if name)
+                    # The same entries the local scan skips: partial downloads, and what the filters exclude
+                    files = [name for name in files if not name.endswith(TransferState.PARTIAL_DOWNLOAD_SUFFIX)]
+                    if self.filter:
+                        # Pruning subdirectories in place keeps os.walk out of excluded folders
+                        subdirectories[:] = [name for name in subdirectories
+                                             if not self.filter.excludes("/".join(directory_names + (name,)), True)]
+                        files = [name for name in files if not self.filter.excludes("/".join(directory_names + (name,)), False)]
+                    needed_folders.update(directory_names + (subdirectory,) for subdirectory in subdirectories)
+                    file_paths.extend(directory_names + (file_name,) for file_name in files)
+
+            self.ensure_folders(gdrive_tree, needed_folders)
+            return [("/" + "/".join(file_names), gdrive_tree.find_node(file_names[:-1]).id) for file_names in file_paths]
         except Exception as e:
             # Log the error using the logger
-            self.logger.error(f"Error occurred in create_folder: {e}")
+            self.logger.error(f"Error occurred in plan_upload_folders: {e}")
             # Optionally, log the full traceback for detailed error information
             self.logger.error(traceback.format_exc())
             # Raise the exception again to notify the caller about the error
             raise e
 
-    def create_folders_for_upload(self, names, parent_folder_id):
+    def ensure_folders(self, gdrive_tree, folders):
+        """
+        Create the remote folders that do not exist yet, level by level, with each level sent as parallel
+        batches, and add them to the remote tree.
+
+        Parameters:
+        - gdrive_tree: The Tree generated from Google Drive, updated with the created folders.
+        - folders: Iterable of folder paths, as tuples of names below the root; every ancestor must be included.
+        """
         try:
-            last_id = parent_folder_id
-            for name in names:
-                folder_metadata = {
-                    'name': name,
-                    'mimeType': 'application/vnd.google-apps.folder',
-                    'parents': [last_id]
-                }
-                folder = self.service.files().create(body=folder_metadata, fields='id').execute()
-                last_id = folder['id']
-            return last_id
+            folder_levels = {}
+            for folder_names in folders:
+                if gdrive_tree.find_node(folder_names) is None:
+                    folder_levels.setdefault(len(folder_names), []).append(folder_names)
+
+            for depth in sorted(folder_levels):
+                # Parents are either already in Drive or were created by the previous level
+                parents = {folder_names: gdrive_tree.find_node(folder_names[:-1]) for folder_names in folder_levels[depth]}
+                created = self.create_folders([(folder_names, folder_names[-1], parent_node.id)
+                                               for folder_names, parent_node in parents.items()])
+                for folder_names, folder_id in created.items():
+                    gdrive_tree.add_child(parents[folder_names], folder_names[-1], folder_id, isDir=True)
         except Exception as e:
             # Log the error using the logger
-            self.logger.error(f"Error occurred in create_folders_for_upload: {e}")
+            self.logger.error(f"Error occurred in ensure_folders: {e}")
             # Optionally, log the full traceback for detailed error information
             self.logger.error(traceback.format_exc())
             # Raise the exception again to notify the caller about the error
             raise e
 
-    def upload_folder(self, folder_path, parent_folder_id):
+    @Metrics.timed("remote_moves")
+    def move_files(self, gdrive_tree, moves):
+        """
+        Apply moves and renames to Drive as metadata-only updates, using batch requests, and move the nodes
+        in the remote tree accordingly.
+
+        Moves are applied by depth of their destination, so a destination inside a folder moved or created
+        earlier in the same push already exists; missing destination folders are created.
+
+        Parameters:
+        - gdrive_tree: The Tree generated from Google Drive, updated for every move.
+        - moves: List of moves (old path, new path, drive id, isDir).
+        """
         try:
-            folder_name = os.path.basename(folder_path)
-            folder_id = self.create_folder(folder_name, parent_folder_id)
+            move_levels = {}
+            for move in moves:
+                move_levels.setdefault(move[1].count("/"), []).append(move)
 
-            for item in os.listdir(ConfigurationManager.LOCAL_FILESYSTEM_FOLDER_PATH + folder_path):
-                item_path = os.path.join(folder_path, item)
-                if os.path.isfile(ConfigurationManager.LOCAL_FILESYSTEM_FOLDER_PATH + item_path):
-                    self.upload_file(item_path, folder_id)
-                elif os.path.isdir(ConfigurationManager.LOCAL_FILESYSTEM_FOLDER_PATH + item_path):
-                    self.upload_folder(item_path, folder_id)
+            for depth in sorted(move_levels):
+                destinations = [tuple(new_path.split("/")[1:]) for _, new_path, _, _ in move_levels[depth]]
+                self.ensure_folders(gdrive_tree, {names[:level] for names in destinations for level in range(1, len(names))})
 
-            print(f"===============================\nUpload complete for folder: {folder_name}.\n===============================")
+                calls, targets = [], {}
+                for (old_path, new_path, file_id, isDir), names in zip(move_levels[depth], destinations):
+                    node = gdrive_tree.find_node_by_id(file_id)
+                    new_parent = gdrive_tree.find_node(names[:-1])
+                    arguments = {'fileId': file_id, 'body': {'name': names[-1]}, 'fields': 'id'}
+                    if node.parent is not new_parent:
+                        arguments.update(addParents=new_parent.id, removeParents=node.parent.id)
+                    calls.append((file_id, arguments))
+                    targets[file_id] = (node, new_parent, names[-1], old_path, new_path)
+
+                results = self.execute_batch("update", calls)
+                for file_id, (response, exception) in results.items():
+                    if exception is not None:
+                        continue
+                    node, new_parent, name, old_path, new_path = targets[file_id]
+                    gdrive_tree.detach(node)
+                    node.value = name
+                    gdrive_tree.attach(new_parent, node)
+                    print(f"Moved {old_path} -> {new_path}")
+
+                self.report_batch_failures("Move", results, describe=lambda file_id: targets[file_id][3])
         except Exception as e:
             # Log the error using the logger
-            self.logger.error(f"Error occurred in upload_folder: {e}")
+            self.logger.error(f"Error occurred in move_files: {e}")
             # Optionally, log the full traceback for detailed error information
             self.logger.error(traceback.format_exc())
             # Raise the exception again to notify the caller about the error
             raise e
 
-    def upload_helper(self, gdrive_tree, folder_path):
+    @Metrics.timed("uploads")
+    def upload_many(self, gdrive_tree, to_upload, checksum_files=None):
+        """
+        Upload a list of additions using a pool of upload workers. Files whose contents already exist in
+        Google Drive are copied there on the server instead of being uploaded again.
+
+        Parameters:
+        - gdrive_tree: The Tree generated from Google Drive, updated with the uploaded files.
+        - to_upload: List of changes (path, drive id, isDir) to upload.
+        - checksum_files: Function returning the MD5 checksums of a list of paths relative to the local
+          folder, such as FilesystemHelper.checksum_files; defaults to hashing the files directly.
+        """
         try:
-            folder_path = folder_path[0]
-            to_upload_path = folder_path.split("/")
-            nearest_node, folders_already_created = gdrive_tree.get_node(to_upload_path[1:])
-            final_id = nearest_node.id
-            if folders_already_created != len(to_upload_path[1:-1]):
-                final_id = self.create_folders_for_upload(to_upload_path[folders_already_created + 1:], nearest_node.id)
-            self.upload_file(folder_path, final_id) if not os.path.isdir(
-                ConfigurationManager.LOCAL_FILESYSTEM_FOLDER_PATH + folder_path) else self.upload_folder(
-                folder_path, final_id)
+            file_tasks = self.plan_upload_folders(gdrive_tree, to_upload)
+            if self.DEDUPLICATE_UPLOADS:
+                file_tasks = self.copy_duplicates(gdrive_tree, file_tasks, checksum_files)
+            responses = self.upload_files(file_tasks)
+
+            for (file_path, folder_id), response in zip(file_tasks, responses):
+                parent_node = gdrive_tree.find_node_by_id(folder_id)
+                if parent_node is not None and response:
+                    gdrive_tree.add_child(parent_node, os.path.basename(file_path), response.get('id'), isDir=False,
+                                          fileSize=int(response.get('size', 0)), checksum=response.get('md5Checksum'))
         except Exception as e:
             # Log the error using the logger
-            self.logger.error(f"Error occurred in upload_helper: {e}")
+            self.logger.error(f"Error occurred in upload_many: {e}")
             # Optionally, log the full traceback for detailed error information
             self.logger.error(traceback.format_exc())
             # Raise the exception again to notify the caller about the error
             raise e
 
-    def hard_delete_file(self, file_id):
+    def copy_duplicates(self, gdrive_tree, file_tasks, checksum_files=None):
+        """
+        Copy files whose contents already exist under the Drive root with files().copy, using batch requests,
+        instead of uploading their bytes. Only files sharing their size with a remote file are hashed.
+
+        Parameters:
+        - gdrive_tree: The Tree generated from Google Drive, updated with the copies.
+        - file_tasks: List of (file path, parent folder id) upload tasks.
+        - checksum_files: Function returning the MD5 checksums of a list of paths relative to the local folder.
+
+        Returns:
+        The upload tasks that still have to be uploaded.
+        """
         try:
-            self.service.files().delete(fileId=file_id).execute()
-            print(f"File/Folder with ID {file_id} deleted successfully.")
+            # md5Checksum -> Drive id of a file with those contents, from the remote listing
+            ids_by_contents = {}
+            for node in gdrive_tree.nodes_by_id.values():
+                if not node.isDir and node.checksum and int(node.fileSize):
+                    ids_by_contents.setdefault((int(node.fileSize), node.checksum), node.id)
+            remote_sizes = {size for size, _ in ids_by_contents}
+
+            candidates = []
+            for task in file_tasks:
+                size = os.path.getsize(ConfigurationManager.LOCAL_FILESYSTEM_FOLDER_PATH + task[0])
+                if size in remote_sizes:
+                    candidates.append((task, size))
+            if not candidates:
+                return file_tasks
+
+            if checksum_files is None:
+                checksums = LocalHasher().hash_files([ConfigurationManager.LOCAL_FILESYSTEM_FOLDER_PATH + task[0]
+                                                      for task, _ in candidates])
+            else:
+                checksums = checksum_files([task[0][1:] for task, _ in candidates])
+
+            calls = []
+            for (task, size), checksum in zip(candidates, checksums):
+                source_id = ids_by_contents.get((size, checksum))
+                if source_id:
+                    calls.append((task, {'fileId': source_id, 'fields': self.UPLOAD_FIELDS,
+                                         'body': {'name': os.path.basename(task[0]), 'parents': [task[1]]}}))
+            if not calls:
+                return file_tasks
+
+            results = self.execute_batch("copy", calls)
+            copied = set()
+            for (file_path, folder_id), (response, exception) in results.items():
+                if exception is not None:
+                    # Not copyable, e.g. owned by someone else; the file is uploaded instead
+                    self.logger.info(f"Copy failed for {file_path}, uploading instead: {exception}")
+                    continue
+                copied.add((file_path, folder_id))
+                gdrive_tree.add_child(gdrive_tree.find_node_by_id(folder_id), os.path.basename(file_path), response.get('id'),
+                                      isDir=False, fileSize=int(response.get('size', 0)), checksum=response.get('md5Checksum'))
+                print(f"Copied in Google Drive instead of uploading: {file_path}")
+
+            return [task for task in file_tasks if task not in copied]
         except Exception as e:
             # Log the error using the logger
-            self.logger.error(f"Error occurred in hard_delete_file: {e}")
+            self.logger.error(f"Error occurred in copy_duplicates: {e}")
             # Optionally, log the full traceback for detailed error information
             self.logger.error(traceback.format_exc())
             # Raise the exception again to notify the caller about the error
             raise e
 
-    def delete_file(self, file_id, gdrive_tree=None):
+    @Metrics.timed("updates")
+    def update_many(self, gdrive_tree, to_update):
+        """
+        Upload new contents for existing Drive files in place, using a pool of upload workers.
+
+        Parameters:
+        - gdrive_tree: The Tree generated from Google Drive, whose nodes are updated with the new size and checksum.
+        - to_update: List of changes (path, drive id, isDir) of modified files.
+        """
         try:
-            body_value = {'trashed': True}
-            self.service.files().update(fileId=file_id, body=body_value).execute()
+            file_tasks = [(path, None, drive_id) for path, drive_id, isDir in to_update]
+            responses = self.upload_files(file_tasks)
 
-            parent_node_of_file = gdrive_tree.find_parent_node_by_id(file_id)
-            if parent_node_of_file:
-                for file_name in parent_node_of_file.children:
-                    if(parent_node_of_file.children[file_name].id == file_id):
-                        del parent_node_of_file.children[file_name]
-                        break
+            for (file_path, _, file_id), response in zip(file_tasks, responses):
+                node = gdrive_tree.find_node_by_id(file_id)
+                if node is not None and response:
+                    node.fileSize = int(response.get('size', 0))
+                    node.checksum = response.get('md5Checksum')
+        except Exception as e:
+            # Log the error using the logger
+            self.logger.error(f"Error occurred in update_many: {e}")
+            # Optionally, log the full traceback for detailed error information
+            self.logger.error(traceback.format_exc())
+            # Raise the exception again to notify the caller about the error
+            raise e
+
+    def execute_batch(self, method, calls):
+        """
+        Execute independent files() calls as Drive batch requests, up to BATCH_SIZE calls per HTTP request
+        and up to BATCH_WORKERS batches at a time. Items failing with a retryable error, such as a rate limit,
+        are sent again in a later batch after a backoff.
+
+        Parameters:
+        - method: Name of the files() method to call, e.g. "update".
+        - calls: List of (key, keyword arguments) pairs; keys identify the item each call was made for.
+
+        Returns:
+        A dictionary mapping every key to a tuple (response, exception), one of which is None.
+        """
+        results = {}
+
+        def execute_chunk(chunk):
+            def callback(request_id, response, exception):
+                results[chunk[int(request_id)][0]] = (response, exception)
+                self.metrics.increment("api_calls_total", endpoint=f"drive.files.{method}",
+                                       outcome="ok" if exception is None else self.scheduler.outcome(exception))
+
+            def execute():
+                # Requests are built from this thread's service, so the batch uses this thread's connection
+                files = self.service.files()
+                batch = self.service.new_batch_http_request(callback=callback)
+                for position, (key, arguments) in enumerate(chunk):
+                    batch.add(getattr(files, method)(**arguments), request_id=str(position))
+                batch.execute()
+
+            # Every call in the batch counts against the Drive quota
+            self.scheduler.call(execute, cost=len(chunk), description=f"batch {method}")
+
+        attempt = 0
+        while calls:
+            # Batches are independent, so several of them are sent at once
+            chunks = [(calls[start:start + self.BATCH_SIZE],) for start in range(0, len(calls), self.BATCH_SIZE)]
+            self.run_in_pool(execute_chunk, chunks, self.BATCH_WORKERS)
+
+            retry = [(key, arguments) for key, arguments in calls
+                     if results[key][1] is not None and self.scheduler.is_retryable(results[key][1])]
+            if not retry or attempt >= self.scheduler.max_retries:
+                break
+            throttled = sum(1 for key, arguments in retry if self.scheduler.is_throttled(results[key][1]))
+            if throttled:
+                self.metrics.increment("api_throttled_total", throttled, endpoint=f"drive.files.{method}")
+                self.scheduler.record_throttled()
+            self.metrics.increment("api_retries_total", len(retry), endpoint=f"drive.files.{method}")
+            self.logger.info(f"Retrying {len(retry)} batch {method} calls (retry {attempt + 1} of {self.scheduler.max_retries})")
+            self.scheduler.backoff(attempt)
+            attempt, calls = attempt + 1, retry
+
+        return results
 
+    def report_batch_failures(self, operation, results, describe=str):
+        """
+        Log every failed item of a batch and raise a single error naming them.
 
-            print(f"File/Folder with ID {file_id} moved to trash successfully.")
+        Parameters:
+        - operation: Name of the operation, used in messages.
+        - results: Dictionary returned by execute_batch.
+        - describe: Function turning a key into a readable description of the item.
+        """
+        failures = [(key, exception) for key, (response, exception) in results.items() if exception is not None]
+        for key, exception in failures:
+            self.logger.error(f"{operation} failed for {describe(key)}: {exception}")
+        if failures:
+            raise RuntimeError(f"{operation} failed for {len(failures)} of {len(results)} items, "
+                               f"first: {describe(failures[0][0])}: {failures[0][1]}")
+
+    def hard_delete_file(self, file_id):
+        try:
+            self.hard_delete_files([file_id])
+        except Exception as e:
+            # Log the error using the logger
+            self.logger.error(f"Error occurred in hard_delete_file: {e}")
+            # Optionally, log the full traceback for detailed error information
+            self.logger.error(traceback.format_exc())
+            # Raise the exception again to notify the caller about the error
+            raise e
+
+    def hard_delete_files(self, file_ids):
+        """
+        Permanently delete files and folders, using batch requests.
+
+        Parameters:
+        - file_ids: List of Drive ids to delete.
+        """
+        try:
+            results = self.execute_batch("delete", [(file_id, {'fileId': file_id}) for file_id in file_ids])
+            for file_id, (response, exception) in results.items():
+                if exception is None:
+                    print(f"File/Folder with ID {file_id} deleted successfully.")
+            self.report_batch_failures("Delete", results, describe=lambda file_id: f"ID {file_id}")
+        except Exception as e:
+            # Log the error using the logger
+            self.logger.error(f"Error occurred in hard_delete_files: {e}")
+            # Optionally, log the full traceback for detailed error information
+            self.logger.error(traceback.format_exc())
+            # Raise the exception again to notify the caller about the error
+            raise e
+
+    def delete_file(self, file_id, gdrive_tree=None):
+        try:
+            self.delete_files([file_id], gdrive_tree)
         except Exception as e:
             # Log the error using the logger
             self.logger.error(f"Error occurred in delete_file: {e}")
@@ -221,64 +1201,154 @@ class GoogleDriveHelper:
             # Raise the exception again to notify the caller about the error
             raise e
 
-    def download_file(self, output_path, drive_file_id):
+    @Metrics.timed("remote_deletions")
+    def delete_files(self, file_ids, gdrive_tree=None):
+        """
+        Move files and folders to the trash using batch requests, and remove the trashed ones from the tree.
+
+        Parameters:
+        - file_ids: List of Drive ids to trash.
+        - gdrive_tree: The Tree generated from Google Drive, updated for every item trashed successfully.
+        """
         try:
-            request = self.service.files().get_media(fileId=drive_file_id)
+            results = self.execute_batch("update", [(file_id, {'fileId': file_id, 'body': {'trashed': True}})
+                                                    for file_id in file_ids])
 
-            dir_path = (ConfigurationManager.LOCAL_FILESYSTEM_FOLDER_PATH + output_path).removesuffix(
-                os.path.basename((ConfigurationManager.LOCAL_FILESYSTEM_FOLDER_PATH + output_path)))
-            os.makedirs(dir_path, exist_ok=True)
+            def describe(file_id):
+                node = gdrive_tree.find_node_by_id(file_id) if gdrive_tree else None
+                return f"/{'/'.join(gdrive_tree.path_of(node))} (ID {file_id})" if node is not None else f"ID {file_id}"
 
-            with io.FileIO(ConfigurationManager.LOCAL_FILESYSTEM_FOLDER_PATH + output_path, 'wb') as output_file:
-                downloader = MediaIoBaseDownload(output_file, request)
-                done = False
+            for file_id, (response, exception) in results.items():
+                if exception is not None:
+                    continue
+                print(f"File/Folder {describe(file_id)} moved to trash successfully.")
+                node = gdrive_tree.find_node_by_id(file_id) if gdrive_tree else None
+                if node is not None:
+                    gdrive_tree.detach(node)
+
+            self.report_batch_failures("Trash", results, describe=describe)
+        except Exception as e:
+            # Log the error using the logger
+            self.logger.error(f"Error occurred in delete_files: {e}")
+            # Optionally, log the full traceback for detailed error information
+            self.logger.error(traceback.format_exc())
+            # Raise the exception again to notify the caller about the error
+            raise e
 
-                print(f"===============================\nStarting download for: {output_path.split('/')[-1]}")
+    def create_folders(self, folders):
+        """
+        Create several folders whose parents already exist, using batch requests.
 
-                while not done:
-                    status, done = downloader.next_chunk()
+        Parameters:
+        - folders: List of (key, folder name, parent folder id) tuples.
 
-            print(f"Download complete!\nFile saved to: {output_path}\n===============================")
+        Returns:
+        A dictionary mapping every key to the Drive id of the folder created for it.
+        """
+        try:
+            results = self.execute_batch("create", [(key, {'body': {
+                'name': folder_name,
+                'mimeType': self.FOLDER_MIME_TYPE,
+                'parents': [parent_folder_id]
+            }, 'fields': 'id'}) for key, folder_name, parent_folder_id in folders])
+            self.report_batch_failures("Folder creation", results)
+            return {key: response['id'] for key, (response, exception) in results.items()}
         except Exception as e:
             # Log the error using the logger
-            self.logger.error(f"Error occurred in download_file: {e}")
+            self.logger.error(f"Error occurred in create_folders: {e}")
             # Optionally, log the full traceback for detailed error information
             self.logger.error(traceback.format_exc())
             # Raise the exception again to notify the caller about the error
             raise e
 
-    def download_folder(self, output_path, drive_folder_id):
+    def download_file(self, output_path, drive_file_id, file_size=None, checksum=None):
         try:
-            os.makedirs(ConfigurationManager.LOCAL_FILESYSTEM_FOLDER_PATH + output_path, exist_ok=True)
+            local_path = ConfigurationManager.LOCAL_FILESYSTEM_FOLDER_PATH + output_path
+            os.makedirs(os.path.dirname(local_path), exist_ok=True)
 
-            results = self.service.files().list(
-                q=f"parents in '{drive_folder_id}'",
-                fields="files(id, name, mimeType)").execute()
-            items = results.get('files', [])
+            # Data goes to a partial file whose size is the offset to resume from, and replaces the
+            # target only once complete
+            partial_path = local_path + TransferState.PARTIAL_DOWNLOAD_SUFFIX
+            version = (drive_file_id, file_size, checksum)
+            resume_offset = 0
+            if os.path.exists(partial_path) and self.transfers.get_download(partial_path) == version and self.can_resume():
+                resume_offset = os.path.getsize(partial_path)
+            elif self.records_transfer(file_size):
+                self.transfers.set_download(partial_path, version)
 
-            for item in items:
-                if item['mimeType'] == 'application/vnd.google-apps.folder':
-                    subfolder_path = os.path.join(output_path, item['name'])
-                    self.download_folder(subfolder_path, item['id'])
-                else:
-                    file_path = os.path.join(output_path, item['name'])
-                    self.download_file(file_path, item['id'])
+            started = time.perf_counter()
+            progress = self.progress or ProgressReporter("Downloading", 1, int(file_size or 0))
+            with io.FileIO(partial_path, 'ab' if resume_offset else 'wb') as output_file:
+                if file_size is None or resume_offset < int(file_size) or int(file_size) == 0:
+                    from googleapiclient.http import MediaIoBaseDownload
+                    request = self.service.files().get_media(fileId=drive_file_id)
+                    downloader = MediaIoBaseDownload(output_file, request, chunksize=self.CHUNK_SIZE)
+                    # The downloader asks for its next chunk with an HTTP Range header starting at this offset
+                    downloader._progress = resume_offset
+                    done = False
+
+                    if resume_offset:
+                        self.logger.info("Resuming download", path=output_path, offset=resume_offset)
+
+                    while not done:
+                        status, done = self.scheduler.next_chunk(downloader)
+                        progress.update(output_path, status.resumable_progress)
 
+                downloaded_bytes = output_file.tell() - resume_offset
+
+            os.replace(partial_path, local_path)
+            self.transfers.clear_download(partial_path)
+            self.metrics.record_transfer("download", time.perf_counter() - started, downloaded_bytes)
+            progress.finish_file(output_path, resume_offset + downloaded_bytes)
+            if progress is not self.progress:
+                progress.close()
+            return downloaded_bytes
         except Exception as e:
             # Log the error using the logger
-            self.logger.error(f"Error occurred in download_folder: {e}")
+            self.logger.error(f"Error occurred in download_file: {e}")
             # Optionally, log the full traceback for detailed error information
             self.logger.error(traceback.format_exc())
             # Raise the exception again to notify the caller about the error
             raise e
 
-    def download_helper(self, output_path, drive_folder_id, isDir):
+    @Metrics.timed("downloads")
+    def download_many(self, gdrive_tree, to_download):
+        """
+        Download a list of additions and modifications using a pool of download workers.
+
+        Folder contents are taken from the remote tree instead of being listed again, and every local
+        directory is created up front, so the workers only ever write files.
+
+        Parameters:
+        - gdrive_tree: The Tree generated from Google Drive.
+        - to_download: List of changes (path, drive id, isDir) to download.
+        """
         try:
-            self.download_file(output_path, drive_folder_id) if not isDir else self.download_folder(output_path,
-                                                                                                     drive_folder_id)
+            file_tasks = []
+            for path, drive_id, isDir in to_download:
+                if not isDir:
+                    node, _ = gdrive_tree.get_node(path.split("/")[1:])
+                    file_tasks.append((path, drive_id, node.fileSize, node.checksum) if node.id == drive_id else (path, drive_id))
+                    continue
+
+                folder_node, _ = gdrive_tree.get_node(path.split("/")[1:])
+                pending = [(path, folder_node)]
+                while pending:
+                    folder_path, node = pending.pop()
+                    os.makedirs(ConfigurationManager.LOCAL_FILESYSTEM_FOLDER_PATH + folder_path, exist_ok=True)
+                    for name, child in node.children.items():
+                        if child.isDir:
+                            pending.append((f"{folder_path}/{name}", child))
+                        else:
+                            file_tasks.append((f"{folder_path}/{name}", child.id, child.fileSize, child.checksum))
+
+            for directory in {os.path.dirname(task[0]) for task in file_tasks}:
+                os.makedirs(ConfigurationManager.LOCAL_FILESYSTEM_FOLDER_PATH + directory, exist_ok=True)
+
+            self.download_files(file_tasks)
         except Exception as e:
             # Log the error using the logger
-            self.logger.error(f"Error occurred in download_helper: {e}")
+            self.logger.error(f"Error occurred in download_many: {e}")
             # Optionally, log the full traceback for detailed error information
             self.logger.error(traceback.format_exc())
             # Raise the exception again to notify the caller about the error
@@ -0,0 +1,76 @@
+import hashlib
+import os
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from Logger import Logger
+
+HASH_BUFFER_SIZE = 4 * 1024 * 1024
+
+def md5_file(path):
+    """
+    Compute the MD5 checksum of a file, reading it through one large reusable buffer.
+
+    Parameters:
+    - path: Path of the file to hash.
+
+    Returns:
+    The hexadecimal MD5 digest, in the same format as Drive's md5Checksum.
+    """
+    digest = hashlib.md5()
+    buffer = bytearray(HASH_BUFFER_SIZE)
+    view = memoryview(buffer)
+    with open(path, 'rb', buffering=0) as file:
+        while True:
+            read = file.readinto(buffer)
+            if not read:
+                break
+            digest.update(view[:read])
+    return digest.hexdigest()
+
+class LocalHasher:
+    """
+    Hashes local files on a process pool, so a cold run over large trees uses every core.
+
+    Usage:
+    hasher = LocalHasher()
+    checksums = hasher.hash_files(["/path/a.bin", "/path/b.bin"])
+    """
+
+    logger = Logger()
+
+    # Below this much data the cost of starting worker processes outweighs the parallelism
+    MIN_PARALLEL_BYTES = 64 * 1024 * 1024
+
+    def __init__(self, workers=None):
+        """
+        Initialize LocalHasher.
+
+        Parameters:
+        - workers: Number of hashing processes; defaults to the number of CPUs.
+        """
+        self.workers = workers or os.cpu_count() or 1
+
+    def hash_files(self, paths, total_size=None):
+        """
+        Hash a list of files.
+
+        Parameters:
+        - paths: Paths of the files to hash.
+        - total_size: Combined size of the files in bytes, if known, used to decide whether to fan out.
+
+        Returns:
+        A list of hexadecimal MD5 digests, in the same order as paths.
+        """
+        try:
+            if self.workers == 1 or len(paths) < 2 or (total_size is not None and total_size < self.MIN_PARALLEL_BYTES):
+                return [md5_file(path) for path in paths]
+
+            with ProcessPoolExecutor(max_workers=self.workers) as executor:
+                return list(executor.map(md5_file, paths, chunksize=max(1, len(paths) // (self.workers * 8))))
+        except Exception as e:
+            # Log the error using the logger
+            self.logger.error(f"Error occurred in hash_files: {e}")
+            # Optionally, log the full traceback for detailed error information
+            self.logger.error(traceback.format_exc())
+            # Raise the exception again to notify the caller about the error
+            raise e
@@ -0,0 +1,242 @@
+import os
+import sqlite3
+import traceback
+import ConfigurationManager
+from Logger import Logger
+
+class LocalIndex:
+    """
+    An on-disk SQLite index of the local filesystem, storing each directory's mtime and its entries,
+    so a rescan can reuse the records of directories that have not changed.
+
+    Directories are keyed by their path relative to the local folder ("" for the root). Each entry is a
+    tuple (name, is_dir, size, mtime_ns, inode).
+
+    File checksums are cached by (inode, size, mtime_ns), so a file is only hashed again once it changed.
+
+    The entries as they were at the last successful push, pull or sync are kept apart, as the baseline
+    local moves are detected against; scans that change nothing, like fetch, do not advance it.
+
+    Usage:
+    index = LocalIndex()
+    directories = index.load()
+    index.save(scanned_directories, directories)
+    checksums = index.load_checksums()
+    index.mark_synced()
+    baseline = index.load_synced()
+    """
+
+    logger = Logger()
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS directories (
+            path TEXT PRIMARY KEY,
+            mtime_ns INTEGER NOT NULL
+        ) WITHOUT ROWID;
+        CREATE TABLE IF NOT EXISTS entries (
+            directory TEXT NOT NULL,
+            name TEXT NOT NULL,
+            is_dir INTEGER NOT NULL,
+            size INTEGER NOT NULL,
+            mtime_ns INTEGER NOT NULL,
+            inode INTEGER NOT NULL,
+            PRIMARY KEY (directory, name)
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS entries_by_inode ON entries (inode);
+        CREATE TABLE IF NOT EXISTS synced_entries (
+            directory TEXT NOT NULL,
+            name TEXT NOT NULL,
+            is_dir INTEGER NOT NULL,
+            size INTEGER NOT NULL,
+            mtime_ns INTEGER NOT NULL,
+            inode INTEGER NOT NULL,
+            PRIMARY KEY (directory, name)
+        ) WITHOUT ROWID;
+        CREATE TABLE IF NOT EXISTS checksums (
+            inode INTEGER NOT NULL,
+            size INTEGER NOT NULL,
+            mtime_ns INTEGER NOT NULL,
+            md5 TEXT NOT NULL,
+            PRIMARY KEY (inode, size, mtime_ns)
+        ) WITHOUT ROWID;
+    """
+
+    def __init__(self, database_path=None):
+        """
+        Initialize LocalIndex.
+
+        Parameters:
+        - database_path: Path of the SQLite database, by default inside the state folder.
+        """
+        self.DATABASE_PATH = database_path or os.path.join(ConfigurationManager.STATE_FOLDER_PATH, "local_index.sqlite3")
+
+    def connect(self):
+        """
+        Open the index database, creating it and its tables when needed.
+
+        Returns:
+        An open sqlite3 connection.
+        """
+        os.makedirs(os.path.dirname(self.DATABASE_PATH) or ".", exist_ok=True)
+        connection = sqlite3.connect(self.DATABASE_PATH)
+        connection.execute("PRAGMA journal_mode = WAL")
+        connection.execute("PRAGMA synchronous = NORMAL")
+        connection.executescript(self.SCHEMA)
+        return connection
+
+    def load(self):
+        """
+        Load every indexed directory.
+
+        Returns:
+        A dictionary mapping a relative directory path to a tuple (mtime_ns, list of entries).
+        """
+        try:
+            directories = {}
+            connection = self.connect()
+            try:
+                for path, mtime_ns in connection.execute("SELECT path, mtime_ns FROM directories"):
+                    directories[path] = (mtime_ns, [])
+                for directory, name, is_dir, size, mtime_ns, inode in connection.execute(
+                        "SELECT directory, name, is_dir, size, mtime_ns, inode FROM entries ORDER BY directory, name"):
+                    if directory in directories:
+                        directories[directory][1].append((name, bool(is_dir), size, mtime_ns, inode))
+            finally:
+                connection.close()
+            return directories
+        except sqlite3.DatabaseError as e:
+            # A damaged index only costs a full rescan
+            self.logger.error(f"Ignoring unreadable local index {self.DATABASE_PATH}: {e}")
+            return {}
+
+    def save(self, scanned, previous):
+        """
+        Write the directories scanned in this run, rewriting only those that changed.
+
+        Parameters:
+        - scanned: Dictionary of the directories seen in this run, in the format returned by load.
+        - previous: Dictionary returned by load at the start of the run.
+        """
+        try:
+            connection = self.connect()
+            try:
+                with connection:
+                    for path in previous.keys() - scanned.keys():
+                        connection.execute("DELETE FROM directories WHERE path = ?", (path,))
+                        connection.execute("DELETE FROM entries WHERE directory = ?", (path,))
+
+                    for path, record in scanned.items():
+                        if previous.get(path) == record:
+                            continue
+
+                        mtime_ns, entries = record
+                        connection.execute("INSERT OR REPLACE INTO directories (path, mtime_ns) VALUES (?, ?)", (path, mtime_ns))
+                        connection.execute("DELETE FROM entries WHERE directory = ?", (path,))
+                        connection.executemany(
+                            "INSERT INTO entries (directory, name, is_dir, size, mtime_ns, inode) VALUES (?, ?, ?, ?, ?, ?)",
+                            ((path, name, int(is_dir), size, entry_mtime_ns, inode)
+                             for name, is_dir, size, entry_mtime_ns, inode in entries))
+            finally:
+                connection.close()
+        except Exception as e:
+            # Log the error using the logger
+            self.logger.error(f"Error occurred in save: {e}")
+            # Optionally, log the full traceback for detailed error information
+            self.logger.error(traceback.format_exc())
+            # Raise the exception again to notify the caller about the error
+            raise e
+
+    def mark_synced(self):
+        """
+        Make the entries of the latest scan the baseline of the next move detection. Called once a push,
+        pull or sync has brought both sides in line.
+        """
+        try:
+            connection = self.connect()
+            try:
+                with connection:
+                    connection.execute("DELETE FROM synced_entries")
+                    connection.execute("""
+                        INSERT INTO synced_entries (directory, name, is_dir, size, mtime_ns, inode)
+                        SELECT directory, name, is_dir, size, mtime_ns, inode FROM entries
+                    """)
+            finally:
+                connection.close()
+        except Exception as e:
+            # Log the error using the logger
+            self.logger.error(f"Error occurred in mark_synced: {e}")
+            # Optionally, log the full traceback for detailed error information
+            self.logger.error(traceback.format_exc())
+            # Raise the exception again to notify the caller about the error
+            raise e
+
+    def load_synced(self):
+        """
+        Load the entries saved by the last mark_synced.
+
+        Returns:
+        A dictionary mapping a relative directory path to a tuple (None, list of entries), in the format
+        returned by load, or an empty dictionary when nothing was synced yet.
+        """
+        try:
+            directories = {}
+            connection = self.connect()
+            try:
+                for directory, name, is_dir, size, mtime_ns, inode in connection.execute(
+                        "SELECT directory, name, is_dir, size, mtime_ns, inode FROM synced_entries ORDER BY directory, name"):
+                    directories.setdefault(directory, (None, []))[1].append((name, bool(is_dir), size, mtime_ns, inode))
+            finally:
+                connection.close()
+            return directories
+        except sqlite3.DatabaseError as e:
+            # Without a baseline, moves are still found by contents
+            self.logger.error(f"Ignoring unreadable synced entries in {self.DATABASE_PATH}: {e}")
+            return {}
+
+    def load_checksums(self):
+        """
+        Load every cached file checksum.
+
+        Returns:
+        A dictionary mapping (inode, size, mtime_ns) to the hexadecimal MD5 of the file.
+        """
+        try:
+            connection = self.connect()
+            try:
+                return {(inode, size, mtime_ns): md5 for inode, size, mtime_ns, md5 in
+                        connection.execute("SELECT inode, size, mtime_ns, md5 FROM checksums")}
+            finally:
+                connection.close()
+        except sqlite3.DatabaseError as e:
+            # A damaged cache only costs hashing again
+            self.logger.error(f"Ignoring unreadable checksum cache {self.DATABASE_PATH}: {e}")
+            return {}
+
+    def save_checksums(self, checksums):
+        """
+        Cache newly computed checksums, and drop those of files that no longer exist in their indexed state.
+
+        Parameters:
+        - checksums: Dictionary mapping (inode, size, mtime_ns) to the hexadecimal MD5 of the file.
+        """
+        try:
+            connection = self.connect()
+            try:
+                with connection:
+                    connection.executemany("INSERT OR REPLACE INTO checksums (inode, size, mtime_ns, md5) VALUES (?, ?, ?, ?)",
+                                           ((inode, size, mtime_ns, md5) for (inode, size, mtime_ns), md5 in checksums.items()))
+                    connection.execute("""
+                        DELETE FROM checksums WHERE NOT EXISTS (
+                            SELECT 1 FROM entries
+                            WHERE entries.inode = checksums.inode AND entries.size = checksums.size
+                              AND entries.mtime_ns = checksums.mtime_ns)
+                    """)
+            finally:
+                connection.close()
+        except Exception as e:
+            # Log the error using the logger
+            self.logger.error(f"Error occurred in save_checksums: {e}")
+            # Optionally, log the full traceback for detailed error information
+            self.logger.error(traceback.format_exc())
+            # Raise the exception again to notify the caller about the error
+            raise e
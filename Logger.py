@@ -1,39 +1,66 @@
+import atexit
 import logging
+import logging.handlers
+import queue
 import ConfigurationManager
 from datetime import datetime
 
+class StructuredFormatter(logging.Formatter):
+    """
+    Formats records like logging.Formatter, followed by the key=value fields passed to Logger.
+    """
+
+    def format(self, record):
+        text = super().format(record)
+        fields = getattr(record, 'fields', None)
+        if fields:
+            text += " | " + " ".join(f"{key}={value}" for key, value in fields.items())
+        return text
+
 class Logger:
     """
     A simple logger class for logging information and errors to a file.
 
+    Records are put on a queue by the calling thread and written to the file by a background thread, so
+    transfer workers never wait on the disk to log.
+
     Usage:
     logger = Logger()
     logger.info("This is an information message.")
+    logger.info("Retrying call", endpoint="drive.files.list", attempt=2)
     logger.error("This is an error message.")
     """
 
     logger = logging.getLogger(__name__)
-    file_handler = logging.FileHandler(ConfigurationManager.LOGS_FOLDER_PATH + "/" + datetime.now().strftime("%d-%m-%y") + ".log")
+    # delay=True opens the log file on the first message instead of when the module is imported
+    file_handler = logging.FileHandler(ConfigurationManager.LOGS_FOLDER_PATH + "/" + datetime.now().strftime("%d-%m-%y") + ".log", delay=True)
     logger.setLevel(logging.INFO)
-    formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s', datefmt='%d-%m-%y %I:%M:%S %p')
+    formatter = StructuredFormatter('%(asctime)s - %(levelname)s - %(threadName)s - %(message)s', datefmt='%d-%m-%y %I:%M:%S %p')
     file_handler.setFormatter(formatter)
-    logger.addHandler(file_handler)
-    file_handler.close()
 
-    def info(self, message):
+    log_queue = queue.SimpleQueue()
+    logger.addHandler(logging.handlers.QueueHandler(log_queue))
+    listener = logging.handlers.QueueListener(log_queue, file_handler)
+    listener.start()
+    # Write out whatever is still queued when the program exits
+    atexit.register(listener.stop)
+
+    def info(self, message, **fields):
         """
         Log an information message.
 
         Parameters:
         - message: The information message to be logged.
+        - fields: Optional key=value details appended to the message.
         """
-        self.logger.info(message)
+        self.logger.info(message, extra={'fields': fields})
 
-    def error(self, message):
+    def error(self, message, **fields):
         """
         Log an error message.
 
         Parameters:
         - message: The error message to be logged.
+        - fields: Optional key=value details appended to the message.
         """
-        self.logger.error(message)
+        self.logger.error(message, extra={'fields': fields})
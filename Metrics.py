@@ -0,0 +1,282 @@
+import functools
+import json
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+import ConfigurationManager
+
+class Metrics:
+    """
+    Collects timings, byte counts and API call statistics of a run, and writes them at the end as a JSON
+    report and a Prometheus textfile. Like Logger, every instance shares one registry, so any class can keep
+    its own Metrics() and all measurements end up in the same report.
+
+    Usage:
+    metrics = Metrics()
+    with metrics.span("local_scan"):
+        ...
+    metrics.record_call("drive.files.list", 0.12, "ok")
+    metrics.write_reports("pull", succeeded=True)
+    """
+
+    # Upper bounds, in seconds, of the latency histogram buckets
+    LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 1800)
+    PROMETHEUS_PREFIX = "gspace_"
+    DESCRIPTIONS = {
+        "phase_seconds": "Duration of a sync phase",
+        "api_call_seconds": "Latency of a Drive API request, per attempt",
+        "api_calls_total": "Drive API requests, per endpoint and outcome",
+        "api_queries_total": "Drive API queries, counting every call of a batch",
+        "api_retries_total": "Drive API calls retried after a retryable failure",
+        "api_throttled_total": "Drive API calls rejected by quota or rate limits",
+        "api_wait_seconds": "Time a call waited for a free slot and a rate-limit token",
+        "concurrency_limit": "Lowest adaptive limit on API calls in flight during the run",
+        "transfer_seconds": "Duration of a whole file upload or download",
+        "transferred_bytes_total": "Bytes uploaded or downloaded",
+        "transferred_files_total": "Files uploaded or downloaded",
+        "run_seconds": "Duration of the whole run",
+        "run_succeeded": "Whether the run finished without an error",
+        "run_timestamp_seconds": "Time the run finished",
+    }
+
+    lock = threading.Lock()
+    counters = {}
+    gauges = {}
+    histograms = {}
+    started = time.time()
+
+    @staticmethod
+    def key(name, labels):
+        return name, tuple(sorted(labels.items()))
+
+    def increment(self, name, value=1, **labels):
+        """
+        Add to a counter.
+
+        Parameters:
+        - name: Name of the counter.
+        - value: Amount added.
+        - labels: Labels telling series apart, e.g. endpoint="drive.files.list".
+        """
+        key = self.key(name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def set_gauge(self, name, value, lowest=False, **labels):
+        """
+        Set a gauge.
+
+        Parameters:
+        - name: Name of the gauge.
+        - value: The new value.
+        - lowest: Keep the lowest value seen instead of the latest one.
+        - labels: Labels telling series apart.
+        """
+        key = self.key(name, labels)
+        with self.lock:
+            if not lowest or key not in self.gauges or value < self.gauges[key]:
+                self.gauges[key] = value
+
+    def observe(self, name, seconds, **labels):
+        """
+        Record a duration in a histogram.
+
+        Parameters:
+        - name: Name of the histogram.
+        - seconds: The duration.
+        - labels: Labels telling series apart.
+        """
+        key = self.key(name, labels)
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = {'buckets': [0] * len(self.LATENCY_BUCKETS), 'sum': 0.0, 'count': 0, 'max': 0.0}
+            for position, bound in enumerate(self.LATENCY_BUCKETS):
+                if seconds <= bound:
+                    histogram['buckets'][position] += 1
+                    break
+            histogram['sum'] += seconds
+            histogram['count'] += 1
+            histogram['max'] = max(histogram['max'], seconds)
+
+    @contextmanager
+    def span(self, phase):
+        """
+        Time a block of code as a phase of the run, whether it finishes or raises.
+
+        Parameters:
+        - phase: Name of the phase, e.g. "remote_listing".
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe("phase_seconds", time.perf_counter() - start, phase=phase)
+
+    @classmethod
+    def timed(cls, phase):
+        """
+        Decorator timing every call of a function as a phase of the run.
+
+        Parameters:
+        - phase: Name of the phase.
+        """
+        def decorator(function):
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                with cls().span(phase):
+                    return function(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def record_call(self, endpoint, seconds, outcome, cost=1):
+        """
+        Record one attempt of a Drive API request.
+
+        Parameters:
+        - endpoint: API method, e.g. "drive.files.list".
+        - seconds: Latency of the attempt.
+        - outcome: "ok", or the HTTP status or exception type of the failure.
+        - cost: Number of queries the request made, e.g. the size of a batch.
+        """
+        self.observe("api_call_seconds", seconds, endpoint=endpoint)
+        self.increment("api_calls_total", endpoint=endpoint, outcome=str(outcome))
+        self.increment("api_queries_total", cost, endpoint=endpoint)
+
+    def record_transfer(self, direction, seconds, size):
+        """
+        Record a finished file upload or download.
+
+        Parameters:
+        - direction: "upload" or "download".
+        - seconds: Duration of the whole transfer, including retries.
+        - size: Number of bytes transferred.
+        """
+        self.observe("transfer_seconds", seconds, direction=direction)
+        self.increment("transferred_bytes_total", size, direction=direction)
+        self.increment("transferred_files_total", direction=direction)
+
+    @classmethod
+    def quantile(cls, histogram, fraction):
+        """
+        Estimate a quantile of a histogram as the upper bound of the bucket holding it.
+        """
+        rank, seen = fraction * histogram['count'], 0
+        for bound, count in zip(cls.LATENCY_BUCKETS, histogram['buckets']):
+            seen += count
+            if seen >= rank:
+                return bound
+        return histogram['max']
+
+    def report(self, command=None, succeeded=None):
+        """
+        Build the report of the run.
+
+        Parameters:
+        - command: The command that ran, e.g. "push".
+        - succeeded: Whether it finished without an error.
+
+        Returns:
+        A dictionary with the run details and every counter, gauge and histogram, grouped by name and labels.
+        """
+        def labels_text(labels):
+            return ",".join(f"{name}={value}" for name, value in labels) or "total"
+
+        with self.lock:
+            report = {
+                'command': command,
+                'succeeded': succeeded,
+                'started': datetime.fromtimestamp(self.started).isoformat(timespec='seconds'),
+                'duration_seconds': round(time.time() - self.started, 3),
+                'counters': {}, 'gauges': {}, 'histograms': {},
+            }
+            for (name, labels), value in sorted(self.counters.items()):
+                report['counters'].setdefault(name, {})[labels_text(labels)] = value
+            for (name, labels), value in sorted(self.gauges.items()):
+                report['gauges'].setdefault(name, {})[labels_text(labels)] = value
+            for (name, labels), histogram in sorted(self.histograms.items()):
+                report['histograms'].setdefault(name, {})[labels_text(labels)] = {
+                    'count': histogram['count'],
+                    'sum_seconds': round(histogram['sum'], 6),
+                    'max_seconds': round(histogram['max'], 6),
+                    'p50_seconds': self.quantile(histogram, 0.5),
+                    'p95_seconds': self.quantile(histogram, 0.95),
+                    'p99_seconds': self.quantile(histogram, 0.99),
+                }
+        return report
+
+    def prometheus_text(self, command=None, succeeded=None):
+        """
+        Render every metric in the Prometheus text exposition format, for node_exporter's textfile collector.
+        """
+        def labels_text(labels, extra=()):
+            pairs = ([("command", command)] if command else []) + list(labels) + list(extra)
+            if not pairs:
+                return ""
+            return "{" + ",".join(f'{name}="{escape(value)}"' for name, value in pairs) + "}"
+
+        def escape(value):
+            return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+        lines = []
+        def header(name, kind):
+            lines.append(f"# HELP {self.PROMETHEUS_PREFIX}{name} {self.DESCRIPTIONS.get(name, name)}")
+            lines.append(f"# TYPE {self.PROMETHEUS_PREFIX}{name} {kind}")
+
+        with self.lock:
+            for kind, series in (("counter", self.counters), ("gauge", self.gauges)):
+                for name in sorted({name for name, _ in series}):
+                    header(name, kind)
+                    for (series_name, labels), value in sorted(series.items()):
+                        if series_name == name:
+                            lines.append(f"{self.PROMETHEUS_PREFIX}{name}{labels_text(labels)} {value}")
+
+            for name in sorted({name for name, _ in self.histograms}):
+                header(name, "histogram")
+                for (series_name, labels), histogram in sorted(self.histograms.items()):
+                    if series_name != name:
+                        continue
+                    cumulative = 0
+                    for bound, count in zip(self.LATENCY_BUCKETS, histogram['buckets']):
+                        cumulative += count
+                        lines.append(f"{self.PROMETHEUS_PREFIX}{name}_bucket{labels_text(labels, [('le', bound)])} {cumulative}")
+                    lines.append(f"{self.PROMETHEUS_PREFIX}{name}_bucket{labels_text(labels, [('le', '+Inf')])} {histogram['count']}")
+                    lines.append(f"{self.PROMETHEUS_PREFIX}{name}_sum{labels_text(labels)} {histogram['sum']}")
+                    lines.append(f"{self.PROMETHEUS_PREFIX}{name}_count{labels_text(labels)} {histogram['count']}")
+
+        for name, value in (("run_seconds", time.time() - self.started), ("run_succeeded", int(bool(succeeded))),
+                            ("run_timestamp_seconds", time.time())):
+            header(name, "gauge")
+            lines.append(f"{self.PROMETHEUS_PREFIX}{name}{labels_text(())} {value}")
+        return "\n".join(lines) + "\n"
+
+    @staticmethod
+    def write_atomically(path, text):
+        """
+        Write a file through a temporary file in the same folder, so readers never see it half written.
+        """
+        folder = os.path.dirname(os.path.abspath(path))
+        os.makedirs(folder, exist_ok=True)
+        descriptor, temporary_path = tempfile.mkstemp(dir=folder, prefix=".tmp-")
+        with os.fdopen(descriptor, 'w') as output_file:
+            output_file.write(text)
+        os.replace(temporary_path, path)
+
+    def write_reports(self, command=None, succeeded=None):
+        """
+        Write the JSON report and the Prometheus textfile to the paths set in the [Metrics] section of
+        settings.conf; an empty path disables that output.
+
+        Parameters:
+        - command: The command that ran.
+        - succeeded: Whether it finished without an error.
+        """
+        if ConfigurationManager.METRICS_REPORT_PATH:
+            self.write_atomically(ConfigurationManager.METRICS_REPORT_PATH,
+                                  json.dumps(self.report(command, succeeded), indent=2) + "\n")
+        if ConfigurationManager.METRICS_TEXTFILE_PATH:
+            self.write_atomically(ConfigurationManager.METRICS_TEXTFILE_PATH, self.prometheus_text(command, succeeded))
@@ -0,0 +1,151 @@
+import os
+import re
+import ConfigurationManager
+
+class PathFilter:
+    """
+    Decides which paths below the synced folders are left out of scans and transfers, from gitignore-style
+    patterns: the exclude and include lists of the [Filters] section of settings.conf, followed by the
+    lines of the ignore file (.gspaceignore by default) in the local folder.
+
+    Pattern syntax follows .gitignore: blank lines and lines starting with "#" are skipped, "!" re-includes
+    what an earlier pattern excluded, a trailing "/" matches folders only, a pattern with a "/" at the start
+    or in the middle is matched from the root and any other pattern against the name at every depth, "*"
+    and "?" do not match "/", and "**" matches any number of folders. The last matching pattern wins.
+
+    Callers prune an excluded folder without looking inside it, so as in git, nothing inside an excluded
+    folder can be included again.
+
+    Usage:
+    path_filter = PathFilter(exclude=["node_modules/", "*.tmp"], include=["keep.tmp"])
+    path_filter.excludes("src/node_modules", True)   # True
+    path_filter.excludes("src/keep.tmp", False)      # False
+    """
+
+    def __init__(self, exclude=None, include=None, ignore_file=None):
+        """
+        Initialize PathFilter.
+
+        Parameters:
+        - exclude: Patterns of paths to leave out; by default the exclude list of settings.conf.
+        - include: Patterns of paths kept even though an exclude pattern matches them; by default the
+          include list of settings.conf.
+        - ignore_file: Path of a file with more patterns; by default the ignore file in the local folder.
+        """
+        exclude = ConfigurationManager.EXCLUDE_PATTERNS if exclude is None else exclude
+        include = ConfigurationManager.INCLUDE_PATTERNS if include is None else include
+        if ignore_file is None and ConfigurationManager.IGNORE_FILE_NAME:
+            ignore_file = os.path.join(ConfigurationManager.LOCAL_FILESYSTEM_FOLDER_PATH, ConfigurationManager.IGNORE_FILE_NAME)
+
+        lines = list(exclude) + ["!" + pattern.lstrip("!") for pattern in include]
+        if ignore_file and os.path.isfile(ignore_file):
+            with open(ignore_file, encoding='utf-8') as patterns_file:
+                lines.extend(patterns_file.read().splitlines())
+
+        self.patterns = []
+        self.rules = []
+        for line in lines:
+            rule = self.parse(line)
+            if rule is not None:
+                self.patterns.append(line.strip())
+                self.rules.append(rule)
+        # Checked last pattern first, so the first match decides
+        self.rules.reverse()
+
+    def __bool__(self):
+        return bool(self.rules)
+
+    @property
+    def fingerprint(self):
+        """
+        The patterns in effect, or None without any, so state built under other patterns can be told apart.
+        """
+        return tuple(self.patterns) or None
+
+    @classmethod
+    def parse(cls, line):
+        """
+        Turn a line of gitignore syntax into a rule.
+
+        Returns:
+        A tuple (negated, folders only, compiled regular expression, matched against the name only),
+        or None for blank and comment lines.
+        """
+        pattern = line.rstrip("\n")
+        # Trailing spaces are ignored unless escaped
+        while pattern.endswith(" ") and not pattern.endswith("\\ "):
+            pattern = pattern[:-1]
+        if not pattern or pattern.startswith("#"):
+            return None
+
+        negated = pattern.startswith("!")
+        if negated or pattern.startswith("\\!") or pattern.startswith("\\#"):
+            pattern = pattern[1:]
+        folders_only = pattern.endswith("/")
+        pattern = pattern.rstrip("/")
+        if not pattern:
+            return None
+
+        anchored = "/" in pattern
+        pattern = pattern.lstrip("/")
+        expression = cls.translate(pattern)
+        return negated, folders_only, re.compile(expression + r"\Z", re.DOTALL), not anchored
+
+    @staticmethod
+    def translate(pattern):
+        """
+        Translate a glob pattern of gitignore syntax into a regular expression.
+        """
+        parts, position = [], 0
+        while position < len(pattern):
+            character = pattern[position]
+            if pattern.startswith("**/", position) and (position == 0 or pattern[position - 1] == "/"):
+                parts.append("(?:.*/)?")
+                position += 3
+                continue
+            if pattern.startswith("**", position) and position + 2 == len(pattern) and (position == 0 or pattern[position - 1] == "/"):
+                parts.append(".*")
+                position += 2
+                continue
+
+            if character == "*":
+                parts.append("[^/]*")
+            elif character == "?":
+                parts.append("[^/]")
+            elif character == "\\" and position + 1 < len(pattern):
+                position += 1
+                parts.append(re.escape(pattern[position]))
+            elif character == "[":
+                end = pattern.find("]", position + 2)
+                if end < 0:
+                    parts.append(re.escape(character))
+                else:
+                    characters = pattern[position + 1:end]
+                    if characters[0] in "!^":
+                        characters = "^" + characters[1:]
+                    parts.append("[" + characters.replace("\\", "\\\\") + "]")
+                    position = end
+            else:
+                parts.append(re.escape(character))
+            position += 1
+        return "".join(parts)
+
+    def excludes(self, relative_path, isDir):
+        """
+        Decide whether an entry is left out. Its parent folder is assumed to be kept.
+
+        Parameters:
+        - relative_path: "/"-separated path below the synced folder, with or without a leading "/".
+        - isDir: Whether the entry is a folder.
+
+        Returns:
+        True if the entry, and for a folder everything inside it, is left out.
+        """
+        relative_path = relative_path.lstrip("/")
+        name = relative_path.rpartition("/")[2]
+        for negated, folders_only, expression, name_only in self.rules:
+            if folders_only and not isDir:
+                continue
+            if expression.match(name if name_only else relative_path):
+                return not negated
+        return False
@@ -0,0 +1,128 @@
+import sys
+import threading
+import time
+import ConfigurationManager
+
+class ProgressReporter:
+    """
+    Aggregates the progress of concurrent transfers into one status line, built from the chunk statuses
+    the transfers already receive and redrawn at most a few times per second, instead of printing banners
+    for every file.
+
+    On a terminal the line is redrawn in place; otherwise, e.g. under cron, a plain line is written at most
+    every NON_TERMINAL_INTERVAL seconds.
+
+    Usage:
+    progress = ProgressReporter("Downloading", total_files=2, total_bytes=2048)
+    progress.update("/a.txt", 512)
+    progress.finish_file("/a.txt", 1024)
+    progress.close()
+    """
+
+    NON_TERMINAL_INTERVAL = 10.0
+
+    def __init__(self, label, total_files, total_bytes=0, interval=None, stream=None):
+        """
+        Initialize ProgressReporter.
+
+        Parameters:
+        - label: What the transfers do, e.g. "Downloading".
+        - total_files: Number of files to transfer.
+        - total_bytes: Number of bytes to transfer, if known.
+        - interval: Shortest time between two redraws, in seconds.
+        - stream: Where the line is written; sys.stdout by default.
+        """
+        self.label = label
+        self.total_files = total_files
+        self.total_bytes = total_bytes
+        self.stream = stream or sys.stdout
+        self.terminal = hasattr(self.stream, 'isatty') and self.stream.isatty()
+        interval = ConfigurationManager.PROGRESS_INTERVAL if interval is None else interval
+        self.interval = interval if self.terminal else max(interval, self.NON_TERMINAL_INTERVAL)
+
+        self.lock = threading.Lock()
+        self.completed_files = 0
+        self.completed_bytes = 0
+        # Bytes done so far of the files still in flight
+        self.in_flight = {}
+        self.started = time.monotonic()
+        self.last_render = self.started
+        self.line_length = 0
+
+    def update(self, key, done_bytes):
+        """
+        Record how many bytes of a file are done, e.g. from the resumable_progress of a chunk status.
+
+        Parameters:
+        - key: Identifies the file, e.g. its path.
+        - done_bytes: Bytes of the file done so far.
+        """
+        with self.lock:
+            self.in_flight[key] = done_bytes
+            self.render_if_due()
+
+    def finish_file(self, key, size):
+        """
+        Record a finished file.
+
+        Parameters:
+        - key: Identifies the file.
+        - size: Size of the file in bytes.
+        """
+        with self.lock:
+            self.in_flight.pop(key, None)
+            self.completed_files += 1
+            self.completed_bytes += size
+            self.render_if_due()
+
+    def render_if_due(self):
+        now = time.monotonic()
+        if now - self.last_render >= self.interval:
+            self.last_render = now
+            self.render(self.status_line(now))
+
+    def status_line(self, now):
+        done_bytes = self.completed_bytes + sum(self.in_flight.values())
+        elapsed = max(now - self.started, 1e-6)
+        rate = done_bytes / elapsed
+        line = f"{self.label}: {self.completed_files}/{self.total_files} files"
+        if self.total_bytes:
+            line += f", {done_bytes / 1048576:.1f}/{self.total_bytes / 1048576:.1f} MiB, {rate / 1048576:.2f} MiB/s"
+            if rate > 0 and done_bytes < self.total_bytes:
+                line += f", ETA {self.format_duration((self.total_bytes - done_bytes) / rate)}"
+        else:
+            line += f", {done_bytes / 1048576:.1f} MiB, {rate / 1048576:.2f} MiB/s"
+        return line
+
+    @staticmethod
+    def format_duration(seconds):
+        minutes, seconds = divmod(int(seconds), 60)
+        hours, minutes = divmod(minutes, 60)
+        return f"{hours}h{minutes:02d}m" if hours else f"{minutes}m{seconds:02d}s" if minutes else f"{seconds}s"
+
+    def render(self, line):
+        if self.terminal:
+            # Pad over the rest of a longer previous line
+            self.stream.write("\r" + line.ljust(self.line_length))
+            self.line_length = len(line)
+        else:
+            self.stream.write(line + "\n")
+        self.stream.flush()
+
+    def close(self):
+        """
+        Replace the status line with a summary of the finished transfers.
+
+        Returns:
+        The number of bytes of the finished files.
+        """
+        with self.lock:
+            elapsed = max(time.monotonic() - self.started, 1e-6)
+            summary = (f"{self.label} done: {self.completed_files} files, {self.completed_bytes / 1048576:.1f} MiB in {elapsed:.1f}s "
+                       f"({self.completed_bytes / 1048576 / elapsed:.2f} MiB/s, {self.completed_files / elapsed:.1f} files/s)")
+            if self.terminal:
+                self.stream.write("\r" + summary.ljust(self.line_length) + "\n")
+            else:
+                self.stream.write(summary + "\n")
+            self.stream.flush()
+            return self.completed_bytes
@@ -0,0 +1,254 @@
+import http.client
+import json
+import random
+import socket
+import threading
+import time
+import ConfigurationManager
+from Logger import Logger
+from Metrics import Metrics
+
+class RequestScheduler:
+    """
+    Routes every Google Drive API call through one place, so large syncs keep running at the highest
+    sustainable rate instead of dying on the first rate-limit error.
+
+    - A token bucket caps the number of queries per second across all threads.
+    - Retryable failures (429, 5xx, rate-limit 403s and dropped connections) are retried with jittered
+      exponential backoff.
+    - Quota errors halve the number of calls allowed in flight; it grows back by one after a run of
+      successful calls.
+
+    Usage:
+    scheduler = RequestScheduler()
+    response = scheduler.execute(service.files().list(q="trashed = false"))
+    status, response = scheduler.next_chunk(upload_request)
+    """
+
+    logger = Logger()
+    metrics = Metrics()
+
+    RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+    RATE_LIMIT_REASONS = {'rateLimitExceeded', 'userRateLimitExceeded'}
+    # Successful calls needed before one more concurrent call is allowed again
+    SUCCESSES_PER_CONCURRENCY_STEP = 20
+
+    def __init__(self, queries_per_second=None, max_concurrency=None, max_retries=None):
+        """
+        Initialize RequestScheduler with its limits from ConfigurationManager.
+
+        Parameters:
+        - queries_per_second: Sustained rate of API queries allowed across all threads.
+        - max_concurrency: Highest number of calls allowed in flight at once.
+        - max_retries: Number of retries of a retryable failure before it is raised.
+        """
+        self.queries_per_second = queries_per_second or ConfigurationManager.QUERIES_PER_SECOND
+        self.max_concurrency = max_concurrency or ConfigurationManager.MAX_CONCURRENT_REQUESTS
+        self.max_retries = ConfigurationManager.MAX_RETRIES if max_retries is None else max_retries
+        self.max_backoff = 64.0
+
+        # Token bucket, allowing bursts of up to one second of queries
+        self.bucket_lock = threading.Lock()
+        self.tokens = float(self.queries_per_second)
+        self.last_refill = time.monotonic()
+
+        # Adaptive limit on calls in flight
+        self.concurrency = threading.Condition()
+        self.concurrency_limit = self.max_concurrency
+        self.active_calls = 0
+        self.successes = 0
+        self.metrics.set_gauge("concurrency_limit", self.concurrency_limit, lowest=True)
+
+    def acquire_tokens(self, cost=1):
+        """
+        Block until the token bucket holds enough tokens for a call, then take them.
+
+        A call costing more than the bucket holds, like a batch of 100 calls at 20 queries per second, waits
+        for a full bucket and takes its whole cost, leaving the bucket in debt; later calls wait until the
+        debt is paid off, so batches stay within the quota too.
+
+        Parameters:
+        - cost: Number of queries the call makes, e.g. the size of a batch.
+        """
+        needed = min(cost, self.queries_per_second)
+        while True:
+            with self.bucket_lock:
+                now = time.monotonic()
+                self.tokens = min(float(self.queries_per_second), self.tokens + (now - self.last_refill) * self.queries_per_second)
+                self.last_refill = now
+                if self.tokens >= needed:
+                    self.tokens -= cost
+                    return
+                wait_time = (needed - self.tokens) / self.queries_per_second
+            time.sleep(wait_time)
+
+    def acquire_slot(self):
+        """
+        Block until fewer calls than the current concurrency limit are in flight.
+        """
+        with self.concurrency:
+            while self.active_calls >= self.concurrency_limit:
+                self.concurrency.wait()
+            self.active_calls += 1
+
+    def release_slot(self, succeeded, throttled=False):
+        """
+        Release a slot taken by acquire_slot, adapting the concurrency limit to the outcome.
+
+        Parameters:
+        - succeeded: Whether the call succeeded.
+        - throttled: Whether the call failed because of a quota or rate-limit error.
+        """
+        with self.concurrency:
+            self.active_calls -= 1
+            if throttled:
+                self.record_throttled()
+            elif succeeded and self.concurrency_limit < self.max_concurrency:
+                self.successes += 1
+                if self.successes >= self.SUCCESSES_PER_CONCURRENCY_STEP:
+                    self.successes = 0
+                    self.concurrency_limit += 1
+            self.concurrency.notify_all()
+
+    def record_throttled(self):
+        """
+        Halve the number of calls allowed in flight after a quota or rate-limit error, including errors
+        reported for single items of a batch.
+        """
+        with self.concurrency:
+            self.successes = 0
+            new_limit = max(1, self.concurrency_limit // 2)
+            if new_limit != self.concurrency_limit:
+                self.logger.info("Drive quota errors, lowering concurrent requests", limit=new_limit)
+            self.concurrency_limit = new_limit
+            self.metrics.set_gauge("concurrency_limit", new_limit, lowest=True)
+
+    @classmethod
+    def error_reasons(cls, exception):
+        """
+        Get the error reasons reported in the body of an API error.
+
+        Parameters:
+        - exception: An HttpError.
+
+        Returns:
+        A set of reason strings, e.g. {"userRateLimitExceeded"}.
+        """
+        try:
+            content = exception.content.decode('utf-8') if isinstance(exception.content, bytes) else exception.content
+            error = json.loads(content).get('error', {})
+            return {item.get('reason') for item in error.get('errors', [])} | {error.get('status')}
+        except (AttributeError, ValueError, TypeError):
+            return set()
+
+    @staticmethod
+    def outcome(exception):
+        """
+        Describe a failed call for the metrics: its HTTP status, or the type of a transport error.
+        """
+        status = getattr(getattr(exception, 'resp', None), 'status', None)
+        return str(status) if status is not None else type(exception).__name__
+
+    @classmethod
+    def is_throttled(cls, exception):
+        """
+        Check whether a failure means the quota or rate limit was hit.
+
+        Parameters:
+        - exception: The exception raised by a call.
+        """
+        status = getattr(getattr(exception, 'resp', None), 'status', None)
+        if status == 429:
+            return True
+        return status == 403 and bool(cls.error_reasons(exception) & cls.RATE_LIMIT_REASONS)
+
+    @classmethod
+    def is_retryable(cls, exception):
+        """
+        Check whether a failed call may succeed when retried.
+
+        Parameters:
+        - exception: The exception raised by a call.
+        """
+        status = getattr(getattr(exception, 'resp', None), 'status', None)
+        if status is not None:
+            return status in cls.RETRYABLE_STATUSES or cls.is_throttled(exception)
+        # Transport failures: dropped connections, timeouts, DNS hiccups
+        return isinstance(exception, (ConnectionError, TimeoutError, socket.error, http.client.HTTPException)) or \
+            type(exception).__module__.startswith('httplib2')
+
+    def backoff(self, attempt):
+        """
+        Sleep before a retry, with full jitter on an exponentially growing delay.
+
+        Parameters:
+        - attempt: Number of the retry, starting at 0.
+        """
+        time.sleep(random.uniform(0, min(self.max_backoff, 2 ** attempt)))
+
+    def call(self, function, cost=1, description="Drive API call"):
+        """
+        Run a function making an API call, within the rate and concurrency limits, retrying retryable failures.
+        Every attempt is recorded in the metrics under its description.
+
+        Parameters:
+        - function: Function performing the call.
+        - cost: Number of queries the call makes.
+        - description: Description of the call used in log messages and as the metrics endpoint.
+
+        Returns:
+        The return value of function.
+        """
+        attempt = 0
+        while True:
+            waiting = time.perf_counter()
+            self.acquire_slot()
+            self.acquire_tokens(cost)
+            start = time.perf_counter()
+            self.metrics.observe("api_wait_seconds", start - waiting)
+            try:
+                result = function()
+            except Exception as e:
+                self.metrics.record_call(description, time.perf_counter() - start, self.outcome(e), cost)
+                throttled = self.is_throttled(e)
+                if throttled:
+                    self.metrics.increment("api_throttled_total", endpoint=description)
+                self.release_slot(succeeded=False, throttled=throttled)
+                if attempt >= self.max_retries or not self.is_retryable(e):
+                    raise
+                self.metrics.increment("api_retries_total", endpoint=description)
+                self.logger.info(f"Retrying after {type(e).__name__}: {e}", endpoint=description, retry=attempt + 1,
+                                 max_retries=self.max_retries)
+                self.backoff(attempt)
+                attempt += 1
+                continue
+
+            self.metrics.record_call(description, time.perf_counter() - start, "ok", cost)
+            self.release_slot(succeeded=True)
+            return result
+
+    def execute(self, request):
+        """
+        Execute an API request through the scheduler.
+
+        Parameters:
+        - request: An HttpRequest or BatchHttpRequest.
+
+        Returns:
+        The response of the request.
+        """
+        return self.call(request.execute, description=getattr(request, 'methodId', None) or "Drive API call")
+
+    def next_chunk(self, request):
+        """
+        Transfer the next chunk of a resumable upload or media download through the scheduler. A failed chunk
+        leaves the request in a state where retrying it resumes the transfer.
+
+        Parameters:
+        - request: A resumable HttpRequest or a MediaIoBaseDownload.
+
+        Returns:
+        The (status, response) or (status, done) tuple of next_chunk.
+        """
+        # Downloads have no methodId of their own
+        return self.call(request.next_chunk, description=getattr(request, 'methodId', None) or "drive.files.get_media")
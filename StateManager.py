@@ -0,0 +1,98 @@
+import os
+import pickle
+import tempfile
+import traceback
+import ConfigurationManager
+from Logger import Logger
+
+class StateManager:
+    """
+    A utility class for persisting GSpace state (snapshots, tokens) between runs in the state folder.
+
+    Usage:
+    state = StateManager()
+    state.save("remote_snapshot", snapshot)
+    snapshot = state.load("remote_snapshot")
+    """
+
+    logger = Logger()
+
+    def __init__(self):
+        """
+        Initialize StateManager with the state folder path from ConfigurationManager.
+        """
+        self.STATE_FOLDER_PATH = ConfigurationManager.STATE_FOLDER_PATH
+
+    def path_for(self, name, extension=".pickle"):
+        """
+        Get the path of a state file inside the state folder.
+
+        Parameters:
+        - name: Name of the state entry.
+        - extension: File extension of the state file.
+
+        Returns:
+        The path of the state file.
+        """
+        return os.path.join(self.STATE_FOLDER_PATH, name + extension)
+
+    def load(self, name, default=None):
+        """
+        Load a state entry saved by a previous run.
+
+        Parameters:
+        - name: Name of the state entry.
+        - default: Value returned when the entry does not exist or cannot be read.
+
+        Returns:
+        The saved value, or default.
+        """
+        path = self.path_for(name)
+        if not os.path.exists(path):
+            return default
+
+        try:
+            with open(path, 'rb') as state_file:
+                return pickle.load(state_file)
+        except Exception as e:
+            # A corrupt or incompatible state file only costs a full rescan, never the run
+            self.logger.error(f"Ignoring unreadable state file {path}: {e}")
+            return default
+
+    def save(self, name, value):
+        """
+        Save a state entry atomically, so an interrupted run never leaves a half-written file behind.
+
+        Parameters:
+        - name: Name of the state entry.
+        - value: The picklable value to save.
+        """
+        try:
+            os.makedirs(self.STATE_FOLDER_PATH, exist_ok=True)
+            file_descriptor, temp_path = tempfile.mkstemp(dir=self.STATE_FOLDER_PATH, prefix=f".{name}.")
+            try:
+                with os.fdopen(file_descriptor, 'wb') as state_file:
+                    pickle.dump(value, state_file, protocol=pickle.HIGHEST_PROTOCOL)
+                os.replace(temp_path, self.path_for(name))
+            except BaseException:
+                os.remove(temp_path)
+                raise
+        except Exception as e:
+            # Log the error using the logger
+            self.logger.error(f"Error occurred in save: {e}")
+            # Optionally, log the full traceback for detailed error information
+            self.logger.error(traceback.format_exc())
+            # Raise the exception again to notify the caller about the error
+            raise e
+
+    def delete(self, name):
+        """
+        Delete a state entry if it exists.
+
+        Parameters:
+        - name: Name of the state entry.
+        """
+        try:
+            os.remove(self.path_for(name))
+        except FileNotFoundError:
+            pass
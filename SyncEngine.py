@@ -0,0 +1,255 @@
+import traceback
+import ConfigurationManager
+from Logger import Logger
+from Metrics import Metrics
+from StateManager import StateManager
+from Tree import Tree
+
+class SyncEngine:
+    """
+    Plans a two-way sync by comparing the local and remote trees against the base: the tree both sides
+    agreed on at the end of the last push, pull or sync. With a base, a file missing on one side can be told apart as
+    deleted there (and deleted on the other side too) or newly added on the other side (and copied over).
+
+    Usage:
+    engine = SyncEngine()
+    base_tree = engine.load_base()
+    plan = engine.plan(local_tree, remote_tree, base_tree)
+    ...
+    engine.save_base(engine.build_base(remote_tree, base_tree, plan["Conflicts"]))
+    """
+
+    logger = Logger()
+
+    BASE_SNAPSHOT_NAME = "sync_base"
+
+    def __init__(self):
+        """
+        Initialize SyncEngine.
+        """
+        self.state = StateManager()
+        self.ROOT_FOLDER_ID = ConfigurationManager.ROOT_FOLDER_ID
+
+    def load_base(self):
+        """
+        Load the base tree saved by the last push, pull or sync.
+
+        Returns:
+        The base Tree, or None before the first push, pull or sync, or after the root folder changed.
+        """
+        try:
+            snapshot = self.state.load(self.BASE_SNAPSHOT_NAME)
+            if not snapshot or snapshot.get('root_folder_id') != self.ROOT_FOLDER_ID:
+                return None
+            return snapshot['tree']
+        except Exception as e:
+            # Log the error using the logger
+            self.logger.error(f"Error occurred in load_base: {e}")
+            # Optionally, log the full traceback for detailed error information
+            self.logger.error(traceback.format_exc())
+            # Raise the exception again to notify the caller about the error
+            raise e
+
+    def save_base(self, base_tree):
+        """
+        Save the base tree for the next sync. Push and pull save one too, since they also bring both sides
+        in line.
+
+        Parameters:
+        - base_tree: The Tree returned by build_base.
+        """
+        try:
+            self.state.save(self.BASE_SNAPSHOT_NAME, {'root_folder_id': self.ROOT_FOLDER_ID, 'tree': base_tree})
+        except Exception as e:
+            # Log the error using the logger
+            self.logger.error(f"Error occurred in save_base: {e}")
+            # Optionally, log the full traceback for detailed error information
+            self.logger.error(traceback.format_exc())
+            # Raise the exception again to notify the caller about the error
+            raise e
+
+    @staticmethod
+    def same(node1, node2):
+        """
+        Check whether two nodes at the same path hold the same entry: both missing, both folders, or both
+        files with the same contents.
+        """
+        if node1 is None or node2 is None:
+            return node1 is node2
+        if node1.isDir or node2.isDir:
+            return bool(node1.isDir) == bool(node2.isDir)
+        return not Tree.is_modified(node1, node2)
+
+    @classmethod
+    def unchanged_since_base(cls, node, base_node):
+        """
+        Check whether an entry, including everything inside a folder, holds nothing new or changed since the
+        base. Entries deleted inside the folder do not count as changes.
+
+        Parameters:
+        - node: Node in the local or remote tree.
+        - base_node: Node at the same path in the base tree.
+        """
+        pending = [(node, base_node)]
+        while pending:
+            current, base_current = pending.pop()
+            if not cls.same(current, base_current):
+                return False
+            for name, child in current.children.items():
+                pending.append((child, base_current.children.get(name)))
+        return True
+
+    @Metrics.timed("diff")
+    def plan(self, local_tree, remote_tree, base_tree=None):
+        """
+        Compare the local and remote trees against the base in one walk, and decide what to do with every
+        path where they differ.
+
+        Parameters:
+        - local_tree: The Tree generated from the local filesystem.
+        - remote_tree: The Tree generated from Google Drive.
+        - base_tree: The Tree saved by the last push, pull or sync, or None before the first one.
+
+        Returns:
+        A dictionary of lists of (path, drive id, isDir) tuples:
+        - "Uploads": new or changed local entries; the drive id is that of the remote file they replace.
+        - "Downloads": new or changed remote entries.
+        - "Local Deletions": entries deleted in Google Drive and unchanged locally.
+        - "Remote Deletions": entries deleted locally and unchanged in Google Drive.
+        - "Conflicts": entries changed on both sides, as (path, drive id, isDir, reason); they are left as they are.
+        """
+        try:
+            plan = {"Uploads": [], "Downloads": [], "Local Deletions": [], "Remote Deletions": [], "Conflicts": []}
+            if not local_tree.root or not remote_tree.root:
+                return plan
+
+            base_root = base_tree.root if base_tree else None
+            pending = [(local_tree.root, remote_tree.root, base_root, "")]
+            while pending:
+                local_node, remote_node, base_node, current_path = pending.pop()
+                local_children, remote_children = local_node.children, remote_node.children
+                names = list(local_children) + [name for name in remote_children if name not in local_children]
+
+                for name in names:
+                    local_child, remote_child = local_children.get(name), remote_children.get(name)
+                    base_child = base_node.children.get(name) if base_node else None
+                    path = current_path + "/" + name
+
+                    if local_child and remote_child:
+                        if local_child.isDir and remote_child.isDir:
+                            pending.append((local_child, remote_child, base_child if base_child and base_child.isDir else None, path))
+                        elif bool(local_child.isDir) != bool(remote_child.isDir):
+                            plan["Conflicts"].append((path, remote_child.id, remote_child.isDir, "file on one side, folder on the other"))
+                        elif Tree.is_modified(local_child, remote_child):
+                            local_changed = not self.same(local_child, base_child)
+                            remote_changed = not self.same(remote_child, base_child)
+                            if not remote_changed:
+                                plan["Uploads"].append((path, remote_child.id, False))
+                            elif not local_changed:
+                                plan["Downloads"].append((path, remote_child.id, False))
+                            else:
+                                plan["Conflicts"].append((path, remote_child.id, False, "changed on both sides"))
+
+                    elif local_child:
+                        if base_child is None or bool(base_child.isDir) != bool(local_child.isDir):
+                            plan["Uploads"].append((path, None, local_child.isDir))
+                        elif self.unchanged_since_base(local_child, base_child):
+                            plan["Local Deletions"].append((path, None, local_child.isDir))
+                        else:
+                            plan["Conflicts"].append((path, None, local_child.isDir, "changed locally, deleted in Google Drive"))
+
+                    else:
+                        if base_child is None or bool(base_child.isDir) != bool(remote_child.isDir):
+                            plan["Downloads"].append((path, remote_child.id, remote_child.isDir))
+                        elif self.unchanged_since_base(remote_child, base_child):
+                            plan["Remote Deletions"].append((path, remote_child.id, remote_child.isDir))
+                        else:
+                            plan["Conflicts"].append((path, remote_child.id, remote_child.isDir, "changed in Google Drive, deleted locally"))
+
+            return plan
+        except Exception as e:
+            # Log the error using the logger
+            self.logger.error(f"Error occurred in plan: {e}")
+            # Optionally, log the full traceback for detailed error information
+            self.logger.error(traceback.format_exc())
+            # Raise the exception again to notify the caller about the error
+            raise e
+
+    def move_in_base(self, base_tree, moves):
+        """
+        Move entries of the base tree along with moves applied to both sides, so their contents are compared
+        with the base in their new place.
+
+        Parameters:
+        - base_tree: The base Tree, updated in place; None is ignored.
+        - moves: List of moves (old path, new path, drive id, isDir).
+        """
+        try:
+            if not base_tree or not base_tree.root:
+                return
+
+            for old_path, new_path, file_id, isDir in moves:
+                node = base_tree.find_node(old_path.split("/")[1:])
+                if node is None:
+                    continue
+                base_tree.detach(node)
+
+                names = new_path.split("/")[1:]
+                parent = base_tree.root
+                for name in names[:-1]:
+                    parent = base_tree.add_child(parent, name, isDir=True)
+                node.value = names[-1]
+                base_tree.attach(parent, node)
+        except Exception as e:
+            # Log the error using the logger
+            self.logger.error(f"Error occurred in move_in_base: {e}")
+            # Optionally, log the full traceback for detailed error information
+            self.logger.error(traceback.format_exc())
+            # Raise the exception again to notify the caller about the error
+            raise e
+
+    def build_base(self, remote_tree, base_tree, conflicts):
+        """
+        Build the base for the next sync once a plan has been carried out. Every path the plan settled now
+        matches the remote tree; conflicting paths keep their previous base entry, so they are reported again
+        until resolved instead of being overwritten by either side.
+
+        Parameters:
+        - remote_tree: The remote Tree, updated with the uploads and deletions made by the sync.
+        - base_tree: The previous base Tree, or None.
+        - conflicts: The "Conflicts" list of the plan.
+
+        Returns:
+        The new base Tree.
+        """
+        try:
+            new_base = remote_tree.copy()
+            for conflict in conflicts:
+                names = conflict[0].split("/")[1:]
+                new_base.remove(names)
+
+                previous = base_tree.find_node(names) if base_tree else None
+                if previous is None:
+                    continue
+
+                # Recreate the previous entry, with any ancestor folders the remote tree no longer has
+                parent = new_base.root
+                for depth, name in enumerate(names[:-1], start=1):
+                    ancestor = base_tree.find_node(names[:depth])
+                    parent = new_base.add_child(parent, name, ancestor.id, isDir=True)
+
+                copies = [(parent, previous)]
+                while copies:
+                    new_parent, node = copies.pop()
+                    copied = new_base.add_child(new_parent, node.value, node.id, isDir=node.isDir,
+                                                fileSize=node.fileSize, checksum=node.checksum)
+                    copies.extend((copied, child) for child in node.children.values())
+
+            return new_base
+        except Exception as e:
+            # Log the error using the logger
+            self.logger.error(f"Error occurred in build_base: {e}")
+            # Optionally, log the full traceback for detailed error information
+            self.logger.error(traceback.format_exc())
+            # Raise the exception again to notify the caller about the error
+            raise e
@@ -0,0 +1,108 @@
+import threading
+from StateManager import StateManager
+
+class TransferState:
+    """
+    Persists the progress of unfinished transfers, so a rerun after a crash, a Ctrl-C or a dropped
+    connection continues them instead of starting over.
+
+    Uploads are remembered by their resumable session URI. Downloads are written to a partial file whose
+    size is the offset to resume from; the state only records which remote version that partial file
+    belongs to. Every change rewrites the state, so only transfers of more than one chunk are recorded.
+
+    Usage:
+    transfers = TransferState()
+    transfers.set_upload(key, session_uri)
+    session_uri = transfers.get_upload(key)
+    transfers.clear_upload(key)
+    """
+
+    STATE_NAME = "transfers"
+    # Partial downloads sit next to their target; the local scan ignores them
+    PARTIAL_DOWNLOAD_SUFFIX = ".gspace-part"
+
+    def __init__(self):
+        """
+        Initialize TransferState, loading the transfers left unfinished by previous runs.
+        """
+        self.state = StateManager()
+        self.lock = threading.Lock()
+        self.transfers = self.state.load(self.STATE_NAME, default={'uploads': {}, 'downloads': {}})
+
+    def save(self):
+        """
+        Write the current transfers to the state folder. Must be called with the lock held.
+        """
+        self.state.save(self.STATE_NAME, self.transfers)
+
+    def get_upload(self, key):
+        """
+        Get the resumable session URI of an unfinished upload.
+
+        Parameters:
+        - key: Tuple identifying the upload, including the size and mtime of the local file.
+
+        Returns:
+        The session URI, or None.
+        """
+        with self.lock:
+            return self.transfers['uploads'].get(key)
+
+    def set_upload(self, key, session_uri):
+        """
+        Remember the resumable session URI of an upload.
+
+        Parameters:
+        - key: Tuple identifying the upload.
+        - session_uri: The resumable session URI returned by Drive.
+        """
+        with self.lock:
+            self.transfers['uploads'][key] = session_uri
+            self.save()
+
+    def clear_upload(self, key):
+        """
+        Forget an upload once it finished or its session expired.
+
+        Parameters:
+        - key: Tuple identifying the upload.
+        """
+        with self.lock:
+            if self.transfers['uploads'].pop(key, None) is not None:
+                self.save()
+
+    def get_download(self, partial_path):
+        """
+        Get the remote version a partial download was started for.
+
+        Parameters:
+        - partial_path: Path of the partial file.
+
+        Returns:
+        The version tuple recorded by set_download, or None.
+        """
+        with self.lock:
+            return self.transfers['downloads'].get(partial_path)
+
+    def set_download(self, partial_path, version):
+        """
+        Remember the remote version a partial download belongs to.
+
+        Parameters:
+        - partial_path: Path of the partial file.
+        - version: Tuple identifying the remote file contents, e.g. (drive id, size, md5).
+        """
+        with self.lock:
+            self.transfers['downloads'][partial_path] = version
+            self.save()
+
+    def clear_download(self, partial_path):
+        """
+        Forget a download once it finished.
+
+        Parameters:
+        - partial_path: Path of the partial file.
+        """
+        with self.lock:
+            if self.transfers['downloads'].pop(partial_path, None) is not None:
+                self.save()
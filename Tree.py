@@ -1,6 +1,10 @@
-import os
+from Metrics import Metrics
+
 class TreeNode:
-    def __init__(self, value, drive_id=None, isDir=None, fileSize = 0):
+    # Trees reach millions of nodes, so nodes carry no per-instance __dict__
+    __slots__ = ('value', 'children', 'id', 'isDir', 'fileSize', 'checksum', 'parent')
+
+    def __init__(self, value, drive_id=None, isDir=None, fileSize = 0, checksum=None, parent=None):
         """
         Initialize a TreeNode.
 
@@ -8,22 +12,33 @@ class TreeNode:
         - value: The value of the node.
         - drive_id: Identifier for the drive associated with the node.
         - isDir: Boolean indicating whether the node represents a directory.
+        - fileSize: Size of the file in bytes.
+        - checksum: MD5 checksum of the file contents, if known.
+        - parent: The parent node, or None for the root.
         """
         self.value = value
         self.children = {}
         self.id = drive_id
         self.isDir = isDir
         self.fileSize = fileSize
+        self.checksum = checksum
+        self.parent = parent
 
 
 class Tree:
     def __init__(self):
         """
         Initialize a Tree.
+
+        Besides the nodes, the tree keeps an index of Drive id -> node, updated by every method that adds,
+        moves or removes nodes. Code changing the structure must go through these methods rather than editing
+        node.children directly. Paths need no index of their own: find_node follows the children dictionaries
+        in one lookup per level.
         """
         self.root = None
+        self.nodes_by_id = {}
 
-    def add(self, path, drive_id=None, isDir=None, fileSize=0):
+    def add(self, path, drive_id=None, isDir=None, fileSize=0, checksum=None):
         """
         Add a node to the tree based on the given path.
 
@@ -31,32 +46,113 @@ class Tree:
         - path: List representing the path to the node.
         - drive_id: Identifier for the drive associated with the node.
         - isDir: Boolean indicating whether the node represents a directory.
+        - checksum: MD5 checksum of the file contents, if known.
         """
         if not self.root:
-            self.root = TreeNode(path[0], drive_id, isDir, fileSize)
-        else:
-            self._add_recursive(self.root, path[1:], drive_id, isDir, fileSize)
+            self.root = TreeNode(path[0], drive_id, isDir, fileSize, checksum)
+            self.index_node(self.root)
+            return
+
+        node = self.root
+        for current_value in path[1:]:
+            child = node.children.get(current_value)
+            if child is None:
+                child = TreeNode(current_value, drive_id, isDir, fileSize, checksum, parent=node)
+                node.children[current_value] = child
+                self.index_node(child)
+            node = child
 
-    def _add_recursive(self, node, path, drive_id, isDir=None, fileSize=0):
+    def add_child(self, parent, value, drive_id=None, isDir=None, fileSize=0, checksum=None):
         """
-        Recursively add a node to the tree.
+        Attach a node directly under an existing parent node, without walking the path from the root.
 
         Parameters:
-        - node: The current node being processed.
-        - path: Remaining path to traverse.
+        - parent: The node the child is attached to.
+        - value: The value of the child node.
         - drive_id: Identifier for the drive associated with the node.
         - isDir: Boolean indicating whether the node represents a directory.
+        - fileSize: Size of the file in bytes.
+        - checksum: MD5 checksum of the file contents, if known.
+
+        Returns:
+        The child node. As with add, an existing child with the same value is kept.
         """
-        if len(path) == 0:
-            return
+        child = parent.children.get(value)
+        if child is None:
+            child = TreeNode(value, drive_id, isDir, fileSize, checksum, parent=parent)
+            parent.children[value] = child
+            self.index_node(child)
+        return child
+
+    def index_node(self, node):
+        """
+        Add a single node to the id index.
+
+        Parameters:
+        - node: The node to index.
+        """
+        if node.id is not None:
+            self.nodes_by_id[node.id] = node
+
+    def index_subtree(self, node):
+        """
+        Add a node and everything below it to the id index.
+
+        Parameters:
+        - node: The root of the subtree, already attached to the tree.
+        """
+        pending = [node]
+        while pending:
+            current = pending.pop()
+            self.index_node(current)
+            pending.extend(current.children.values())
+
+    def unindex_subtree(self, node):
+        """
+        Remove a node and everything below it from the id index.
+
+        Parameters:
+        - node: The root of the subtree, still attached to the tree.
+        """
+        pending = [node]
+        while pending:
+            current = pending.pop()
+            if current.id is not None and self.nodes_by_id.get(current.id) is current:
+                del self.nodes_by_id[current.id]
+            pending.extend(current.children.values())
+
+    def attach(self, parent, node):
+        """
+        Attach a detached node, with its whole subtree, under a parent node. A different node with the same
+        value under that parent is detached first.
 
-        current_value = path[0]
+        Parameters:
+        - parent: The node the subtree is attached to.
+        - node: The root of the subtree; its value is used as its name.
+        """
+        existing = parent.children.get(node.value)
+        if existing is not None and existing is not node:
+            self.detach(existing)
+        node.parent = parent
+        parent.children[node.value] = node
+        self.index_subtree(node)
+
+    def detach(self, node):
+        """
+        Detach a node, with its whole subtree, from its parent.
 
-        if current_value in node.children:
-            self._add_recursive(node.children[current_value], path[1:], drive_id, isDir, fileSize)
-        else:
-            node.children[current_value] = TreeNode(current_value, drive_id, isDir, fileSize)
-            self._add_recursive(node.children[current_value], path[1:], drive_id, isDir, fileSize)
+        Parameters:
+        - node: The node to detach.
+
+        Returns:
+        The detached node, which may be attached again elsewhere.
+        """
+        parent = node.parent
+        if parent is not None and parent.children.get(node.value) is node:
+            self.unindex_subtree(node)
+            del parent.children[node.value]
+        node.parent = None
+        return node
 
     def remove(self, path):
         """
@@ -65,29 +161,101 @@ class Tree:
         Parameters:
         - path: List representing the path to the node to be removed.
         """
-        if self.root:
-            self._remove_recursive(self.root, path)
+        node = self.find_node(path)
+        if path and node is not None:
+            self.detach(node)
 
-    def _remove_recursive(self, node, path):
+    def path_of(self, node):
         """
-        Recursively remove a node from the tree.
+        Get the path of a node, following parent pointers up to the root.
 
         Parameters:
-        - node: The current node being processed.
-        - path: Remaining path to traverse for node removal.
+        - node: A node of the tree.
+
+        Returns:
+        List of names from below the root to the node, in the same form get_node accepts.
+        """
+        names = []
+        while node.parent is not None:
+            names.append(node.value)
+            node = node.parent
+        names.reverse()
+        return names
+
+    def iter_differences(self, tree2):
         """
-        if len(path) == 0:
+        Walk two trees together once and yield every difference between them, for find_differences to
+        collect; the planning and transfer steps work on the collected lists, not on this walk.
+
+        Directory-ness is read from the nodes, and each path is built once from its parent's, so the walk
+        makes no system calls and no per-level string joins. A directory present on one side only is
+        yielded once, without its contents.
+
+        Parameters:
+        - tree2: The second tree to compare with.
+
+        Yields:
+        Tuples (kind, path, node1, node2), where kind is "Added" (only in this tree, node2 is None),
+        "Removed" (only in tree2, node1 is None) or "Modified" (file contents differ), and path is the
+        "/"-separated path below the roots, starting with "/".
+        """
+        if not (self.root and tree2.root):
             return
 
-        current_value = path[0]
+        # Explicit stack instead of recursion, so deep trees cannot hit the recursion limit
+        pending = [(self.root, tree2.root, "")]
+        while pending:
+            node1, node2, current_path = pending.pop()
+            children2 = node2.children
+
+            for name, child1 in node1.children.items():
+                child_path = current_path + "/" + name
+                child2 = children2.get(name)
+                if child2 is None:
+                    yield "Added", child_path, child1, None
+                    continue
+
+                if not child1.isDir and not child2.isDir and self.is_modified(child1, child2):
+                    yield "Modified", child_path, child1, child2
+                if child1.children or child2.children:
+                    pending.append((child1, child2, child_path))
+
+            children1 = node1.children
+            for name, child2 in children2.items():
+                if name not in children1:
+                    yield "Removed", current_path + "/" + name, None, child2
+
+    @Metrics.timed("diff")
+    def find_differences(self, tree2):
+        """
+        Compare two trees in a single pass, and collect the differences in both directions.
 
-        if current_value in node.children:
-            if len(path) == 1:
-                del node.children[current_value]
+        Parameters:
+        - tree2: The second tree to compare with.
+
+        Returns:
+        A tuple of two dictionaries of "Additions", "Deletions" and "Modifications" lists of
+        (path, drive id, isDir) tuples: the changes of this tree relative to tree2, as returned by
+        self.find_difference_path(tree2), and the changes of tree2 relative to this tree, as returned by
+        tree2.find_difference_path(self).
+        """
+        changes_dic = {"Additions": [], "Deletions": [], "Modifications": []}
+        changes_dic2 = {"Additions": [], "Deletions": [], "Modifications": []}
+
+        for kind, path, node1, node2 in self.iter_differences(tree2):
+            if kind == "Added":
+                change = (path, node1.id, node1.isDir)
+                changes_dic["Additions"].append(change)
+                changes_dic2["Deletions"].append(change)
+            elif kind == "Removed":
+                change = (path, node2.id, node2.isDir)
+                changes_dic["Deletions"].append(change)
+                changes_dic2["Additions"].append(change)
             else:
-                self._remove_recursive(node.children[current_value], path[1:])
-        else:
-            pass  # Value not found in the children, do nothing
+                changes_dic["Modifications"].append((path, node1.id or node2.id, False))
+                changes_dic2["Modifications"].append((path, node2.id or node1.id, False))
+
+        return changes_dic, changes_dic2
 
     def find_difference_path(self, tree2):
         """
@@ -99,114 +267,157 @@ class Tree:
         Returns:
         A dictionary containing lists of additions and deletions.
         """
-        changes_dic = {"Additions": [], "Deletions": [], "Modifications": []}
+        return self.find_differences(tree2)[0]
 
-        def compare_and_print_paths(node1, node2, current_path):
-            """
-            Helper function to recursively compare nodes in two trees.
+    @staticmethod
+    def is_modified(node1, node2):
+        """
+        Decide whether two nodes at the same path hold different file contents.
 
-            Parameters:
-            - node1: Current node in the first tree.
-            - node2: Current node in the second tree.
-            - current_path: Current path being traversed.
-            """
-            keys1 = set(node1.children.keys())
-            keys2 = set(node2.children.keys())
+        Parameters:
+        - node1: Node in the first tree.
+        - node2: Node in the second tree.
 
-            common_keys = keys1.intersection(keys2)
-            changes = keys1.symmetric_difference(keys2)
+        Returns:
+        True if the contents differ. Checksums are compared when both nodes have one, so same-size edits
+        are detected; otherwise the file sizes are compared.
+        """
+        if int(node1.fileSize) != int(node2.fileSize):
+            return True
+        if node1.checksum and node2.checksum:
+            return node1.checksum != node2.checksum
+        return False
 
-            for file_change in changes:
-                change_node = node1.children[file_change] if file_change in keys1 else node2.children[file_change]
-                final_path = f"{'/'.join(current_path)}/{file_change}" if not current_path else f"/{'/'.join(current_path)}/{file_change}"
-                if file_change in keys1:
-                    changes_dic["Additions"].append((final_path, change_node.id, change_node.isDir))
-                else:
-                    changes_dic["Deletions"].append((final_path, change_node.id, change_node.isDir))
+    def traverse_and_print(self):
+        """
+        Traverse and print the tree structure.
+        """
+        pending = [(self.root, 0)] if self.root else []
+        while pending:
+            node, depth = pending.pop()
+            print("\__ " * depth + str(node.value) + f" ({node.id})")
+            pending.extend((child_node, depth + 1) for child_node in reversed(list(node.children.values())))
 
-            for key in common_keys:
-                size_from_node_1 = node1.children[key].fileSize
-                size_from_node_2 = node2.children[key].fileSize
+    def get_node(self, path):
+        """
+        Get the node at the specified path.
 
-                file_id_in_gdrive = node1.children[key].id
-                final_path = f"{'/'.join(current_path)}/{key}" if not current_path else f"/{'/'.join(current_path)}/{key}"
+        Parameters:
+        - path: List representing the path to the desired node.
 
-                if(not file_id_in_gdrive): file_id_in_gdrive = node2.children[key].id
-                
-                if(not os.path.isdir(key) and int(size_from_node_1) != int(size_from_node_2)):
-                    
-                    changes_dic["Modifications"].append((final_path, file_id_in_gdrive, False))
+        Returns:
+        The node at the specified path and the number of nodes traversed. When the path does not exist,
+        the deepest existing node along it is returned.
+        """
+        if not self.root:
+            return None
 
-                compare_and_print_paths(node1.children[key], node2.children[key], current_path + [key])
+        node, nodes_traversed = self.root, 0
+        for current_value in path:
+            child = node.children.get(current_value)
+            if child is None:
+                break
+            node, nodes_traversed = child, nodes_traversed + 1
+        return node, nodes_traversed
 
-        if self.root and tree2.root:
-            compare_and_print_paths(self.root, tree2.root, [])
+    def find_node(self, path):
+        """
+        Get the node at exactly the specified path.
 
-        return changes_dic
+        Parameters:
+        - path: Sequence of names from below the root to the node.
 
-    def traverse_and_print(self):
-        """
-        Traverse and print the tree structure.
+        Returns:
+        The node, or None when the path does not exist.
         """
-        if self.root:
-            self._traverse_and_print_recursive(self.root)
-
-    def _traverse_and_print_recursive(self, node, depth=0):
+        node = self.root
+        for current_value in path:
+            if node is None:
+                return None
+            node = node.children.get(current_value)
+        return node
+
+    def iter_nodes(self):
         """
-        Recursively traverse and print the tree structure.
+        Yield every node below the root together with its path.
 
-        Parameters:
-        - node: The current node being processed.
-        - depth: Current depth in the tree.
+        Yields:
+        Tuples (path, node), where path is the tuple of names from below the root to the node.
         """
-        print("\__ " * depth + str(node.value) + f" ({node.id})")
-        for child_value, child_node in node.children.items():
-            self._traverse_and_print_recursive(child_node, depth + 1)
-
-    def get_node(self, path):
+        pending = [((), self.root)] if self.root else []
+        while pending:
+            path, node = pending.pop()
+            for name, child in node.children.items():
+                child_path = path + (name,)
+                yield child_path, child
+                pending.append((child_path, child))
+
+    def find_node_by_id(self, file_id):
         """
-        Get the node at the specified path.
+        Get the node with the given Drive id.
 
         Parameters:
-        - path: List representing the path to the desired node.
+        - file_id: The Drive id to look up.
 
         Returns:
-        The node at the specified path.
+        The node, or None.
         """
-        if self.root:
-            return self._get_node(self.root, path, nodes_traversed=0)
+        return self.nodes_by_id.get(file_id)
 
-    def _get_node(self, node, path, nodes_traversed):
+    def find_parent_node_by_id(self, file_id):
         """
-        Recursively get the node at the specified path.
+        Get the parent of the node with the given Drive id.
 
         Parameters:
-        - node: The current node being processed.
-        - path: Remaining path to traverse.
-        - nodes_traversed: Number of nodes traversed.
+        - file_id: The Drive id to look up.
 
         Returns:
-        The node at the specified path and the number of nodes traversed.
+        The parent node, or None.
         """
-        if not path:
-            return node, nodes_traversed
+        node = self.nodes_by_id.get(file_id)
+        return node.parent if node is not None else None
 
-        current_value = path[0]
+    def copy(self):
+        """
+        Copy the tree, so the copy can be changed without affecting this tree.
 
-        if current_value in node.children:
-            return self._get_node(node.children[current_value], path[1:], nodes_traversed + 1)
-        else:
-            return node, nodes_traversed  # Return the current node and nodes traversed
+        Returns:
+        A new Tree with the same nodes and id index.
+        """
+        tree = Tree.__new__(Tree)
+        tree.__setstate__(self.__getstate__())
+        return tree
 
-    def find_parent_node_by_id(self, file_id):
+    def __getstate__(self):
+        """
+        Pickle the tree as a flat list of nodes in pre-order, so saving neither recurses per level nor
+        stores the id index, which is rebuilt on load.
+        """
+        nodes = []
         if self.root:
-            return self._find_parent_node_by_id(self.root, file_id)
-
-    def _find_parent_node_by_id(self,node, file_id):
+            pending = [(-1, self.root)]
+            while pending:
+                parent_position, node = pending.pop()
+                position = len(nodes)
+                nodes.append((parent_position, node.value, node.id, node.isDir, node.fileSize, node.checksum))
+                pending.extend((position, child) for child in node.children.values())
+        return {'nodes': nodes}
+
+    def __setstate__(self, state):
+        """
+        Rebuild the tree and its id index from the list written by __getstate__.
+        """
+        self.root = None
+        self.nodes_by_id = {}
 
-        for child in node.children:
-            if node.children[child].id == file_id: return node
-            result = self._find_parent_node_by_id(node.children[child], file_id)
-            if result:
-                return result
-        return None
\ No newline at end of file
+        built = []
+        for parent_position, value, drive_id, isDir, fileSize, checksum in state['nodes']:
+            if parent_position < 0:
+                node = TreeNode(value, drive_id, isDir, fileSize, checksum)
+                self.root = node
+            else:
+                parent = built[parent_position]
+                node = TreeNode(value, drive_id, isDir, fileSize, checksum, parent=parent)
+                parent.children[value] = node
+            built.append(node)
+            self.index_node(node)
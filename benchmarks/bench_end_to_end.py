@@ -0,0 +1,205 @@
+"""
+Benchmark fetch, push, pull and sync end to end against an in-memory Drive, without a Drive account.
+
+For every size, builds a synthetic local tree and an identical Drive in FakeDriveService, then times:
+a cold fetch (full listing, every file hashed), a warm fetch (changes feed, local index), a push of local
+additions, edits and deletions, a pull of the same kinds of remote changes, a sync of trees already in step
+and a sync with changes on both sides. After every command the two sides are checked to match.
+
+With --engine asyncio, transfers, listings and metadata calls go through AsyncGoogleDriveHelper to the same
+Drive served over HTTP by FakeDriveServer, as with engine = asyncio in settings.conf.
+
+Run from the repository root (settings.conf is read from the working directory):
+python3 benchmarks/bench_end_to_end.py --sizes 10000,100000,1000000 --latency 0.02 --error-rate 0.01
+python3 benchmarks/bench_end_to_end.py --sizes 10000 --engine asyncio
+"""
+import argparse
+import builtins
+import contextlib
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ConfigurationManager
+
+os.makedirs(ConfigurationManager.LOGS_FOLDER_PATH, exist_ok=True)
+
+from bench_local_walk import build_synthetic_tree
+from fake_drive import FakeDriveService
+from GoogleDriveHelper import GoogleDriveHelper
+from GSpace import GSpace
+from RequestScheduler import RequestScheduler
+
+
+def seed_drive(service, folder_path):
+    """
+    Copy a local tree into the fake Drive.
+    """
+    folder_ids = {folder_path: service.root_id}
+    for directory, directory_names, file_names in os.walk(folder_path):
+        parent_id = folder_ids[directory]
+        for name in directory_names:
+            folder_ids[os.path.join(directory, name)] = service.add_folder(name, parent_id)
+        for name in file_names:
+            with open(os.path.join(directory, name), "rb") as local_file:
+                service.add_file(name, parent_id, local_file.read())
+
+
+def local_path_map(folder_path):
+    """
+    Map the "/"-separated path of every local entry to (isDir, size), like FakeDriveService.path_map.
+    """
+    paths = {}
+    for directory, directory_names, file_names in os.walk(folder_path):
+        relative = os.path.relpath(directory, folder_path)
+        prefix = "" if relative == "." else "/" + relative.replace(os.sep, "/")
+        for name in directory_names:
+            paths[f"{prefix}/{name}"] = (True, None)
+        for name in file_names:
+            paths[f"{prefix}/{name}"] = (False, os.path.getsize(os.path.join(directory, name)))
+    return paths
+
+
+def change_local(folder_path, count, rng, tag):
+    """
+    Edit, delete and add count local files each.
+
+    Returns:
+    The set of paths changed.
+    """
+    files = sorted(path for path, (isDir, size) in local_path_map(folder_path).items() if not isDir)
+    chosen = rng.sample(files, min(len(files), 2 * count))
+    for path in chosen[:count]:
+        with open(folder_path + path, "ab") as local_file:
+            local_file.write(f"edited {tag}".encode())
+    for path in chosen[count:]:
+        os.remove(folder_path + path)
+    for i in range(count):
+        with open(folder_path + os.path.dirname(rng.choice(chosen)) + f"/new_{tag}_{i}.dat", "wb") as local_file:
+            local_file.write(f"new file {tag} {i}".encode())
+    return set(chosen)
+
+
+def change_remote(service, count, rng, tag, exclude=()):
+    """
+    Edit, trash and add count files each in the fake Drive.
+
+    Parameters:
+    - exclude: Paths left alone, so a sync finds no conflicts.
+    """
+    with service.lock:
+        ids_by_path, pending = {}, [(service.root_id, "")]
+        while pending:
+            parent_id, parent_path = pending.pop()
+            for child_id in service.children.get(parent_id, []):
+                item = service.items.get(child_id)
+                if item is not None and not item['trashed']:
+                    ids_by_path[parent_path + "/" + item['name']] = child_id
+                    if item['data'] is None:
+                        pending.append((child_id, parent_path + "/" + item['name']))
+        file_ids = sorted(file_id for path, file_id in ids_by_path.items()
+                          if service.items[file_id]['data'] is not None and path not in exclude)
+        chosen = rng.sample(file_ids, min(len(file_ids), 2 * count))
+        for file_id in chosen[:count]:
+            service.update_item(file_id, {}, None, None, service.items[file_id]['data'] + f"edited {tag}".encode())
+        for file_id in chosen[count:]:
+            service.update_item(file_id, {'trashed': True}, None, None, None)
+        for i in range(count):
+            parent_id = service.items[rng.choice(file_ids)]['parents'][0]
+            service.add_file(f"remote_{tag}_{i}.dat", parent_id, f"remote file {tag} {i}".encode())
+
+
+def run_command(gspace, command, service, report):
+    """
+    Run a GSpace command with its output silenced and every confirmation answered, and report its timing.
+    """
+    requests_before = service.counters['requests']
+    start = time.perf_counter()
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        getattr(gspace, command)()
+    elapsed = time.perf_counter() - start
+    report(elapsed, service.counters['requests'] - requests_before)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", default="10000,100000", help="comma-separated numbers of files in the synthetic trees")
+    parser.add_argument("--changes", type=float, default=0.01, help="fraction of files edited, deleted and added per step")
+    parser.add_argument("--files-per-directory", type=int, default=100)
+    parser.add_argument("--directories-per-directory", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds every fake Drive request takes")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of fake Drive calls failing with 5xx")
+    parser.add_argument("--quota", type=float, default=None, help="fake Drive queries per second before 403 rate limit errors")
+    parser.add_argument("--client-qps", type=float, default=10000, help="queries per second GSpace's scheduler allows itself")
+    parser.add_argument("--engine", choices=("threads", "asyncio"), default="threads", help="transfer engine, as in settings.conf")
+    parser.add_argument("--path", help="parent directory for the synthetic trees")
+    parser.add_argument("--seed", type=int, default=0)
+    arguments = parser.parse_args()
+
+    # Every command asks for confirmation before changing anything
+    builtins.input = lambda prompt="": "yes"
+    ConfigurationManager.METRICS_REPORT_PATH = ConfigurationManager.METRICS_TEXTFILE_PATH = ""
+
+    print(f"{'files':>9} {'step':<26} {'seconds':>9} {'requests':>9}  check")
+    for size in (int(size) for size in arguments.sizes.split(",")):
+        workspace = tempfile.mkdtemp(prefix="gspace-bench-", dir=arguments.path)
+        with contextlib.ExitStack() as stack:
+            stack.callback(shutil.rmtree, workspace, ignore_errors=True)
+            rng = random.Random(arguments.seed)
+            folder_path = os.path.join(workspace, "root")
+            os.mkdir(folder_path)
+            build_synthetic_tree(folder_path, size, arguments.files_per_directory, arguments.directories_per_directory)
+
+            service = FakeDriveService(latency=arguments.latency, error_rate=arguments.error_rate,
+                                       queries_per_second=arguments.quota, seed=arguments.seed)
+            seed_drive(service, folder_path)
+
+            ConfigurationManager.LOCAL_FILESYSTEM_FOLDER_PATH = folder_path
+            ConfigurationManager.BACKUP_FOLDER_PATH = os.path.join(workspace, "backup")
+            ConfigurationManager.STATE_FOLDER_PATH = os.path.join(workspace, "state")
+            ConfigurationManager.ROOT_FOLDER_ID = service.root_id
+
+            ConfigurationManager.TRANSFER_ENGINE = arguments.engine
+            if arguments.engine == "asyncio":
+                # Imported here so aiohttp is only needed for the asyncio engine
+                from google.oauth2.credentials import Credentials
+                from AsyncDriveTransport import AsyncDriveTransport
+                from AsyncGoogleDriveHelper import AsyncGoogleDriveHelper
+                from fake_drive_server import FakeDriveServer
+
+                server = stack.enter_context(FakeDriveServer(service))
+                gdrive = AsyncGoogleDriveHelper(AsyncDriveTransport(Credentials(token="fake"), base_url=server.base_url,
+                                                                    queries_per_second=arguments.client_qps))
+                stack.callback(gdrive.close)
+            else:
+                gdrive = GoogleDriveHelper()
+            gdrive.service_factory = lambda: service
+            gdrive.scheduler = RequestScheduler(queries_per_second=arguments.client_qps)
+            gspace = GSpace(gdrive=gdrive)
+            count = max(1, int(size * arguments.changes))
+
+            def step(label, command):
+                def report(elapsed, requests):
+                    check = "ok" if service.path_map() == local_path_map(folder_path) else "MISMATCH"
+                    print(f"{size:>9} {label:<26} {elapsed:>9.2f} {requests:>9}  {check}", flush=True)
+                run_command(gspace, command, service, report)
+
+            step("fetch (cold)", "fetch")
+            step("fetch (warm)", "fetch")
+            change_local(folder_path, count, rng, "push")
+            step(f"push ({3 * count} changes)", "push")
+            change_remote(service, count, rng, "pull")
+            step(f"pull ({3 * count} changes)", "pull")
+            step("sync (in step)", "sync")
+            changed = change_local(folder_path, count // 2 or 1, rng, "sync")
+            change_remote(service, count // 2 or 1, rng, "sync", exclude=changed)
+            step(f"sync ({6 * (count // 2 or 1)} changes)", "sync")
+
+
+if __name__ == "__main__":
+    main()
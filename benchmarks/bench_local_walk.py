@@ -0,0 +1,110 @@
+"""
+Benchmark the local filesystem walker against the original os.listdir based one.
+
+Builds a synthetic tree in a temporary directory and times a cold scan with the original walker,
+a cold scan with FilesystemHelper, and a warm rescan that trusts unchanged directory mtimes.
+
+Run from the repository root (settings.conf is read from the working directory):
+python3 benchmarks/bench_local_walk.py --files 500000
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ConfigurationManager
+
+os.makedirs(ConfigurationManager.LOGS_FOLDER_PATH, exist_ok=True)
+
+from FilesystemHelper import FilesystemHelper
+from LocalIndex import LocalIndex
+from Tree import Tree
+
+
+def build_synthetic_tree(root, file_count, files_per_directory, directories_per_directory):
+    """
+    Create file_count small files spread over a balanced directory hierarchy.
+    """
+    created, pending = 0, [root]
+    while created < file_count:
+        directory = pending.pop(0)
+        for i in range(min(files_per_directory, file_count - created)):
+            with open(os.path.join(directory, f"file_{i}.dat"), "wb") as synthetic_file:
+                synthetic_file.write(b"x" * (i % 64))
+            created += 1
+        for i in range(directories_per_directory):
+            subdirectory = os.path.join(directory, f"dir_{i}")
+            os.mkdir(subdirectory)
+            pending.append(subdirectory)
+
+
+def legacy_walk(tree, folder_path):
+    """
+    The original walker: os.listdir, os.path.isdir and os.path.getsize per entry, tree.add from the root.
+    """
+    root_value = os.path.basename(folder_path)
+    tree.add([root_value])
+
+    def add_recursive(current_node, current_path):
+        for item in os.listdir(current_path):
+            item_path = os.path.join(current_path, item)
+            if os.path.isdir(item_path):
+                tree.add(current_node + [item])
+                add_recursive(current_node + [item], item_path)
+            else:
+                tree.add(current_node + [item], fileSize=os.path.getsize(item_path))
+
+    add_recursive([root_value], folder_path)
+
+
+def timed(label, function):
+    start = time.perf_counter()
+    function()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<40} {elapsed:8.2f} s")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--files", type=int, default=500000, help="number of files in the synthetic tree")
+    parser.add_argument("--files-per-directory", type=int, default=100)
+    parser.add_argument("--directories-per-directory", type=int, default=8)
+    parser.add_argument("--workers", type=int, default=ConfigurationManager.SCAN_WORKERS)
+    parser.add_argument("--path", help="parent directory for the synthetic tree, e.g. on a network mount")
+    arguments = parser.parse_args()
+
+    workspace = tempfile.mkdtemp(prefix="gspace-bench-", dir=arguments.path)
+    try:
+        folder_path = os.path.join(workspace, "root")
+        os.mkdir(folder_path)
+        print(f"Creating {arguments.files} files under {folder_path} ...")
+        build_synthetic_tree(folder_path, arguments.files, arguments.files_per_directory, arguments.directories_per_directory)
+
+        sys.setrecursionlimit(max(sys.getrecursionlimit(), 10000))
+        legacy = timed("legacy listdir walker", lambda: legacy_walk(Tree(), folder_path))
+
+        def scan(workers, trust_directory_mtime):
+            helper = FilesystemHelper()
+            helper.FOLDER_PATH = folder_path
+            helper.SCAN_WORKERS = workers
+            helper.TRUST_DIRECTORY_MTIME = trust_directory_mtime
+            helper.index = LocalIndex(os.path.join(workspace, "local_index.sqlite3"))
+            return lambda: helper.generate_tree_from_filesystem(Tree())
+
+        single = timed("scandir walker, 1 worker (cold)", scan(1, False))
+        parallel = timed(f"scandir walker, {arguments.workers} workers", scan(arguments.workers, False))
+        warm = timed(f"scandir walker, {arguments.workers} workers, trusted", scan(arguments.workers, True))
+
+        print(f"speedup vs legacy: 1 worker {legacy / single:.2f}x, "
+              f"{arguments.workers} workers {legacy / parallel:.2f}x, trusted rescan {legacy / warm:.2f}x")
+    finally:
+        shutil.rmtree(workspace, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+Benchmark GSpace startup: the time from a fresh interpreter to a ready Google Drive service.
+
+Each measurement runs in a new interpreter, like a cron job would, with a saved token that has not expired,
+so no network is used. It compares the original startup (eager googleapiclient and OAuth imports, build()
+per service) with the current one (lazy imports, shared discovery document, background credential load).
+
+Run from the repository root (settings.conf is read from the working directory):
+python3 benchmarks/bench_startup.py --runs 20 --threads 8
+"""
+import argparse
+import datetime
+import os
+import pickle
+import statistics
+import subprocess
+import sys
+import tempfile
+
+REPOSITORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SETUP = """
+import os, sys, time
+start = time.perf_counter()
+sys.path.insert(0, {repository!r})
+"""
+
+ORIGINAL_STARTUP = SETUP + """
+import pickle
+from concurrent.futures import ThreadPoolExecutor
+from google.auth.transport.requests import Request
+from google_auth_oauthlib.flow import InstalledAppFlow
+from googleapiclient.discovery import build
+from googleapiclient.errors import HttpError
+from googleapiclient.http import MediaFileUpload, MediaIoBaseDownload
+imported = time.perf_counter()
+with open({token_path!r}, 'rb') as token:
+    credentials = pickle.load(token)
+with ThreadPoolExecutor({threads}) as executor:
+    list(executor.map(lambda _: build('drive', 'v3', credentials=credentials), range({threads})))
+print(imported - start, time.perf_counter() - start)
+"""
+
+CURRENT_STARTUP = SETUP + """
+from concurrent.futures import ThreadPoolExecutor
+import ConfigurationManager
+ConfigurationManager.OUTPUT_TOKEN_FILE = {token_path!r}
+import GSpace
+from GoogleDriveHelper import GoogleDriveHelper
+imported = time.perf_counter()
+gdrive = GoogleDriveHelper()
+gdrive.initialize_service()
+with ThreadPoolExecutor({threads}) as executor:
+    list(executor.map(lambda _: gdrive.service, range({threads})))
+print(imported - start, time.perf_counter() - start)
+"""
+
+
+def write_token(path):
+    """
+    Save credentials holding an access token valid for another hour, as the OAuth flow would.
+    """
+    from google.oauth2.credentials import Credentials
+    credentials = Credentials("benchmark-token", refresh_token="benchmark-refresh", client_id="id",
+                              client_secret="secret", token_uri="https://oauth2.googleapis.com/token",
+                              expiry=datetime.datetime.utcnow() + datetime.timedelta(hours=1))
+    with open(path, "wb") as token:
+        pickle.dump(credentials, token)
+
+
+def measure(code, runs):
+    """
+    Run a snippet in fresh interpreters and collect its (import time, total time) measurements.
+    """
+    imports, totals = [], []
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, "-c", code], cwd=REPOSITORY, check=True,
+                                capture_output=True, text=True).stdout
+        imported, total = map(float, output.split()[-2:])
+        imports.append(imported)
+        totals.append(total)
+    return statistics.median(imports), statistics.median(totals)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--threads", type=int, default=8, help="worker threads that each build their own service")
+    arguments = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temporary:
+        token_path = os.path.join(temporary, "token.pickle")
+        write_token(token_path)
+        parameters = {"repository": REPOSITORY, "token_path": token_path, "threads": arguments.threads}
+
+        for label, code in (("original", ORIGINAL_STARTUP), ("current", CURRENT_STARTUP)):
+            imported, total = measure(code.format(**parameters), arguments.runs)
+            print(f"{label:>8}: imports {imported * 1000:7.1f} ms, ready with {arguments.threads} services "
+                  f"{total * 1000:7.1f} ms (median of {arguments.runs})")
+
+
+if __name__ == "__main__":
+    main()
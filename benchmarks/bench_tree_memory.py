@@ -0,0 +1,129 @@
+"""
+Benchmark the memory and time of Tree against CompactTree, the columnar prototype in compact_tree.py.
+
+Builds a synthetic Drive-like listing (33-character ids, MD5 checksums, sizes as strings, as Drive returns
+them) in memory, then for each representation measures the memory held after building it, the build time,
+and the time to diff it against a copy with a fraction of the files changed. The two diffs are checked to
+find the same changes.
+
+Run from the repository root (settings.conf is read from the working directory):
+python3 benchmarks/bench_tree_memory.py --entries 1000000,10000000
+"""
+import argparse
+import gc
+import hashlib
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ConfigurationManager
+
+os.makedirs(ConfigurationManager.LOGS_FOLDER_PATH, exist_ok=True)
+
+from compact_tree import CompactTree
+from Tree import Tree
+
+
+def synthetic_listing(entry_count, files_per_directory, directories_per_directory, seed):
+    """
+    Yield (parent position, name, drive id, isDir, size, checksum) for a balanced hierarchy, in an order
+    where every parent comes before its children. Position 0 is the root.
+    """
+    rng = random.Random(seed)
+    yield -1, "root", "root-folder-id", True, None, None
+    produced, pending, next_position = 1, [0], 1
+    while produced < entry_count:
+        parent = pending.pop(0)
+        for i in range(min(files_per_directory, entry_count - produced)):
+            checksum = hashlib.md5(f"{parent}/{i}".encode()).hexdigest()
+            yield parent, f"file_{i}.dat", "1" + checksum[:32], False, str(rng.randrange(1 << 30)), checksum
+            produced += 1
+            next_position += 1
+        for i in range(min(directories_per_directory, entry_count - produced)):
+            yield parent, f"dir_{i}", "0" + hashlib.md5(f"{parent}/d{i}".encode()).hexdigest(), True, None, None
+            pending.append(next_position)
+            produced += 1
+            next_position += 1
+
+
+def build(tree_class, listing, changed=frozenset()):
+    """
+    Build a tree through add_child, the way the Drive listing is turned into a tree, editing the sizes of
+    the positions in changed.
+    """
+    tree, nodes = tree_class(), []
+    for position, (parent, name, drive_id, isDir, size, checksum) in enumerate(listing):
+        if position in changed:
+            size, checksum = str(int(size) + 1), None
+        if parent < 0:
+            tree.add([name], drive_id, isDir, size, checksum)
+            nodes.append(tree.root if isDir else None)
+        else:
+            node = tree.add_child(nodes[parent], name, drive_id, isDir, size, checksum)
+            nodes.append(node if isDir else None)
+    return tree
+
+
+def measure(tree_class, arguments, entry_count, changed):
+    """
+    Build one representation twice and diff the copies.
+
+    Returns:
+    A tuple (megabytes held by one tree, build seconds, diff seconds, diff result).
+    """
+    def listing():
+        return synthetic_listing(entry_count, arguments.files_per_directory, arguments.directories_per_directory,
+                                 arguments.seed)
+
+    gc.collect()
+    tracemalloc.start()
+    tree = build(tree_class, listing())
+    gc.collect()
+    held = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    # Timed without tracemalloc, which slows every allocation down
+    start = time.perf_counter()
+    other = build(tree_class, listing(), changed)
+    build_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    differences = tree.find_difference_path(other)
+    diff_seconds = time.perf_counter() - start
+    return held / 1048576, build_seconds, diff_seconds, differences
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--entries", default="100000,1000000", help="comma-separated numbers of entries in the trees")
+    parser.add_argument("--changes", type=float, default=0.01, help="fraction of entries changed in the compared copy")
+    parser.add_argument("--files-per-directory", type=int, default=100)
+    parser.add_argument("--directories-per-directory", type=int, default=8)
+    parser.add_argument("--seed", type=int, default=0)
+    arguments = parser.parse_args()
+
+    print(f"{'entries':>10} {'tree':<12} {'MiB':>9} {'bytes/entry':>12} {'build s':>9} {'diff s':>8}  check")
+    for entry_count in (int(count) for count in arguments.entries.split(",")):
+        rng = random.Random(arguments.seed)
+        files = [position for position, entry in enumerate(synthetic_listing(
+            entry_count, arguments.files_per_directory, arguments.directories_per_directory, arguments.seed)) if not entry[3]]
+        changed = frozenset(rng.sample(files, int(len(files) * arguments.changes)))
+
+        results = {}
+        for tree_class in (Tree, CompactTree):
+            megabytes, build_seconds, diff_seconds, differences = measure(tree_class, arguments, entry_count, changed)
+            results[tree_class] = {kind: sorted(changes) for kind, changes in differences.items()}
+            check = ""
+            if tree_class is CompactTree:
+                check = "ok" if results[Tree] == results[CompactTree] else "MISMATCH"
+            print(f"{entry_count:>10} {tree_class.__name__:<12} {megabytes:>9.1f} {megabytes * 1048576 / entry_count:>12.0f} "
+                  f"{build_seconds:>9.2f} {diff_seconds:>8.2f}  {check}", flush=True)
+            del differences
+            gc.collect()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,378 @@
+import sys
+from array import array
+from collections import OrderedDict
+
+from Metrics import Metrics
+
+class CompactNode:
+    """
+    A view of one entry of a CompactTree, with the same attributes as TreeNode. Views are created on
+    demand and hold nothing but the tree and the entry's position, so keeping the tree costs no object
+    per entry.
+    """
+
+    __slots__ = ('tree', 'index')
+
+    def __init__(self, tree, index):
+        self.tree = tree
+        self.index = index
+
+    def __eq__(self, other):
+        return isinstance(other, CompactNode) and other.tree is self.tree and other.index == self.index
+
+    def __hash__(self):
+        return hash((id(self.tree), self.index))
+
+    @property
+    def value(self):
+        return self.tree.names[self.tree.name_ids[self.index]]
+
+    @property
+    def id(self):
+        return self.tree.id_at(self.index)
+
+    @property
+    def isDir(self):
+        return self.tree.DIRECTORY_FLAGS[self.tree.flags[self.index]]
+
+    @property
+    def fileSize(self):
+        return self.tree.sizes[self.index]
+
+    @property
+    def checksum(self):
+        return self.tree.checksum_at(self.index)
+
+    @property
+    def parent(self):
+        parent = self.tree.parents[self.index]
+        return CompactNode(self.tree, parent) if parent >= 0 else None
+
+    @property
+    def children(self):
+        """
+        The children of the entry, as a new dictionary of name -> CompactNode.
+        """
+        return {self.tree.names[self.tree.name_ids[child]]: CompactNode(self.tree, child)
+                for child in self.tree.child_indexes(self.index)}
+
+
+class CompactTree:
+    """
+    A prototype of a columnar Tree for drives with tens of millions of entries, measured against Tree by
+    bench_tree_memory.py. GSpace does not use it: it lacks the id index and the moves (nodes_by_id, path_of,
+    attach, detach, remove, find_node_by_id) that replaying the changes feed and planning transfers need.
+
+    Instead of a TreeNode object, a children dictionary and separate strings per entry, every attribute
+    is one column indexed by the entry's position: names are interned once in a shared table, parents and
+    sizes are arrays of machine integers, Drive ids are packed into one bytes table and MD5 checksums are
+    stored as 16 raw bytes. Children are linked through first-child/next-sibling arrays. Looking a child up
+    by name builds a name -> position map of its siblings, kept for the LOOKUP_CACHE_SIZE folders used
+    last, so no per-entry dictionary lives as long as the tree.
+
+    Drive reports sizes as strings; they are converted once when added, so the diff compares integers.
+
+    It supports what the benchmark builds and compares trees with, add, add_child, get_node and
+    find_difference_path, and returns CompactNode views with the attributes of TreeNode. It is built once
+    and read.
+
+    Usage:
+    tree = CompactTree()
+    tree.add(["root"], "root-id", True)
+    tree.add(["root", "a.txt"], "file-id", False, "12", "0cc175b9c0f1b6a831c399e269772661")
+    node, depth = tree.get_node(["a.txt"])
+    """
+
+    # flags column value -> isDir
+    DIRECTORY_FLAGS = (False, True, None)
+    EMPTY_CHECKSUM = bytes(16)
+    # Folders whose children stay mapped by name between lookups
+    LOOKUP_CACHE_SIZE = 256
+
+    def __init__(self):
+        self.names = []
+        self.name_numbers = {}
+        self.name_ids = array('I')
+        self.parents = array('q')
+        self.first_children = array('q')
+        self.next_siblings = array('q')
+        self.sizes = array('q')
+        self.flags = bytearray()
+        self.id_offsets = array('q', [0])
+        self.id_table = bytearray()
+        self.checksums = bytearray()
+        # Checksums that are not 32 hex digits, by position
+        self.other_checksums = {}
+        # Folder position -> {name number: child position}, least recently used first
+        self.lookup_cache = OrderedDict()
+        self.root = None
+
+    def __len__(self):
+        return len(self.parents)
+
+    def intern_name(self, name):
+        number = self.name_numbers.get(name)
+        if number is None:
+            number = self.name_numbers[name] = len(self.names)
+            self.names.append(sys.intern(name))
+        return number
+
+    def append_entry(self, parent, value, drive_id, isDir, fileSize, checksum):
+        """
+        Append an entry to every column and link it under its parent.
+
+        Returns:
+        The position of the new entry.
+        """
+        index = len(self.parents)
+        name_number = self.intern_name(value)
+        self.name_ids.append(name_number)
+        self.parents.append(parent)
+        self.first_children.append(-1)
+        self.sizes.append(int(fileSize or 0))
+        self.flags.append(2 if isDir is None else int(bool(isDir)))
+
+        self.id_table += drive_id.encode() if drive_id else b""
+        self.id_offsets.append(len(self.id_table))
+
+        packed = self.EMPTY_CHECKSUM
+        if checksum:
+            try:
+                packed = bytes.fromhex(checksum)
+            except ValueError:
+                packed = b""
+            if len(packed) != 16:
+                self.other_checksums[index] = checksum
+                packed = self.EMPTY_CHECKSUM
+        self.checksums += packed
+
+        if parent < 0:
+            self.next_siblings.append(-1)
+        else:
+            self.next_siblings.append(self.first_children[parent])
+            self.first_children[parent] = index
+            siblings = self.lookup_cache.get(parent)
+            if siblings is not None:
+                siblings[name_number] = index
+        return index
+
+    def id_at(self, index):
+        start, end = self.id_offsets[index], self.id_offsets[index + 1]
+        return self.id_table[start:end].decode() if end > start else None
+
+    def checksum_at(self, index):
+        packed = self.checksums[index * 16:index * 16 + 16]
+        if packed != self.EMPTY_CHECKSUM:
+            return packed.hex()
+        return self.other_checksums.get(index)
+
+    def child_index(self, parent, name):
+        """
+        Get the position of the child of parent called name, or -1.
+        """
+        name_number = self.name_numbers.get(name)
+        if name_number is None:
+            return -1
+
+        siblings = self.lookup_cache.get(parent)
+        if siblings is None:
+            name_ids = self.name_ids
+            siblings = {name_ids[child]: child for child in self.child_indexes(parent)}
+            self.lookup_cache[parent] = siblings
+            if len(self.lookup_cache) > self.LOOKUP_CACHE_SIZE:
+                self.lookup_cache.popitem(last=False)
+        else:
+            self.lookup_cache.move_to_end(parent)
+        return siblings.get(name_number, -1)
+
+    def child_indexes(self, parent):
+        """
+        Yield the positions of the children of parent.
+        """
+        child = self.first_children[parent]
+        while child >= 0:
+            yield child
+            child = self.next_siblings[child]
+
+    def add(self, path, drive_id=None, isDir=None, fileSize=0, checksum=None):
+        """
+        Add a node to the tree based on the given path, like Tree.add.
+
+        Parameters:
+        - path: List representing the path to the node, starting with the root's name.
+        - drive_id: Identifier for the drive associated with the node.
+        - isDir: Boolean indicating whether the node represents a directory.
+        - fileSize: Size of the file in bytes, as an integer or a string.
+        - checksum: MD5 checksum of the file contents, if known.
+        """
+        if self.root is None:
+            self.root = CompactNode(self, self.append_entry(-1, path[0], drive_id, isDir, fileSize, checksum))
+            return
+
+        index = self.root.index
+        for current_value in path[1:]:
+            child = self.child_index(index, current_value)
+            if child < 0:
+                child = self.append_entry(index, current_value, drive_id, isDir, fileSize, checksum)
+            index = child
+
+    def add_child(self, parent, value, drive_id=None, isDir=None, fileSize=0, checksum=None):
+        """
+        Attach a node directly under an existing parent node, like Tree.add_child.
+
+        Parameters:
+        - parent: The CompactNode the child is attached to.
+        - value: The value of the child node.
+        - drive_id: Identifier for the drive associated with the node.
+        - isDir: Boolean indicating whether the node represents a directory.
+        - fileSize: Size of the file in bytes.
+        - checksum: MD5 checksum of the file contents, if known.
+
+        Returns:
+        The child node. An existing child with the same value is kept.
+        """
+        child = self.child_index(parent.index, value)
+        if child < 0:
+            child = self.append_entry(parent.index, value, drive_id, isDir, fileSize, checksum)
+        return CompactNode(self, child)
+
+    def get_node(self, path):
+        """
+        Get the node at the specified path.
+
+        Parameters:
+        - path: List representing the path to the desired node, below the root.
+
+        Returns:
+        The node at the specified path and the number of nodes traversed. When the path does not exist,
+        the deepest existing node along it is returned.
+        """
+        if self.root is None:
+            return None
+
+        index, nodes_traversed = self.root.index, 0
+        for current_value in path:
+            child = self.child_index(index, current_value)
+            if child < 0:
+                break
+            index, nodes_traversed = child, nodes_traversed + 1
+        return CompactNode(self, index), nodes_traversed
+
+    def is_modified(self, index, tree2, index2):
+        """
+        Decide whether two file entries hold different contents, like Tree.is_modified.
+        """
+        if self.sizes[index] != tree2.sizes[index2]:
+            return True
+        checksum1, checksum2 = self.checksum_at(index), tree2.checksum_at(index2)
+        if checksum1 and checksum2:
+            return checksum1 != checksum2
+        return False
+
+    def iter_differences(self, tree2):
+        """
+        Walk two compact trees together once and yield every difference between them, like
+        Tree.iter_differences but with entry positions instead of nodes.
+
+        Parameters:
+        - tree2: The CompactTree to compare with.
+
+        Yields:
+        Tuples (kind, path, index1, index2), where kind is "Added" (index2 is -1), "Removed" (index1 is -1)
+        or "Modified", and path is the "/"-separated path below the roots, starting with "/".
+        """
+        if self.root is None or tree2.root is None:
+            return
+
+        names, name_ids, flags, first_children = self.names, self.name_ids, self.flags, self.first_children
+        names2, name_ids2 = tree2.names, tree2.name_ids
+        pending = [(self.root.index, tree2.root.index, "")]
+        while pending:
+            index1, index2, current_path = pending.pop()
+            # Built for this folder only, so the walk never holds more than one map per level
+            children2 = {names2[name_ids2[child2]]: child2 for child2 in tree2.child_indexes(index2)}
+
+            for child1 in self.child_indexes(index1):
+                name = names[name_ids[child1]]
+                child_path = current_path + "/" + name
+                # Whatever is left in children2 afterwards is only in tree2
+                child2 = children2.pop(name, -1)
+                if child2 < 0:
+                    yield "Added", child_path, child1, -1
+                    continue
+
+                if flags[child1] != 1 and tree2.flags[child2] != 1 and self.is_modified(child1, tree2, child2):
+                    yield "Modified", child_path, child1, child2
+                if first_children[child1] >= 0 or tree2.first_children[child2] >= 0:
+                    pending.append((child1, child2, child_path))
+
+            for name, child2 in children2.items():
+                yield "Removed", current_path + "/" + name, -1, child2
+
+    @Metrics.timed("diff")
+    def find_differences(self, tree2):
+        """
+        Compare two compact trees in a single pass, and collect the differences in both directions.
+
+        Parameters:
+        - tree2: The CompactTree to compare with.
+
+        Returns:
+        The same pair of dictionaries as Tree.find_differences.
+        """
+        changes_dic = {"Additions": [], "Deletions": [], "Modifications": []}
+        changes_dic2 = {"Additions": [], "Deletions": [], "Modifications": []}
+
+        for kind, path, index1, index2 in self.iter_differences(tree2):
+            if kind == "Added":
+                change = (path, self.id_at(index1), self.DIRECTORY_FLAGS[self.flags[index1]])
+                changes_dic["Additions"].append(change)
+                changes_dic2["Deletions"].append(change)
+            elif kind == "Removed":
+                change = (path, tree2.id_at(index2), self.DIRECTORY_FLAGS[tree2.flags[index2]])
+                changes_dic["Deletions"].append(change)
+                changes_dic2["Additions"].append(change)
+            else:
+                id1, id2 = self.id_at(index1), tree2.id_at(index2)
+                changes_dic["Modifications"].append((path, id1 or id2, False))
+                changes_dic2["Modifications"].append((path, id2 or id1, False))
+
+        return changes_dic, changes_dic2
+
+    def find_difference_path(self, tree2):
+        """
+        Compare two trees and find the differences in node paths between them.
+
+        Parameters:
+        - tree2: The CompactTree to compare with.
+
+        Returns:
+        A dictionary containing lists of additions, deletions and modifications.
+        """
+        return self.find_differences(tree2)[0]
+
+    @classmethod
+    def from_tree(cls, tree):
+        """
+        Build a CompactTree holding the same entries as a Tree.
+
+        Parameters:
+        - tree: The Tree to convert.
+
+        Returns:
+        The new CompactTree.
+        """
+        compact = cls()
+        if tree.root is None:
+            return compact
+
+        root = tree.root
+        compact.add([root.value], root.id, root.isDir, root.fileSize, root.checksum)
+        pending = [(root, compact.root.index)]
+        while pending:
+            node, index = pending.pop()
+            for name, child in node.children.items():
+                child_index = compact.append_entry(index, name, child.id, child.isDir, child.fileSize, child.checksum)
+                if child.children:
+                    pending.append((child, child_index))
+        return compact
@@ -0,0 +1,498 @@
+"""
+In-memory stand-in for the parts of the Google Drive v3 service GSpace uses, for benchmarks that must run
+without a Drive account.
+
+It serves files().list/get/create/update/delete/copy/get_media, changes().getStartPageToken/list,
+batch requests and resumable media uploads, returning the same shapes as googleapiclient. Requests can be
+slowed down, failed at random and rate limited, so retries and backoff are exercised as well:
+
+    service = FakeDriveService(latency=0.05, error_rate=0.01, queries_per_second=100)
+    folder_id = service.add_folder("photos", service.root_id)
+    service.add_file("cat.jpg", folder_id, b"...")
+    gdrive = GoogleDriveHelper()
+    gdrive.service_factory = lambda: service
+
+Media uploads take googleapiclient's MediaFileUpload, and downloads are read with MediaIoBaseDownload, so
+the resumable code paths of GoogleDriveHelper run unchanged.
+"""
+import hashlib
+import itertools
+import json
+import random
+import re
+import threading
+import time
+
+import httplib2
+from googleapiclient.errors import HttpError
+from googleapiclient.http import MediaUploadProgress
+
+FOLDER_MIME_TYPE = 'application/vnd.google-apps.folder'
+# Drive rejects batches with more calls than this
+MAX_BATCH_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+
+def http_error(status, reason="backendError", message="Injected error"):
+    """
+    Build the HttpError googleapiclient raises for a failed call.
+    """
+    content = json.dumps({'error': {'code': status, 'message': message,
+                                    'errors': [{'reason': reason, 'message': message}]}}).encode()
+    return HttpError(httplib2.Response({'status': str(status)}), content)
+
+
+class FakeRequest:
+    """
+    A files() or changes() call, run when executed like googleapiclient's HttpRequest.
+    """
+
+    def __init__(self, service, method_id, handler):
+        self.service = service
+        self.methodId = method_id
+        self.handler = handler
+
+    def execute(self, http=None, num_retries=0):
+        self.service.before_request(self.methodId)
+        return self.service.run(self.handler)
+
+
+class FakeUploadRequest(FakeRequest):
+    """
+    A create or update call with media, uploaded chunk by chunk through a resumable session like
+    googleapiclient's resumable HttpRequest. Setting resumable_uri and _in_error_state continues a session.
+    """
+
+    def __init__(self, service, method_id, media_body, finish):
+        super().__init__(service, method_id, None)
+        self.media_body = media_body
+        self.finish = finish
+        self.resumable_uri = None
+        self.resumable_progress = 0
+        self._in_error_state = False
+
+    def next_chunk(self, http=None, num_retries=0):
+        try:
+            self.service.before_request(self.methodId)
+        except HttpError:
+            # Like googleapiclient, the next call first asks the session how much it received
+            self._in_error_state = True
+            raise
+
+        with self.service.lock:
+            if self.resumable_uri is None:
+                self.resumable_uri = f"fake://upload/{next(self.service.ids)}"
+                self.service.sessions[self.resumable_uri] = bytearray()
+            session = self.service.sessions.get(self.resumable_uri)
+            if session is None:
+                raise http_error(404, "notFound", "Upload session expired")
+            if self._in_error_state:
+                self._in_error_state = False
+            self.resumable_progress = len(session)
+
+        total = self.media_body.size()
+        chunk = self.media_body.getbytes(self.resumable_progress, self.media_body.chunksize())
+        with self.service.lock:
+            session.extend(chunk)
+            self.resumable_progress = len(session)
+            if self.resumable_progress < total:
+                return MediaUploadProgress(self.resumable_progress, total), None
+            del self.service.sessions[self.resumable_uri]
+            self.service.counters['uploaded_bytes'] += total
+            return None, self.finish(bytes(session))
+
+    def execute(self, http=None, num_retries=0):
+        response = None
+        while response is None:
+            _, response = self.next_chunk()
+        return response
+
+
+class FakeMediaHttp:
+    """
+    The http object MediaIoBaseDownload reads file contents through, honouring Range headers.
+    """
+
+    def __init__(self, service, file_id):
+        self.service = service
+        self.file_id = file_id
+
+    def request(self, uri, method="GET", body=None, headers=None, **kwargs):
+        try:
+            self.service.before_request("drive.files.get_media")
+        except HttpError as e:
+            return e.resp, e.content
+
+        with self.service.lock:
+            item = self.service.items.get(self.file_id)
+            if item is None or item['mimeType'] == FOLDER_MIME_TYPE:
+                error = http_error(404, "notFound", "File not found")
+                return error.resp, error.content
+            data = item['data']
+
+        start, end = 0, len(data) - 1
+        match = re.match(r"bytes=(\d+)-(\d*)", (headers or {}).get('range', ''))
+        if match:
+            start = int(match.group(1))
+            end = min(end, int(match.group(2))) if match.group(2) else end
+        if start >= len(data):
+            return httplib2.Response({'status': '416', 'content-range': f"bytes */{len(data)}"}), b""
+
+        content = data[start:end + 1]
+        with self.service.lock:
+            self.service.counters['downloaded_bytes'] += len(content)
+        return httplib2.Response({'status': '206', 'content-range': f"bytes {start}-{end}/{len(data)}",
+                                  'content-length': str(len(content))}), content
+
+
+class FakeMediaRequest:
+    """
+    The request returned by files().get_media, as consumed by MediaIoBaseDownload.
+    """
+
+    def __init__(self, service, file_id):
+        self.uri = f"fake://media/{file_id}"
+        self.http = FakeMediaHttp(service, file_id)
+        self.headers = {}
+        self.methodId = "drive.files.get_media"
+
+
+class FakeBatch:
+    """
+    A batch request: every call counts against the quota and may fail on its own, and the results are
+    delivered through callbacks like googleapiclient's BatchHttpRequest.
+    """
+
+    def __init__(self, service, callback=None):
+        self.service = service
+        self.callback = callback
+        self.requests = []
+
+    def add(self, request, callback=None, request_id=None):
+        self.requests.append((request_id if request_id is not None else str(len(self.requests)), request, callback))
+
+    def execute(self, http=None):
+        if len(self.requests) > MAX_BATCH_SIZE:
+            raise http_error(400, "batchSizeTooLarge", f"A batch holds at most {MAX_BATCH_SIZE} calls")
+        # The whole batch is one round trip
+        self.service.before_request("batch", count=False)
+        for request_id, request, callback in self.requests:
+            response, exception = None, None
+            try:
+                self.service.before_request(request.methodId, sleep=False)
+                response = self.service.run(request.handler)
+            except HttpError as e:
+                exception = e
+            (callback or self.callback)(request_id, response, exception)
+
+
+class FakeFiles:
+    """
+    The files() collection.
+    """
+
+    def __init__(self, service):
+        self.service = service
+
+    def list(self, q="", pageSize=100, pageToken=None, fields=None, spaces=None, **kwargs):
+        return FakeRequest(self.service, "drive.files.list",
+                           lambda: self.service.list_items(q, min(pageSize or 100, MAX_PAGE_SIZE), pageToken))
+
+    def get(self, fileId, fields=None, **kwargs):
+        return FakeRequest(self.service, "drive.files.get", lambda: self.service.resource(self.service.get_item(fileId)))
+
+    def get_media(self, fileId, **kwargs):
+        return FakeMediaRequest(self.service, fileId)
+
+    def create(self, body=None, media_body=None, fields=None, **kwargs):
+        body = dict(body or {})
+        if media_body is not None:
+            return FakeUploadRequest(self.service, "drive.files.create", media_body,
+                                     lambda data: self.service.resource(self.service.create_item(body, data)))
+        return FakeRequest(self.service, "drive.files.create",
+                           lambda: self.service.resource(self.service.create_item(body, None)))
+
+    def update(self, fileId, body=None, media_body=None, addParents=None, removeParents=None, fields=None, **kwargs):
+        body = dict(body or {})
+        if media_body is not None:
+            return FakeUploadRequest(self.service, "drive.files.update", media_body, lambda data: self.service.resource(
+                self.service.update_item(fileId, body, addParents, removeParents, data)))
+        return FakeRequest(self.service, "drive.files.update", lambda: self.service.resource(
+            self.service.update_item(fileId, body, addParents, removeParents, None)))
+
+    def copy(self, fileId, body=None, fields=None, **kwargs):
+        body = dict(body or {})
+        return FakeRequest(self.service, "drive.files.copy", lambda: self.service.resource(self.service.copy_item(fileId, body)))
+
+    def delete(self, fileId, **kwargs):
+        return FakeRequest(self.service, "drive.files.delete", lambda: self.service.delete_item(fileId))
+
+
+class FakeChanges:
+    """
+    The changes() collection.
+    """
+
+    def __init__(self, service):
+        self.service = service
+
+    def getStartPageToken(self, **kwargs):
+        return FakeRequest(self.service, "drive.changes.getStartPageToken",
+                           lambda: {'startPageToken': str(len(self.service.change_log) + 1)})
+
+    def list(self, pageToken, pageSize=100, fields=None, spaces=None, includeRemoved=True, **kwargs):
+        return FakeRequest(self.service, "drive.changes.list",
+                           lambda: self.service.list_changes(pageToken, min(pageSize or 100, MAX_PAGE_SIZE)))
+
+
+class FakeDriveService:
+    """
+    In-memory Drive holding a tree of folders and files below root_id. Thread-safe, so it can be shared by
+    every worker thread the way per-thread googleapiclient services share one Drive.
+    """
+
+    def __init__(self, root_id="fake-root", latency=0.0, error_rate=0.0, error_statuses=(500, 503),
+                 queries_per_second=None, seed=0):
+        """
+        Initialize FakeDriveService.
+
+        Parameters:
+        - root_id: Drive id of the synced root folder.
+        - latency: Seconds every request (and every batch, once) takes.
+        - error_rate: Probability of a request, or a call in a batch, failing with an injected error.
+        - error_statuses: HTTP statuses of injected errors.
+        - queries_per_second: Quota; calls beyond it fail with 403 userRateLimitExceeded, like Drive. None
+          disables it.
+        - seed: Seed of the random error injection.
+        """
+        self.root_id = root_id
+        self.latency = latency
+        self.error_rate = error_rate
+        self.error_statuses = tuple(error_statuses)
+        self.queries_per_second = queries_per_second
+        self.random = random.Random(seed)
+
+        self.lock = threading.RLock()
+        self.ids = itertools.count(1)
+        self.items = {}
+        # Insertion-ordered ids, overall and per parent, so list pages are read by position
+        self.order = []
+        self.children = {}
+        self.change_log = []
+        self.sessions = {}
+        self.pending_errors = []
+        self.counters = {'requests': 0, 'uploaded_bytes': 0, 'downloaded_bytes': 0, 'injected_errors': 0, 'throttled': 0}
+        self.calls = {}
+        self.tokens = float(queries_per_second or 0)
+        self.last_refill = time.monotonic()
+
+    # googleapiclient service surface
+
+    def files(self):
+        return FakeFiles(self)
+
+    def changes(self):
+        return FakeChanges(self)
+
+    def new_batch_http_request(self, callback=None):
+        return FakeBatch(self, callback)
+
+    # Request handling
+
+    def fail_next(self, status=503, count=1, reason="backendError"):
+        """
+        Make the next count calls fail with the given status.
+        """
+        with self.lock:
+            self.pending_errors.extend([(status, reason)] * count)
+
+    def before_request(self, method_id, sleep=True, count=True):
+        """
+        Account for a call and apply latency, quota and injected errors to it.
+        """
+        if sleep and self.latency:
+            time.sleep(self.latency)
+        if not count:
+            return
+
+        with self.lock:
+            self.counters['requests'] += 1
+            self.calls[method_id] = self.calls.get(method_id, 0) + 1
+
+            if self.queries_per_second:
+                now = time.monotonic()
+                self.tokens = min(float(self.queries_per_second), self.tokens + (now - self.last_refill) * self.queries_per_second)
+                self.last_refill = now
+                if self.tokens < 1:
+                    self.counters['throttled'] += 1
+                    raise http_error(403, "userRateLimitExceeded", "User Rate Limit Exceeded")
+                self.tokens -= 1
+
+            error = None
+            if self.pending_errors:
+                error = self.pending_errors.pop(0)
+            elif self.error_rate and self.random.random() < self.error_rate:
+                error = (self.random.choice(self.error_statuses), "backendError")
+            if error:
+                self.counters['injected_errors'] += 1
+                raise http_error(*error)
+
+    def run(self, handler):
+        with self.lock:
+            return handler()
+
+    # Drive state, all called with the lock held
+
+    def get_item(self, file_id):
+        item = self.items.get(file_id)
+        if item is None:
+            raise http_error(404, "notFound", f"File not found: {file_id}")
+        return item
+
+    @staticmethod
+    def resource(item):
+        resource = {'id': item['id'], 'name': item['name'], 'mimeType': item['mimeType'],
+                    'parents': list(item['parents']), 'trashed': item['trashed']}
+        if item['data'] is not None:
+            resource['size'] = str(len(item['data']))
+            resource['md5Checksum'] = item['md5Checksum']
+        return resource
+
+    def record_change(self, item, removed=False):
+        self.change_log.append({'fileId': item['id'], 'removed': removed,
+                                'file': None if removed else self.resource(item)})
+
+    def create_item(self, body, data):
+        with self.lock:
+            is_folder = body.get('mimeType') == FOLDER_MIME_TYPE
+            item = {
+                'id': f"fake-{next(self.ids)}",
+                'name': body.get('name', 'Untitled'),
+                'mimeType': body.get('mimeType') or ('application/octet-stream' if not is_folder else FOLDER_MIME_TYPE),
+                'parents': list(body.get('parents') or [self.root_id]),
+                'trashed': False,
+                'data': None if is_folder else bytes(data or b""),
+                'md5Checksum': None if is_folder else hashlib.md5(data or b"").hexdigest(),
+            }
+            self.items[item['id']] = item
+            self.order.append(item['id'])
+            for parent_id in item['parents']:
+                self.children.setdefault(parent_id, []).append(item['id'])
+            self.record_change(item)
+            return item
+
+    def update_item(self, file_id, body, add_parents, remove_parents, data):
+        with self.lock:
+            item = self.get_item(file_id)
+            for key in ('name', 'trashed'):
+                if key in body:
+                    item[key] = body[key]
+            if remove_parents:
+                for parent_id in remove_parents.split(","):
+                    if parent_id in item['parents']:
+                        item['parents'].remove(parent_id)
+                        self.children[parent_id].remove(file_id)
+            if add_parents:
+                for parent_id in add_parents.split(","):
+                    item['parents'].append(parent_id)
+                    self.children.setdefault(parent_id, []).append(file_id)
+            if data is not None:
+                item['data'] = bytes(data)
+                item['md5Checksum'] = hashlib.md5(data).hexdigest()
+            self.record_change(item)
+            return item
+
+    def copy_item(self, file_id, body):
+        with self.lock:
+            source = self.get_item(file_id)
+            if source['mimeType'] == FOLDER_MIME_TYPE:
+                raise http_error(403, "cannotCopyFolder", "Folders cannot be copied")
+            return self.create_item({'name': body.get('name', source['name']), 'mimeType': source['mimeType'],
+                                     'parents': body.get('parents') or source['parents']}, source['data'])
+
+    def delete_item(self, file_id):
+        with self.lock:
+            pending = [self.get_item(file_id)]
+            while pending:
+                item = pending.pop()
+                del self.items[item['id']]
+                for parent_id in item['parents']:
+                    if item['id'] in self.children.get(parent_id, ()):
+                        self.children[parent_id].remove(item['id'])
+                pending.extend(self.items[child_id] for child_id in self.children.pop(item['id'], []) if child_id in self.items)
+                self.record_change(item, removed=True)
+            return ""
+
+    def matches(self, item, terms):
+        for term in terms:
+            if term == "trashed = false" and item['trashed']:
+                return False
+            if term == "trashed = true" and not item['trashed']:
+                return False
+            match = re.fullmatch(r"'([^']*)' in parents|parents in '([^']*)'", term)
+            if match and (match.group(1) or match.group(2)) not in item['parents']:
+                return False
+        return True
+
+    def list_items(self, query, page_size, page_token):
+        terms = [term.strip() for term in query.split(" and ")] if query else []
+        parent = None
+        for term in terms:
+            match = re.fullmatch(r"'([^']*)' in parents|parents in '([^']*)'", term)
+            if match:
+                parent = match.group(1) or match.group(2)
+        candidates = self.children.get(parent, []) if parent is not None else self.order
+
+        position, files = int(page_token or 0), []
+        while position < len(candidates) and len(files) < page_size:
+            item = self.items.get(candidates[position])
+            position += 1
+            if item is not None and self.matches(item, terms):
+                files.append(self.resource(item))
+
+        # Deleted ids are left in the order lists, so positions of later pages stay valid
+        response = {'files': files}
+        if position < len(candidates):
+            response['nextPageToken'] = str(position)
+        return response
+
+    def list_changes(self, page_token, page_size):
+        start = int(page_token) - 1
+        changes = self.change_log[start:start + page_size]
+        if start + page_size < len(self.change_log):
+            return {'changes': changes, 'nextPageToken': str(start + page_size + 1)}
+        return {'changes': changes, 'newStartPageToken': str(len(self.change_log) + 1)}
+
+    # Seeding and inspection, without latency, quota or errors
+
+    def add_folder(self, name, parent_id):
+        """
+        Create a folder directly, returning its id.
+        """
+        return self.create_item({'name': name, 'mimeType': FOLDER_MIME_TYPE, 'parents': [parent_id]}, None)['id']
+
+    def add_file(self, name, parent_id, data=b""):
+        """
+        Create a file directly, returning its id.
+        """
+        return self.create_item({'name': name, 'parents': [parent_id]}, data)['id']
+
+    def path_map(self):
+        """
+        Map the "/"-separated path of every non-trashed item below the root to (isDir, size), in the form
+        GSpace compares trees in.
+        """
+        with self.lock:
+            paths, pending = {}, [(self.root_id, "")]
+            while pending:
+                parent_id, parent_path = pending.pop()
+                for child_id in self.children.get(parent_id, []):
+                    item = self.items.get(child_id)
+                    if item is None or item['trashed']:
+                        continue
+                    path = parent_path + "/" + item['name']
+                    is_folder = item['mimeType'] == FOLDER_MIME_TYPE
+                    paths[path] = (is_folder, None if is_folder else len(item['data']))
+                    if is_folder:
+                        pending.append((child_id, path))
+            return paths
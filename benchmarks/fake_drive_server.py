@@ -0,0 +1,233 @@
+"""
+Local HTTP stand-in for the Drive v3 REST API, serving a FakeDriveService, so the asyncio engine
+(AsyncDriveTransport) can be benchmarked without a Drive account.
+
+It serves the requests AsyncDriveTransport sends: files list/get/create/update/delete/copy, media
+downloads with Range headers, multipart uploads and resumable upload sessions. Every request goes through
+the service's latency, quota and error injection, and changes the same in-memory Drive the threaded
+googleapiclient stand-in reads, so both engines can be pointed at one Drive:
+
+    service = FakeDriveService(latency=0.05)
+    with FakeDriveServer(service) as server:
+        transport = AsyncDriveTransport(Credentials(token="fake"), base_url=server.base_url)
+        gdrive = AsyncGoogleDriveHelper(transport)
+        gdrive.service_factory = lambda: service
+
+Needs aiohttp, like the asyncio engine itself.
+"""
+import asyncio
+import itertools
+import json
+import re
+import socket
+import threading
+
+from aiohttp import web
+from googleapiclient.errors import HttpError
+
+from fake_drive import FOLDER_MIME_TYPE, MAX_PAGE_SIZE, http_error
+
+
+class FakeDriveServer:
+    """
+    Serves a FakeDriveService over HTTP on a background thread running its own event loop.
+    """
+
+    def __init__(self, service, host="127.0.0.1", port=0):
+        """
+        Initialize FakeDriveServer.
+
+        Parameters:
+        - service: The FakeDriveService holding the Drive.
+        - host: Address to listen on.
+        - port: Port to listen on; 0 picks a free one.
+        """
+        self.service = service
+        self.host = host
+        self.port = port
+        self.session_ids = itertools.count(1)
+        # Resumable sessions: id -> (received bytes, total size, function creating the file from the contents)
+        self.sessions = {}
+        self.loop = None
+        self.runner = None
+        self.thread = None
+
+    @property
+    def base_url(self):
+        return f"http://{self.host}:{self.port}"
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def start(self):
+        """
+        Start listening, returning once the server accepts connections.
+        """
+        listening_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        listening_socket.bind((self.host, self.port))
+        self.port = listening_socket.getsockname()[1]
+
+        app = web.Application(client_max_size=1 << 30)
+        app.add_routes([
+            web.get('/drive/v3/files', self.list_files),
+            web.post('/drive/v3/files', self.create_file),
+            web.get('/drive/v3/files/{file_id}', self.get_file),
+            web.patch('/drive/v3/files/{file_id}', self.update_file),
+            web.delete('/drive/v3/files/{file_id}', self.delete_file),
+            web.post('/drive/v3/files/{file_id}/copy', self.copy_file),
+            web.post('/upload/drive/v3/files', self.upload),
+            web.patch('/upload/drive/v3/files/{file_id}', self.upload),
+            web.put('/upload/sessions/{session_id}', self.upload_chunk),
+        ])
+
+        self.loop = asyncio.new_event_loop()
+        self.runner = web.AppRunner(app)
+        self.loop.run_until_complete(self.runner.setup())
+        self.loop.run_until_complete(web.SockSite(self.runner, listening_socket).start())
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """
+        Stop the server and close its event loop.
+        """
+        asyncio.run_coroutine_threadsafe(self.runner.cleanup(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+
+    async def call(self, method_id, handler):
+        """
+        Run a handler against the service like one API call, off the event loop so latency does not hold up
+        other requests, turning the errors it raises into Drive's JSON error responses.
+        """
+        def execute():
+            self.service.before_request(method_id)
+            return self.service.run(handler)
+
+        try:
+            result = await asyncio.get_running_loop().run_in_executor(None, execute)
+        except HttpError as e:
+            return web.Response(status=e.resp.status, body=e.content, content_type='application/json')
+        if isinstance(result, web.StreamResponse):
+            return result
+        if result == "":
+            return web.Response(status=204)
+        return web.json_response(result)
+
+    # files() methods
+
+    async def list_files(self, request):
+        page_size = min(int(request.query.get('pageSize', 100)), MAX_PAGE_SIZE)
+        return await self.call("drive.files.list", lambda: self.service.list_items(
+            request.query.get('q', ''), page_size, request.query.get('pageToken')))
+
+    async def create_file(self, request):
+        body = await request.json()
+        return await self.call("drive.files.create", lambda: self.service.resource(self.service.create_item(body, None)))
+
+    async def get_file(self, request):
+        file_id = request.match_info['file_id']
+        if request.query.get('alt') == 'media':
+            return await self.call("drive.files.get_media", lambda: self.media(file_id, request.headers.get('Range', '')))
+        return await self.call("drive.files.get", lambda: self.service.resource(self.service.get_item(file_id)))
+
+    async def update_file(self, request):
+        file_id, body = request.match_info['file_id'], await request.json() if request.can_read_body else {}
+        add_parents, remove_parents = request.query.get('addParents'), request.query.get('removeParents')
+        return await self.call("drive.files.update", lambda: self.service.resource(
+            self.service.update_item(file_id, body or {}, add_parents, remove_parents, None)))
+
+    async def delete_file(self, request):
+        file_id = request.match_info['file_id']
+        return await self.call("drive.files.delete", lambda: self.service.delete_item(file_id))
+
+    async def copy_file(self, request):
+        file_id, body = request.match_info['file_id'], await request.json() if request.can_read_body else {}
+        return await self.call("drive.files.copy", lambda: self.service.resource(self.service.copy_item(file_id, body or {})))
+
+    def media(self, file_id, range_header):
+        """
+        Read a file's contents, honouring a "bytes=start-" or "bytes=start-end" Range header.
+        """
+        item = self.service.items.get(file_id)
+        if item is None or item['mimeType'] == FOLDER_MIME_TYPE:
+            raise http_error(404, "notFound", "File not found")
+        data = item['data']
+
+        match = re.match(r"bytes=(\d+)-(\d*)", range_header)
+        if not match:
+            self.service.counters['downloaded_bytes'] += len(data)
+            return web.Response(body=data, content_type='application/octet-stream')
+
+        start = int(match.group(1))
+        end = min(len(data) - 1, int(match.group(2))) if match.group(2) else len(data) - 1
+        if start >= len(data):
+            return web.Response(status=416, headers={'Content-Range': f"bytes */{len(data)}"})
+        self.service.counters['downloaded_bytes'] += end + 1 - start
+        return web.Response(status=206, body=data[start:end + 1], content_type='application/octet-stream',
+                            headers={'Content-Range': f"bytes {start}-{end}/{len(data)}"})
+
+    # Uploads
+
+    async def upload(self, request):
+        """
+        Start a resumable session, or create or update a file from a multipart request.
+        """
+        file_id = request.match_info.get('file_id')
+        method_id = "drive.files.update" if file_id else "drive.files.create"
+
+        if request.query.get('uploadType') == 'resumable':
+            body = await request.json() if request.can_read_body else {}
+            total = int(request.headers['X-Upload-Content-Length'])
+
+            def start_session():
+                session_id = str(next(self.session_ids))
+                self.sessions[session_id] = (bytearray(), total, method_id, self.finish_upload(file_id, body or {}))
+                return web.Response(headers={'Location': f"{self.base_url}/upload/sessions/{session_id}"})
+            return await self.call(method_id, start_session)
+
+        reader = await request.multipart()
+        body = json.loads(await (await reader.next()).text() or "{}")
+        data = bytes(await (await reader.next()).read())
+
+        def finish():
+            self.service.counters['uploaded_bytes'] += len(data)
+            return self.finish_upload(file_id, body)(data)
+        return await self.call(method_id, finish)
+
+    def finish_upload(self, file_id, body):
+        """
+        Get the function storing uploaded contents, creating the file or replacing the contents of file_id.
+        """
+        if file_id:
+            return lambda data: self.service.resource(self.service.update_item(file_id, body, None, None, data))
+        return lambda data: self.service.resource(self.service.create_item(body, data))
+
+    async def upload_chunk(self, request):
+        """
+        Append a chunk to a resumable session, or report how much it holds for "bytes */total".
+        """
+        session = self.sessions.get(request.match_info['session_id'])
+        if session is None:
+            error = http_error(404, "notFound", "Upload session expired")
+            return web.Response(status=404, body=error.content, content_type='application/json')
+        received, total, method_id, finish = session
+        chunk = await request.read()
+        match = re.match(r"bytes (\d+)-\d+/\d+", request.headers.get('Content-Range', ''))
+
+        def store():
+            # A chunk starting past what was received would leave a gap, so only contiguous data is kept
+            if match and int(match.group(1)) == len(received):
+                received.extend(chunk)
+            if len(received) < total:
+                headers = {'Range': f"bytes=0-{len(received) - 1}"} if received else {}
+                return web.Response(status=308, headers=headers)
+            self.sessions.pop(request.match_info['session_id'], None)
+            self.service.counters['uploaded_bytes'] += total
+            return finish(bytes(received))
+        return await self.call(method_id, store)